@@ -5,6 +5,7 @@ This module orchestrates the UI components and coordinates between modules
 to provide an interactive interface for analyzing student performance data.
 """
 
+import uuid
 import streamlit as st
 import pandas as pd
 from io import StringIO
@@ -12,11 +13,20 @@ from pathlib import Path
 
 from file_manager import (
     validate_csv_structure, parse_csv_file, get_file_info,
-    validate_csv_not_empty, handle_encoding_error, FileEncodingError
+    validate_csv_not_empty, handle_encoding_error, FileEncodingError,
+    spooled_upload, sniff_csv_plan, compute_fingerprint,
+    HABITS_REQUIRED_COLUMNS, HABITS_EXPECTED_TYPES,
+    FACTORS_REQUIRED_COLUMNS, FACTORS_EXPECTED_TYPES
 )
+from bitmap_index import BITMAP_AGGREGATE, BitmapIndex
 from database_manager import DatabaseManager, handle_duplicates
+from dataset_cache import DatasetCache
+from shared_store import SharedDataStore
+from subset_cache import SubsetCache
 from filter_engine import FilterEngine
 from kpi_calculator import KPICalculator
+from kpi_planner import KPIPlanner
+from olap_cube import CUBE_AGGREGATE, OLAPCube
 from visualization_engine import VisualizationEngine
 
 # Configure Streamlit page
@@ -41,9 +51,36 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_shared_store() -> SharedDataStore:
+    """Get the process-wide data store shared by all sessions."""
+    store = SharedDataStore(":memory:", dataset_cache=DatasetCache())
+    # Built once per uploaded habits dataset and shared by the sessions binding it
+    store.register_aggregate("student_habits_performance", CUBE_AGGREGATE,
+                             OLAPCube.collect, OLAPCube.merge)
+    store.register_aggregate("student_habits_performance", BITMAP_AGGREGATE,
+                             BitmapIndex.collect, BitmapIndex.merge)
+    return store
+
+
 # Initialize session state
-if "db_manager" not in st.session_state:
-    st.session_state.db_manager = DatabaseManager(":memory:")
+if "session_id" not in st.session_state or not get_shared_store().touch(st.session_state.session_id):
+    # A new session, or one closed after idling: start over on a fresh schema
+    for key in ("db_manager", "subset_cache", "kpi_planner", "bitmap_index", "olap_cube", "data_loaded"):
+        st.session_state.pop(key, None)
+    st.session_state.session_id = uuid.uuid4().hex
+    st.session_state.db_manager = get_shared_store().create_session(st.session_state.session_id)
+
+# Free the schemas of sessions whose users left, and the datasets only they used
+get_shared_store().close_idle_sessions()
+
+if "subset_cache" not in st.session_state:
+    # Filtered rows shared by the KPIs, kept across reruns while filters are unchanged
+    st.session_state.subset_cache = SubsetCache(st.session_state.db_manager)
+
+if "kpi_planner" not in st.session_state:
+    # Catalog of the KPI source tables, read again only when their data changes
+    st.session_state.kpi_planner = KPIPlanner(st.session_state.db_manager)
 
 if "filters" not in st.session_state:
     st.session_state.filters = {}
@@ -51,6 +88,9 @@ if "filters" not in st.session_state:
 if "data_loaded" not in st.session_state:
     st.session_state.data_loaded = False
 
+if "upload_fingerprints" not in st.session_state:
+    st.session_state.upload_fingerprints = {}
+
 
 def render_header():
     """Display application title and description."""
@@ -93,38 +133,12 @@ def render_upload_section():
     if habits_file or factors_file:
         try:
             if habits_file:
-                # Read and parse habits file
-                file_content = habits_file.read().decode("utf-8")
-                df_habits = parse_csv_file(file_content)
-                
-                # Validate structure
-                is_valid, error_msg = validate_csv_not_empty(df_habits)
-                if not is_valid:
-                    st.error(f"❌ Habits file error: {error_msg}")
-                else:
-                    # Remove duplicates
-                    df_habits = handle_duplicates(df_habits, keep="first")
-                    
-                    # Import to database
-                    st.session_state.db_manager.import_data(df_habits, "student_habits_performance")
-                    st.success(f"✅ Habits file imported: {len(df_habits)} rows")
+                _import_upload(habits_file, "student_habits_performance", "Habits",
+                               HABITS_REQUIRED_COLUMNS, HABITS_EXPECTED_TYPES)
             
             if factors_file:
-                # Read and parse factors file
-                file_content = factors_file.read().decode("utf-8")
-                df_factors = parse_csv_file(file_content)
-                
-                # Validate structure
-                is_valid, error_msg = validate_csv_not_empty(df_factors)
-                if not is_valid:
-                    st.error(f"❌ Factors file error: {error_msg}")
-                else:
-                    # Remove duplicates
-                    df_factors = handle_duplicates(df_factors, keep="first")
-                    
-                    # Import to database
-                    st.session_state.db_manager.import_data(df_factors, "student_performance_factors")
-                    st.success(f"✅ Factors file imported: {len(df_factors)} rows")
+                _import_upload(factors_file, "student_performance_factors", "Factors",
+                               FACTORS_REQUIRED_COLUMNS, FACTORS_EXPECTED_TYPES)
             
             st.session_state.data_loaded = True
         
@@ -134,6 +148,119 @@ def render_upload_section():
             st.error(f"❌ Error processing files: {str(e)}")
 
 
+def _import_upload(uploaded_file, table_name: str, label: str,
+                   required_columns: list, expected_types: dict) -> None:
+    """
+    Validate an uploaded CSV file and stream it into a DuckDB table.
+    
+    Args:
+        uploaded_file: Streamlit UploadedFile
+        table_name: Destination table name
+        label: Human-readable name of the file for messages
+        required_columns: Columns the file must contain
+        expected_types: Expected types of columns, checked on a sample
+    """
+    db_manager = st.session_state.db_manager
+    fingerprint = _get_upload_fingerprint(uploaded_file)
+    
+    # Streamlit reruns the script on every interaction; skip unchanged uploads
+    if db_manager.get_table_fingerprint(table_name) == fingerprint:
+        row_count = db_manager.get_table_info(table_name)["row_count"]
+        st.success(f"✅ {label} file imported: {row_count} rows")
+        return
+    
+    shared_store = get_shared_store()
+    
+    # Files already ingested (by any session) are shared, not imported again
+    if shared_store.get_dataset(fingerprint) is None:
+        try:
+            # Spool to disk and let DuckDB parse, deduplicate and import in one pass
+            with spooled_upload(uploaded_file) as csv_path:
+                # Validate from the header and a row sample before the full import
+                is_valid, error_msg, plan = sniff_csv_plan(csv_path, required_columns, expected_types)
+                if not is_valid:
+                    st.error(f"❌ {label} file error: {error_msg}")
+                    return
+                
+                shared_store.import_dataset(csv_path, fingerprint, plan=plan)
+        except ValueError as e:
+            st.error(f"❌ {label} file error: {str(e)}")
+            return
+    
+    # Shared or cached datasets skip the sniff, but not the checks of this table
+    try:
+        shared_store.bind(db_manager, table_name, fingerprint, required_columns, expected_types)
+    except ValueError as e:
+        st.error(f"❌ {label} file error: {str(e)}")
+        return
+    row_count = db_manager.get_table_info(table_name)["row_count"]
+    st.success(f"✅ {label} file imported: {row_count} rows")
+
+
+def _get_upload_fingerprint(uploaded_file) -> str:
+    """
+    Get the content fingerprint of an upload, hashing each upload only once.
+    
+    Args:
+        uploaded_file: Streamlit UploadedFile
+    
+    Returns:
+        Hex-encoded content hash
+    """
+    file_id = getattr(uploaded_file, "file_id", None)
+    fingerprints = st.session_state.upload_fingerprints
+    
+    if file_id is None or file_id not in fingerprints:
+        fingerprint = compute_fingerprint(uploaded_file)
+        if file_id is None:
+            return fingerprint
+        fingerprints[file_id] = fingerprint
+    
+    return fingerprints[file_id]
+
+
+# Session state keys of the filter widgets, by filtered column
+FILTER_WIDGET_KEYS = {
+    "gender": "filter_gender",
+    "age": "filter_age",
+    "parental_education_level": "filter_education"
+}
+
+# Most marks drawn in a scatter KPI; more students are binned
+MAX_SCATTER_POINTS = 2000
+
+# KPI charts in page order: KPI, label in error messages, title, chart function
+KPI_CHARTS = [
+    ("kpi_1", "KPI 1", "KPI 1: Score Moyen par Groupe", VisualizationEngine.create_kpi_1_chart),
+    ("kpi_2", "KPI 2", "KPI 2: Corrélation des heures d’étude", VisualizationEngine.create_kpi_2_chart),
+    ("kpi_3", "KPI 3", "KPI 3: Impact de l’assiduité", VisualizationEngine.create_kpi_3_chart),
+    ("kpi_4", "KPI 4", "KPI 4: Performance liée au sommeil", VisualizationEngine.create_kpi_4_chart),
+    ("kpi_5", "KPI 5", "KPI 5: Distribution des scores", VisualizationEngine.create_kpi_5_chart)
+]
+
+
+def _get_selected_filters() -> dict:
+    """Get the filters as set in the widgets, which Streamlit updates before each rerun."""
+    filters = dict(st.session_state.filters)
+    for column, key in FILTER_WIDGET_KEYS.items():
+        if key in st.session_state:
+            value = st.session_state[key]
+            if value == "All":
+                filters.pop(column, None)
+            else:
+                filters[column] = value
+    return filters
+
+
+def _format_option_count(counts: dict):
+    """Build a selectbox format function appending each option's matching row count."""
+    def format_option(option):
+        if option == "All" or option not in counts:
+            return str(option)
+        return f"{option} ({counts[option]})"
+    return format_option
+
+
 def render_filter_section():
     """Display dynamic filter controls."""
     if not st.session_state.data_loaded:
@@ -145,28 +272,66 @@ def render_filter_section():
     
     col1, col2, col3 = st.columns(3)
     
+    # Options come from the facets collected at import, so no table is scanned
+    filter_engine = FilterEngine(st.session_state.db_manager)
+    habits_loaded = st.session_state.db_manager.table_exists("student_habits_performance")
+    
+    # Rows each option would leave given the other filters, from one query
+    option_counts = {}
+    try:
+        if habits_loaded:
+            option_counts = filter_engine.get_facet_counts(
+                "student_habits_performance", list(FILTER_WIDGET_KEYS), _get_selected_filters()
+            )
+    except:
+        pass
+    
     with col1:
         gender_options = ["All"]
         try:
-            filter_engine = FilterEngine(st.session_state.db_manager)
-            if st.session_state.db_manager.table_exists("student_habits_performance"):
+            if habits_loaded:
                 gender_options.extend(filter_engine.get_filter_options("student_habits_performance", "gender"))
         except:
             pass
         
-        selected_gender = st.selectbox("Gender", gender_options)
+        selected_gender = st.selectbox(
+            "Gender", gender_options, key=FILTER_WIDGET_KEYS["gender"],
+            format_func=_format_option_count(option_counts.get("gender", {}))
+        )
         if selected_gender != "All":
             st.session_state.filters["gender"] = selected_gender
         elif "gender" in st.session_state.filters:
             del st.session_state.filters["gender"]
     
     with col2:
-        age_range = st.slider("Age Range", 17, 24, (17, 24))
-        st.session_state.filters["age"] = age_range
+        min_age, max_age = 17, 24
+        try:
+            if habits_loaded:
+                min_age, max_age = (int(v) for v in filter_engine.get_column_range("student_habits_performance", "age"))
+        except:
+            pass
+        
+        if min_age < max_age:
+            age_range = st.slider("Age Range", min_age, max_age, (min_age, max_age),
+                                  key=FILTER_WIDGET_KEYS["age"])
+            st.session_state.filters["age"] = age_range
+        elif "age" in st.session_state.filters:
+            del st.session_state.filters["age"]
     
     with col3:
         education_options = ["All", "High School", "Bachelor", "Master", "Postgraduate", "None"]
-        selected_education = st.selectbox("Parental Education", education_options)
+        try:
+            if habits_loaded:
+                education_options = ["All"] + filter_engine.get_filter_options(
+                    "student_habits_performance", "parental_education_level"
+                )
+        except:
+            pass
+        
+        selected_education = st.selectbox(
+            "Parental Education", education_options, key=FILTER_WIDGET_KEYS["parental_education_level"],
+            format_func=_format_option_count(option_counts.get("parental_education_level", {}))
+        )
         if selected_education != "All":
             st.session_state.filters["parental_education_level"] = selected_education
         elif "parental_education_level" in st.session_state.filters:
@@ -174,11 +339,72 @@ def render_filter_section():
     
     if st.button("Clear Filters"):
         st.session_state.filters = {}
+        for key in FILTER_WIDGET_KEYS.values():
+            st.session_state.pop(key, None)
         st.rerun()
 
 
+def _get_bitmap_index():
+    """Get the session's bitmap index over the habits table, rebuilt after the table changes."""
+    db_manager = st.session_state.db_manager
+    # An index the manager maintains across appends needs no rebuild
+    index = db_manager.get_aggregate("student_habits_performance", BITMAP_AGGREGATE)
+    if index is not None:
+        return index
+    
+    index = st.session_state.get("bitmap_index")
+    if index is not None and index.is_current(db_manager):
+        return index
+    
+    index = None
+    if db_manager.table_exists("student_habits_performance"):
+        try:
+            index = BitmapIndex.from_table(db_manager, "student_habits_performance")
+        except (ValueError, RuntimeError):
+            pass
+    st.session_state.bitmap_index = index
+    return index
+
+
+def _get_olap_cube():
+    """Get the session's OLAP cube over the habits table, rebuilt after the table changes."""
+    db_manager = st.session_state.db_manager
+    # A cube the manager maintains across appends needs no rebuild
+    cube = db_manager.get_aggregate("student_habits_performance", CUBE_AGGREGATE)
+    if cube is not None:
+        return cube
+    
+    cube = st.session_state.get("olap_cube")
+    if cube is not None and cube.is_current(db_manager):
+        return cube
+    
+    cube = None
+    if db_manager.table_exists("student_habits_performance"):
+        try:
+            cube = OLAPCube.from_table(db_manager, "student_habits_performance")
+        except (ValueError, RuntimeError):
+            pass
+    st.session_state.olap_cube = cube
+    return cube
+
+
+def _render_kpi_charts(placeholders: dict, kpi_results: dict, refinement: int) -> None:
+    """Draw the KPI results in their placeholders, replacing earlier results."""
+    for kpi, label, _, create_chart in KPI_CHARTS:
+        with placeholders[kpi].container():
+            try:
+                data = kpi_results[kpi]
+                if not data.empty:
+                    st.plotly_chart(create_chart(data), use_container_width=True,
+                                    key=f"{kpi}_chart_{refinement}")
+                else:
+                    st.info("No data available for this KPI")
+            except Exception as e:
+                st.error(f"Error calculating {label}: {str(e)}")
+
+
 def render_kpi_section():
-    """Display all four KPI visualizations."""
+    """Display all five KPI visualizations."""
     if not st.session_state.data_loaded:
         st.info("📌 Upload data files first to view KPIs")
         return
@@ -186,59 +412,33 @@ def render_kpi_section():
     st.header("📈 Indicateurs de Performance Clés")
     
     try:
-        kpi_calc = KPICalculator(st.session_state.db_manager, st.session_state.filters)
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.subheader("KPI 1: Score Moyen par Groupe")
-            try:
-                data_kpi1 = kpi_calc.calculate_kpi_1_scores_by_group()
-                if not data_kpi1.empty:
-                    fig1 = VisualizationEngine.create_kpi_1_chart(data_kpi1)
-                    st.plotly_chart(fig1, use_container_width=True)
-                else:
-                    st.info("No data available for this KPI")
-            except Exception as e:
-                st.error(f"Error calculating KPI 1: {str(e)}")
-        
-        with col2:
-            st.subheader("KPI 2: Corrélation des heures d’étude")
-            try:
-                data_kpi2 = kpi_calc.calculate_kpi_2_study_correlation()
-                if not data_kpi2.empty:
-                    fig2 = VisualizationEngine.create_kpi_2_chart(data_kpi2)
-                    st.plotly_chart(fig2, use_container_width=True)
-                else:
-                    st.info("No data available for this KPI")
-            except Exception as e:
-                st.error(f"Error calculating KPI 2: {str(e)}")
+        planner = st.session_state.kpi_planner
+        union_sources = False
+        if len(planner.get_catalog()) > 1:
+            union_sources = st.checkbox(
+                "Combine both datasets", key="kpi_union_sources",
+                help="Compute each KPI over every uploaded dataset that has its columns"
+            )
         
-        col3, col4 = st.columns(2)
+        kpi_calc = KPICalculator(st.session_state.db_manager, st.session_state.filters,
+                                 bitmap_index=_get_bitmap_index(),
+                                 subset_cache=st.session_state.subset_cache,
+                                 olap_cube=_get_olap_cube(),
+                                 max_points=MAX_SCATTER_POINTS,
+                                 planner=planner,
+                                 union_sources=union_sources)
         
-        with col3:
-            st.subheader("KPI 3: Impact de l’assiduité")
-            try:
-                data_kpi3 = kpi_calc.calculate_kpi_3_attendance_impact()
-                if not data_kpi3.empty:
-                    fig3 = VisualizationEngine.create_kpi_3_chart(data_kpi3)
-                    st.plotly_chart(fig3, use_container_width=True)
-                else:
-                    st.info("No data available for this KPI")
-            except Exception as e:
-                st.error(f"Error calculating KPI 3: {str(e)}")
+        placeholders = {}
+        for row in (KPI_CHARTS[:2], KPI_CHARTS[2:4], KPI_CHARTS[4:]):
+            for column, (kpi, _, title, _) in zip(st.columns(2), row):
+                with column:
+                    st.subheader(title)
+                    placeholders[kpi] = st.empty()
         
-        with col4:
-            st.subheader("KPI 4: Performance liée au sommeil")
-            try:
-                data_kpi4 = kpi_calc.calculate_kpi_4_sleep_performance()
-                if not data_kpi4.empty:
-                    fig4 = VisualizationEngine.create_kpi_4_chart(data_kpi4)
-                    st.plotly_chart(fig4, use_container_width=True)
-                else:
-                    st.info("No data available for this KPI")
-            except Exception as e:
-                st.error(f"Error calculating KPI 4: {str(e)}")
+        # On large tables an estimate from a sample shows first, and is
+        # replaced by the exact results computed in the background meanwhile
+        for refinement, kpi_results in enumerate(kpi_calc.calculate_progressive()):
+            _render_kpi_charts(placeholders, kpi_results, refinement)
     
     except Exception as e:
         st.error(f"Error rendering KPIs: {str(e)}")
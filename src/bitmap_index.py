@@ -0,0 +1,476 @@
+"""
+Bitmap Index module for evaluating filters without SQL.
+
+This module loads the low-cardinality columns of a table into packed bitmaps,
+one bit per row. Equality-encoded columns keep one bitmap per value; ordered
+columns such as age are range-encoded, keeping for each value the rows less
+than or equal to it, so any range is the difference of two bitmaps. A filter
+combination resolves to a row selection through bitwise AND, and measures
+are aggregated over the selected rows with NumPy.
+
+An index can be maintained by a DatabaseManager like any aggregate: register
+collect and merge with DatabaseManager.register_aggregate under
+BITMAP_AGGREGATE, so an index over a shared dataset is built once and appends
+only load the appended rows.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from database_manager import DatabaseManager
+from facet_catalog import collect_facets
+
+
+# Name of the index among a table's aggregates (see DatabaseManager.register_aggregate)
+BITMAP_AGGREGATE = "bitmap_index"
+
+
+class BitmapIndex:
+    """Packed bitmaps over the low-cardinality columns of one table."""
+
+    def __init__(self, table_name: str, version: Optional[int], row_count: int,
+                 codes: Dict[str, np.ndarray], labels: Dict[str, List[Any]],
+                 range_columns: List[str], measures: Dict[str, np.ndarray],
+                 columns: List[str]):
+        """
+        Initialize a bitmap index from already loaded columns (see from_table).
+
+        Args:
+            table_name: Name of the indexed table
+            version: Table version the columns were loaded at, or None for
+                     an index maintained by the table's DatabaseManager
+            row_count: Number of rows
+            codes: Per indexed column, the position of each row's value in
+                   labels, or -1 for NULL
+            labels: Per indexed column, its distinct values (sorted for
+                    range-encoded columns)
+            range_columns: Indexed columns to range-encode
+            measures: Numeric columns as float64 arrays, NaN for NULL
+            columns: All columns of the table
+        """
+        self.table_name = table_name
+        self.version = version
+        self.row_count = row_count
+        self.range_columns = list(range_columns)
+        self._codes = codes
+        self._labels = labels
+        self._measures = measures
+        self._columns = {col.lower(): col for col in columns}
+        self._bitmaps: Dict[str, List[np.ndarray]] = {}
+
+        for col, col_codes in codes.items():
+            bitmaps = [np.packbits(col_codes == code) for code in range(len(labels[col]))]
+            if col in self.range_columns:
+                # Bitmap i holds the rows whose value is at most labels[i]
+                for i in range(1, len(bitmaps)):
+                    bitmaps[i] = bitmaps[i] | bitmaps[i - 1]
+            self._bitmaps[col] = bitmaps
+
+        # All rows, with the padding bits of the last byte cleared
+        self._all_rows = np.packbits(np.ones(row_count, dtype=bool))
+
+    @classmethod
+    def from_table(cls, db_manager: DatabaseManager, table_name: str,
+                   measure_columns: Optional[List[str]] = None) -> "BitmapIndex":
+        """
+        Build a bitmap index over a table.
+
+        Columns whose values are counted in the table's facets are indexed;
+        numeric ones among them are range-encoded. Everything is loaded in one
+        query.
+
+        Args:
+            db_manager: DatabaseManager holding the table
+            table_name: Name of the table
+            measure_columns: Numeric columns to load for aggregation; defaults
+                             to every numeric column in the facets
+
+        Returns:
+            BitmapIndex over the table's current version
+
+        Raises:
+            ValueError: If the table has no facets (see DatabaseManager.get_facets)
+            RuntimeError: If loading the table fails
+        """
+        facets = db_manager.get_facets(table_name)
+        if facets is None:
+            raise ValueError(f"Table '{table_name}' has no facets to build a bitmap index from")
+
+        version = db_manager.get_table_version(table_name)
+        columns = [column["name"] for column in db_manager.get_table_info(table_name)["columns"]]
+        fetch = lambda query, params: db_manager.execute_query(
+            query, result_format="numpy", use_cache=False, params=params
+        )
+        return cls._load(table_name, version, facets, {col: f'"{col}"' for col in columns},
+                         table_name, fetch, measure_columns)
+
+    @classmethod
+    def collect(cls, connection: duckdb.DuckDBPyConnection, table_name: str, source: str,
+                column_types: Dict[str, str],
+                measure_columns: Optional[List[str]] = None) -> "BitmapIndex":
+        """
+        Index rows of a table for an index maintained by its DatabaseManager.
+
+        Matches the collect function of DatabaseManager.register_aggregate.
+        The columns to index are taken from the facets of the rows.
+
+        Args:
+            connection: DuckDB connection or cursor
+            table_name: Name of the table the rows belong to
+            source: Table name or SELECT statement producing the rows
+            column_types: Types of the table's columns; source columns are
+                          cast to them, and columns the source lacks are NULL
+            measure_columns: See from_table
+
+        Returns:
+            BitmapIndex without a version (see is_current)
+        """
+        if not source.lstrip().upper().startswith(("SELECT", "WITH")):
+            source = f"SELECT * FROM {source}"
+        source_columns = {row[0] for row in connection.execute(f"DESCRIBE {source}").fetchall()}
+
+        column_sql = {}
+        for col, col_type in column_types.items():
+            value = f'"{col}"' if col in source_columns else "NULL"
+            column_sql[col] = f"CAST({value} AS {col_type})"
+
+        facets = collect_facets(connection, source, column_types)
+        fetch = lambda query, params: connection.execute(query, params).fetchnumpy()
+        return cls._load(table_name, None, facets, column_sql, f"({source})", fetch, measure_columns)
+
+    @classmethod
+    def _load(cls, table_name: str, version: Optional[int], facets: dict,
+              column_sql: Dict[str, str], source: str,
+              fetch: Callable[[str, List[Any]], Dict[str, np.ndarray]],
+              measure_columns: Optional[List[str]]) -> "BitmapIndex":
+        """Load the columns the facets describe in one query and index them."""
+        facet_columns = facets["columns"]
+        indexed = [col for col, facet in facet_columns.items() if "values" in facet]
+        range_columns = [col for col in indexed if "min" in facet_columns[col]]
+        if measure_columns is None:
+            measure_columns = [col for col, facet in facet_columns.items() if "min" in facet]
+
+        labels = {col: sorted(facet_columns[col]["values"]) for col in indexed}
+
+        # Codes of unordered columns are computed in SQL: the position of the
+        # value among the labels
+        selects = []
+        params = []
+        for col in indexed:
+            if col in range_columns:
+                selects.append(f'{column_sql[col]} AS "{col}"')
+            else:
+                positions = " ".join(f"WHEN ? THEN {i}" for i in range(len(labels[col])))
+                selects.append(f'CASE {column_sql[col]} {positions} ELSE -1 END AS "{col}"')
+                params.extend(labels[col])
+        selects += [
+            f'CAST({column_sql[col]} AS DOUBLE) AS "__measure_{i}"'
+            for i, col in enumerate(measure_columns)
+        ]
+
+        result = fetch(f"SELECT {', '.join(selects)} FROM {source}", params)
+        row_count = len(next(iter(result.values()))) if result else 0
+
+        codes = {}
+        for col in indexed:
+            values = result[col]
+            if col in range_columns:
+                null = np.ma.getmaskarray(values)
+                filled = np.ma.filled(values.astype(np.float64), np.nan)
+                positions = np.searchsorted(labels[col], np.nan_to_num(filled))
+                codes[col] = np.where(null, -1, positions).astype(np.int16)
+            else:
+                codes[col] = np.asarray(values, dtype=np.int16)
+
+        measures = {
+            col: np.ma.filled(result[f"__measure_{i}"].astype(np.float64), np.nan)
+            for i, col in enumerate(measure_columns)
+        }
+
+        return cls(table_name, version, row_count, codes, labels, range_columns, measures,
+                   list(column_sql))
+
+    def merge(self, other: "BitmapIndex") -> Optional["BitmapIndex"]:
+        """
+        Combine with the index of other rows of the same table, appended after these.
+
+        Matches the merge function of DatabaseManager.register_aggregate.
+
+        Args:
+            other: Index over the appended rows
+
+        Returns:
+            Index over both sets of rows without a version, or None if the
+            indexes cover different columns or values can't be ordered together
+        """
+        if (other.table_name, set(other._codes), set(other._measures), set(other.range_columns)) != \
+                (self.table_name, set(self._codes), set(self._measures), set(self.range_columns)):
+            return None
+
+        codes, labels = {}, {}
+        for col in self._codes:
+            try:
+                labels[col] = sorted(set(self._labels[col]) | set(other._labels[col]))
+            except TypeError:
+                return None
+            positions = {value: i for i, value in enumerate(labels[col])}
+            parts = []
+            for part in (self, other):
+                # Map the part's codes onto the merged labels, keeping -1 for NULL
+                mapping = np.array([positions[value] for value in part._labels[col]] + [-1], dtype=np.int16)
+                parts.append(mapping[part._codes[col]])
+            codes[col] = np.concatenate(parts)
+
+        measures = {
+            col: np.concatenate([self._measures[col], other._measures[col]]) for col in self._measures
+        }
+        return BitmapIndex(self.table_name, None, self.row_count + other.row_count, codes, labels,
+                           self.range_columns, measures, list(self._columns.values()))
+
+    def is_current(self, db_manager: DatabaseManager) -> bool:
+        """
+        Check whether the indexed table is unchanged since the index was built.
+
+        An index without a version is current while it is the one db_manager
+        maintains for the table.
+        """
+        if self.version is None:
+            return db_manager.get_aggregate(self.table_name, BITMAP_AGGREGATE) is self
+        return db_manager.get_table_version(self.table_name) == self.version
+
+    def select(self, filters: Dict[str, Any]) -> np.ndarray:
+        """
+        Resolve filters to a packed bitmap of the matching rows.
+
+        Filters follow FilterEngine.build_filter_query: a list selects any of
+        its values, a 2-tuple an inclusive range and a scalar one value.
+        Filters on columns the table lacks are ignored, like
+        FilterEngine.compile_filters does.
+
+        Args:
+            filters: Filter specifications
+
+        Returns:
+            Bitmap packed with numpy.packbits, one bit per row
+
+        Raises:
+            ValueError: If a filter is on a column that exists but isn't indexed
+        """
+        selection = self._all_rows.copy()
+
+        for key, value in (filters or {}).items():
+            if value is None:
+                continue
+
+            column = self._columns.get(key.lower())
+            if column is None:
+                continue
+            if column not in self._bitmaps:
+                raise ValueError(f"Column '{column}' is not indexed")
+
+            if isinstance(value, list) and len(value) > 0:
+                bitmap = np.zeros_like(selection)
+                for item in value:
+                    bitmap |= self._equal(column, item)
+            elif isinstance(value, tuple) and len(value) == 2:
+                bitmap = self._between(column, value[0], value[1])
+            else:
+                bitmap = self._equal(column, value)
+
+            selection &= bitmap
+
+        return selection
+
+    def mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """
+        Resolve filters to a boolean array over the rows.
+
+        Args:
+            filters: Filter specifications (see select)
+
+        Returns:
+            Boolean NumPy array, True for matching rows
+        """
+        return np.unpackbits(self.select(filters), count=self.row_count).view(bool)
+
+    def count(self, filters: Dict[str, Any]) -> int:
+        """
+        Count the rows matching filters.
+
+        Args:
+            filters: Filter specifications (see select)
+
+        Returns:
+            Number of matching rows
+        """
+        return int(np.unpackbits(self.select(filters)).sum())
+
+    def get_measure(self, column: str) -> np.ndarray:
+        """
+        Get a loaded numeric column.
+
+        Args:
+            column: Column name
+
+        Returns:
+            float64 array over all rows, NaN for NULL
+
+        Raises:
+            KeyError: If the column was not loaded
+        """
+        return self._measures[column]
+
+    def get_codes(self, column: str) -> Tuple[np.ndarray, List[Any]]:
+        """
+        Get the dictionary encoding of an indexed column.
+
+        Args:
+            column: Column name
+
+        Returns:
+            Tuple of (codes, labels); codes index labels, -1 for NULL
+
+        Raises:
+            KeyError: If the column is not indexed
+        """
+        return self._codes[column], self._labels[column]
+
+    def group_mean(self, filters: Dict[str, Any], group_column: str,
+                   value_column: str) -> pd.DataFrame:
+        """
+        Average a measure per value of an indexed column over the matching rows.
+
+        Matches GROUP BY in SQL: NULL groups are kept, counts include rows
+        whose measure is NULL, and means skip them.
+
+        Args:
+            filters: Filter specifications (see select)
+            group_column: Indexed column to group by
+            value_column: Loaded numeric column to average
+
+        Returns:
+            DataFrame with columns group, mean, count, one row per non-empty group
+        """
+        codes, labels = self.get_codes(group_column)
+        values = self.get_measure(value_column)
+        selected = self.mask(filters)
+
+        # Shift codes so the NULL group (-1) lands in bin 0
+        bins = codes[selected].astype(np.int64) + 1
+        selected_values = values[selected]
+        valid = ~np.isnan(selected_values)
+        size = len(labels) + 1
+
+        counts = np.bincount(bins, minlength=size)
+        valid_counts = np.bincount(bins[valid], minlength=size)
+        sums = np.bincount(bins[valid], weights=selected_values[valid], minlength=size)
+
+        present = np.flatnonzero(counts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(valid_counts > 0, sums / np.maximum(valid_counts, 1), np.nan)
+
+        return pd.DataFrame({
+            "group": [None if i == 0 else labels[i - 1] for i in present],
+            "mean": means[present],
+            "count": counts[present]
+        })
+
+    def bucket_mean(self, filters: Dict[str, Any], bucket_column: str, value_column: str,
+                    width: float) -> pd.DataFrame:
+        """
+        Average a measure per bucket of another over the matching rows.
+
+        Buckets are ROUND(x / width) * width, rounding halves away from zero
+        like SQL, over rows where both columns are non-null.
+
+        Args:
+            filters: Filter specifications (see select)
+            bucket_column: Loaded numeric column to bucket
+            value_column: Loaded numeric column to average
+            width: Bucket width
+
+        Returns:
+            DataFrame with columns bucket, mean, count, ordered by bucket
+        """
+        x, y = self._select_pairs(filters, bucket_column, value_column)
+        scaled = x / width
+        buckets = np.sign(scaled) * np.floor(np.abs(scaled) + 0.5) * width
+
+        unique_buckets, inverse = np.unique(buckets, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(unique_buckets))
+        sums = np.bincount(inverse, weights=y, minlength=len(unique_buckets))
+
+        return pd.DataFrame({
+            "bucket": unique_buckets,
+            "mean": sums / np.maximum(counts, 1),
+            "count": counts
+        })
+
+    def select_pairs(self, filters: Dict[str, Any], x_column: str,
+                     y_column: str) -> pd.DataFrame:
+        """
+        Get the matching rows of two measures, ordered by the first.
+
+        Rows where either measure is NULL are skipped.
+
+        Args:
+            filters: Filter specifications (see select)
+            x_column: Loaded numeric column to order by
+            y_column: Second loaded numeric column
+
+        Returns:
+            DataFrame with columns x and y
+        """
+        x, y = self._select_pairs(filters, x_column, y_column)
+        order = np.argsort(x, kind="stable")
+        return pd.DataFrame({"x": x[order], "y": y[order]})
+
+    def _select_pairs(self, filters: Dict[str, Any], x_column: str,
+                      y_column: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the matching values of two measures where both are non-null."""
+        x, y = self.get_measure(x_column), self.get_measure(y_column)
+        selected = self.mask(filters) & ~np.isnan(x) & ~np.isnan(y)
+        return x[selected], y[selected]
+
+    def _equal(self, column: str, value: Any) -> np.ndarray:
+        """Get the bitmap of rows where a column equals a value."""
+        labels = self._labels[column]
+        bitmaps = self._bitmaps[column]
+
+        if column in self.range_columns:
+            position = int(np.searchsorted(labels, value))
+            if position == len(labels) or labels[position] != value:
+                return np.zeros_like(self._all_rows)
+            if position == 0:
+                return bitmaps[0].copy()
+            return bitmaps[position] & ~bitmaps[position - 1]
+
+        if value not in labels:
+            return np.zeros_like(self._all_rows)
+        return bitmaps[labels.index(value)]
+
+    def _between(self, column: str, low: Any, high: Any) -> np.ndarray:
+        """Get the bitmap of rows where a column lies in an inclusive range."""
+        if column not in self.range_columns:
+            # Unordered column: OR the values in range
+            bitmap = np.zeros_like(self._all_rows)
+            for label, label_bitmap in zip(self._labels[column], self._bitmaps[column]):
+                if low <= label <= high:
+                    bitmap |= label_bitmap
+            return bitmap
+
+        labels = self._labels[column]
+        bitmaps = self._bitmaps[column]
+        # Positions of the last value below low and the last value up to high
+        below = int(np.searchsorted(labels, low, side="left")) - 1
+        upto = int(np.searchsorted(labels, high, side="right")) - 1
+
+        if upto < 0 or upto <= below:
+            return np.zeros_like(self._all_rows)
+        if below < 0:
+            return bitmaps[upto].copy()
+        return bitmaps[upto] & ~bitmaps[below]
+
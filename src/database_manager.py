@@ -5,50 +5,296 @@ This module provides functions to manage DuckDB connections, create tables,
 import data, and execute queries.
 """
 
-from typing import List, Optional
+from typing import Any, Callable, Collection, Dict, Iterator, List, Optional, Sequence, Tuple
+from contextlib import contextmanager
+from functools import wraps
+import copy
+import queue
+import threading
 import pandas as pd
+import numpy as np
 import duckdb
 from pathlib import Path
 
+from facet_catalog import collect_facets, merge_facets
+from query_cache import QueryResultCache, DEFAULT_CACHE_BYTES, normalize_sql
+
+
+# Maximum number of cursors a DatabaseManager runs queries on concurrently
+DEFAULT_MAX_CURSORS = 8
+
+
+# Result formats supported by DatabaseManager.execute_query
+RESULT_FORMATS = ("pandas", "arrow", "numpy")
+
+# Maximum number of distinct values for a text column to be stored as an ENUM
+MAX_ENUM_CATEGORIES = 256
+
+# Integer types tried, smallest first, when downcasting integer columns
+INTEGER_TYPE_RANGES = [
+    ("TINYINT", -2 ** 7, 2 ** 7 - 1),
+    ("SMALLINT", -2 ** 15, 2 ** 15 - 1),
+    ("INTEGER", -2 ** 31, 2 ** 31 - 1)
+]
+
+
+def _serialized_write(method: Callable) -> Callable:
+    """Run a DatabaseManager method that modifies the database under its write lock."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._write_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class DatabaseManager:
-    """Manages DuckDB database connections and operations."""
+    """
+    Manages DuckDB database connections and operations.
     
-    def __init__(self, db_path: str = ":memory:"):
+    Queries run on a bounded pool of cursors (see cursor), so they can be
+    issued from several threads at once. Operations that modify the database
+    are serialized on the manager's own connection.
+    """
+    
+    def __init__(self, db_path: str = ":memory:",
+                 connection: Optional[duckdb.DuckDBPyConnection] = None,
+                 schema: Optional[str] = None, max_cursors: int = DEFAULT_MAX_CURSORS,
+                 result_cache_bytes: int = DEFAULT_CACHE_BYTES):
         """
         Initialize DuckDB connection.
         
         Args:
             db_path: Path to DuckDB database file. Use ":memory:" for in-memory database.
+            connection: Optional existing connection (e.g. a cursor of a shared
+                        database) to use instead of opening db_path
+            schema: Optional schema in which this manager creates its tables;
+                    names not found there are resolved in the main schema
+            max_cursors: Maximum number of queries running concurrently
+            result_cache_bytes: Memory budget of the query result cache; 0 disables it
         """
         self.db_path = db_path
-        self.connection = None
+        self.schema = schema
+        self.connection = connection
+        self._write_lock = threading.RLock()
+        # Idle cursors, and a semaphore bounding how many exist at once
+        self._idle_cursors: "queue.LifoQueue[duckdb.DuckDBPyConnection]" = queue.LifoQueue()
+        self._cursor_slots = threading.BoundedSemaphore(max_cursors)
+        # Cursor held by the current thread, so nested use doesn't take a second one
+        self._thread_state = threading.local()
+        self.result_cache = QueryResultCache(result_cache_bytes)
+        # Content fingerprint of the upload each table was last loaded from
+        self._fingerprints: Dict[str, str] = {}
+        # Original types of the columns compact_table narrowed, per table
+        self._original_types: Dict[str, Dict[str, str]] = {}
+        # Per-table counters incremented on every change (see get_table_version)
+        self._table_versions: Dict[str, int] = {}
+        # Value counts and ranges of each imported table's columns (see get_facets)
+        self._facets: Dict[str, dict] = {}
+        # Collect and merge functions of the aggregates maintained per table,
+        # and their current states (see register_aggregate)
+        self._aggregators: Dict[str, Dict[str, Tuple[Callable, Callable]]] = {}
+        self._aggregates: Dict[str, Dict[str, Any]] = {}
         self._initialize_connection()
     
     def _initialize_connection(self) -> None:
         """Initialize or reconnect to DuckDB database."""
         try:
-            self.connection = duckdb.connect(self.db_path)
+            if self.connection is None:
+                self.connection = duckdb.connect(self.db_path)
+            if self.schema:
+                self.connection.execute(f'CREATE SCHEMA IF NOT EXISTS "{self.schema}"')
+            self._configure(self.connection)
         except Exception as e:
             raise RuntimeError(f"Failed to initialize DuckDB connection: {str(e)}")
     
+    def _configure(self, connection: duckdb.DuckDBPyConnection) -> None:
+        """Apply this manager's schema settings to a connection or cursor."""
+        if self.schema:
+            connection.execute(f"SET schema = '{self.schema}'")
+            connection.execute(f"SET search_path = '{self.schema},main'")
+    
     def close(self) -> None:
-        """Close the database connection."""
+        """Close the database connection, dropping the schema of a session manager."""
+        while True:
+            try:
+                self._idle_cursors.get_nowait().close()
+            except queue.Empty:
+                break
+        
         if self.connection:
+            if self.schema:
+                self.connection.execute(f'DROP SCHEMA IF EXISTS "{self.schema}" CASCADE')
             self.connection.close()
             self.connection = None
     
-    def import_data(self, df: pd.DataFrame, table_name: str, if_exists: str = "replace") -> None:
+    @contextmanager
+    def cursor(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """
+        Borrow a cursor from the pool for the duration of a block.
+        
+        Each cursor is used by one thread at a time; when all cursors are in
+        use the caller waits until one is returned. Nested use within a thread
+        yields the cursor the thread already holds.
+        
+        Yields:
+            DuckDB cursor over this manager's database and schema
+        """
+        held = getattr(self._thread_state, "cursor", None)
+        if held is not None:
+            yield held
+            return
+        
+        self._cursor_slots.acquire()
+        try:
+            try:
+                cursor = self._idle_cursors.get_nowait()
+            except queue.Empty:
+                with self._write_lock:
+                    cursor = self.connection.cursor()
+                self._configure(cursor)
+            
+            self._thread_state.cursor = cursor
+            try:
+                yield cursor
+            finally:
+                self._thread_state.cursor = None
+                self._idle_cursors.put(cursor)
+        finally:
+            self._cursor_slots.release()
+    
+    @_serialized_write
+    def create_session(self, session_id: str) -> "DatabaseManager":
+        """
+        Create a manager for one user session over this manager's database.
+        
+        The session manager queries through its own cursor and writes into its
+        own schema, so it sees the shared tables without copying them, and
+        tables it creates are private to the session.
+        
+        Args:
+            session_id: Identifier of the session (letters, digits and underscores)
+        
+        Returns:
+            DatabaseManager bound to the session's schema
+        
+        Raises:
+            ValueError: If session_id is invalid
+        """
+        if not session_id or not session_id.replace("_", "").isalnum():
+            raise ValueError(f"Invalid session id: {session_id}")
+        
+        return DatabaseManager(
+            self.db_path,
+            connection=self.connection.cursor(),
+            schema=f"session_{session_id}"
+        )
+    
+    @_serialized_write
+    def create_view(self, view_name: str, source_table: str,
+                    fingerprint: Optional[str] = None, facets: Optional[dict] = None,
+                    aggregates: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Expose a table under another name without copying its data.
+        
+        Session managers use this to overlay shared datasets; a later append
+        or upsert to the view first copies the data into a private table.
+        
+        Args:
+            view_name: Name of the view to create (replacing any table or view)
+            source_table: Table the view reads from, optionally schema-qualified
+            fingerprint: Optional content hash of the upload behind source_table
+            facets: Optional facets of source_table (see get_facets)
+            aggregates: Optional states of aggregates of view_name already
+                        collected over source_table, e.g. shared by every
+                        session binding a dataset; registered aggregates not
+                        given are collected over the view
+        
+        Raises:
+            ValueError: If view_name is invalid
+            RuntimeError: If the view cannot be created
+        """
+        if not view_name or not view_name.replace("_", "").isalnum():
+            raise ValueError(f"Invalid table name: {view_name}")
+        
+        try:
+            self._drop_table(view_name)
+            self.connection.execute(f"CREATE VIEW {view_name} AS SELECT * FROM {source_table}")
+            collected = self._collect_aggregates(view_name, skip=aggregates or {})
+        except Exception as e:
+            raise RuntimeError(f"Failed to create view '{view_name}': {str(e)}")
+        self._aggregates[view_name] = {**collected, **(aggregates or {})}
+        
+        if fingerprint:
+            self._fingerprints[view_name] = fingerprint
+        else:
+            self._fingerprints.pop(view_name, None)
+        if facets:
+            self._facets[view_name] = copy.deepcopy(facets)
+        self._bump_version(view_name)
+    
+    @_serialized_write
+    def create_table_as(self, table_name: str, query: str,
+                        params: Optional[Sequence[Any]] = None) -> int:
+        """
+        Create or replace a table holding the result of a query.
+        
+        Only the new table's version changes; the tables the query reads are
+        left untouched, unlike running CREATE TABLE AS through execute_query.
+        
+        Args:
+            table_name: Name of the table to create
+            query: SELECT statement producing the rows, with ? placeholders for params
+            params: Optional values bound to the placeholders of the query
+        
+        Returns:
+            Number of rows in the new table
+        
+        Raises:
+            ValueError: If table_name is invalid
+            RuntimeError: If the table cannot be created
+        """
+        if not table_name or not table_name.replace("_", "").isalnum():
+            raise ValueError(f"Invalid table name: {table_name}")
+        
+        try:
+            self.connection.execute("BEGIN TRANSACTION")
+            self._drop_table(table_name)
+            self.connection.execute(f"CREATE TABLE {table_name} AS {query}", list(params or []))
+            row_count = self.connection.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+            self.connection.execute("COMMIT")
+        except Exception as e:
+            self.connection.execute("ROLLBACK")
+            raise RuntimeError(f"Failed to create table '{table_name}': {str(e)}")
+        
+        self._fingerprints.pop(table_name, None)
+        self._bump_version(table_name)
+        return row_count
+    
+    @_serialized_write
+    def import_data(self, df: pd.DataFrame, table_name: str, if_exists: str = "replace",
+                    compact: bool = True, key_column: str = "student_id") -> int:
         """
         Import a pandas DataFrame into a DuckDB table.
         
+        'append' and 'upsert' only write the incoming rows, so loading a daily
+        delta costs time proportional to the delta rather than the table.
+        
         Args:
             df: pandas DataFrame to import
             table_name: Name of the table to create/update
-            if_exists: How to behave if table exists ('replace', 'append', 'fail')
+            if_exists: How to behave if table exists ('replace', 'append',
+                       'upsert', 'fail'). 'upsert' replaces the rows whose
+                       key_column matches an incoming row and appends the rest.
+            compact: Whether to store a newly created table with compact column
+                     types (see compact_table)
+            key_column: Column identifying a row for 'upsert'
+        
+        Returns:
+            Number of rows written
         
         Raises:
-            ValueError: If DataFrame is empty or table_name is invalid
+            ValueError: If DataFrame is empty, table_name or if_exists is invalid,
+                        or the table exists and if_exists is 'fail'
             RuntimeError: If import operation fails
         """
         if df.empty:
@@ -57,38 +303,707 @@ class DatabaseManager:
         if not table_name or not table_name.replace("_", "").isalnum():
             raise ValueError(f"Invalid table name: {table_name}")
         
+        if if_exists not in ("replace", "append", "upsert", "fail"):
+            raise ValueError(f"Invalid if_exists value: {if_exists}")
+        
+        if if_exists == "upsert":
+            if key_column not in df.columns:
+                raise ValueError(f"Key column '{key_column}' not found in DataFrame")
+            # The last incoming row wins when a key appears more than once
+            df = handle_duplicates(df, subset=[key_column], keep="last")
+        
+        exists = self.table_exists(table_name)
+        if exists and if_exists == "fail":
+            raise ValueError(f"Table '{table_name}' already exists")
+        
+        delta_view = f"__{table_name}_delta"
+        source = f"SELECT * FROM {delta_view}"
+        
         try:
-            if if_exists == "replace":
-                self.connection.execute(f"DROP TABLE IF EXISTS {table_name}")
+            self.connection.execute("BEGIN TRANSACTION")
+            self.connection.register(delta_view, df)
             
-            self.connection.register(table_name, df)
-            self.connection.execute(f"CREATE TABLE {table_name} AS SELECT * FROM {table_name}")
-            self.connection.unregister(table_name)
+            if exists and if_exists in ("append", "upsert"):
+                self._materialize_view(table_name)
+                self._widen_compacted_columns(table_name, source)
+                if if_exists == "upsert":
+                    self.connection.execute(
+                        f'DELETE FROM {table_name} WHERE "{key_column}" IN '
+                        f'(SELECT "{key_column}" FROM {delta_view})'
+                    )
+                self.connection.execute(f"INSERT INTO {table_name} BY NAME {source}")
+                # Replaced rows can't be subtracted from the facets; collect them again
+                facets = self._collect_facets(table_name, source if if_exists == "append" else None)
+                aggregates = self._collect_aggregates(table_name, source if if_exists == "append" else None)
+            else:
+                self._drop_table(table_name)
+                self.connection.execute(f"CREATE TABLE {table_name} AS {source}")
+                if compact:
+                    self._compact_columns(table_name)
+                facets = self._collect_facets(table_name)
+                aggregates = self._collect_aggregates(table_name)
+            
+            self.connection.execute("COMMIT")
+            self._facets[table_name] = facets
+            self._aggregates[table_name] = aggregates
         except Exception as e:
+            self.connection.execute("ROLLBACK")
             raise RuntimeError(f"Failed to import data into table '{table_name}': {str(e)}")
+        finally:
+            self.connection.unregister(delta_view)
+        
+        self._fingerprints.pop(table_name, None)
+        self._bump_version(table_name)
+        return len(df)
+    
+    def get_table_version(self, table_name: str) -> int:
+        """
+        Get the version counter of a table.
+        
+        The counter increases every time the table's data or types change
+        through this manager, so caches can tell whether derived results are
+        still current.
+        
+        Args:
+            table_name: Name of the table
+        
+        Returns:
+            Current version (0 if the table was never written)
+        """
+        return self._table_versions.get(table_name, 0)
+    
+    def _bump_version(self, table_name: str) -> None:
+        """Record that a table's contents changed and drop results computed from it."""
+        self._table_versions[table_name] = self._table_versions.get(table_name, 0) + 1
+        self.result_cache.invalidate_table(table_name)
+    
+    @_serialized_write
+    def import_csv(self, csv_path: Path, table_name: str, if_exists: str = "replace",
+                   deduplicate: bool = True, plan: Optional[dict] = None,
+                   fingerprint: Optional[str] = None, compact: bool = True) -> int:
+        """
+        Import a CSV file into a DuckDB table using DuckDB's native CSV reader.
+
+        The file is streamed by DuckDB in chunks, so it is never materialized
+        as a Python string or pandas DataFrame. Exact duplicate rows are removed
+        keeping the first occurrence, like handle_duplicates(keep="first").
+
+        Args:
+            csv_path: Path to the CSV file
+            table_name: Name of the table to create/update
+            if_exists: How to behave if table exists ('replace', 'append', 'fail')
+            deduplicate: Whether to drop exact duplicate rows
+            plan: Optional parse plan from file_manager.sniff_csv_plan; its
+                  delimiter, encoding and column types are reused instead of
+                  being detected again. They come from a sample, so the
+                  import is retried with detected types, or as latin-1, when
+                  the rest of the file contradicts them
+            fingerprint: Optional content hash of the file, recorded so that
+                         an unchanged upload can skip re-importing
+            compact: Whether to store a newly created table with compact
+                     column types (see compact_table)
+
+        Returns:
+            Number of rows imported
+
+        Raises:
+            ValueError: If the file is empty or table_name is invalid
+            RuntimeError: If import operation fails
+        """
+        if not table_name or not table_name.replace("_", "").isalnum():
+            raise ValueError(f"Invalid table name: {table_name}")
+
+        if if_exists not in ("replace", "append", "fail"):
+            raise ValueError(f"Invalid if_exists value: {if_exists}")
+
+        appending = if_exists == "append" and self.table_exists(table_name)
+
+        while True:
+            try:
+                row_count = self._import_csv_source(
+                    csv_path, table_name, if_exists, deduplicate, plan, compact
+                )
+                break
+            except duckdb.ConversionException as e:
+                if not plan or not plan.get("dtypes"):
+                    raise RuntimeError(f"Failed to import CSV into table '{table_name}': {str(e)}")
+                # The plan's types come from a sample; let DuckDB re-detect them
+                plan = {key: value for key, value in plan.items() if key != "dtypes"}
+            except duckdb.InvalidInputException as e:
+                # Only encoding errors get here (see _import_csv_source)
+                if plan and plan.get("encoding", "utf-8") != "utf-8":
+                    raise RuntimeError(f"Failed to import CSV into table '{table_name}': {str(e)}")
+                # The plan's encoding comes from a sample; latin-1 decodes any byte
+                plan = {**(plan or {}), "encoding": "latin-1"}
+
+        # An appended table no longer matches any single upload
+        if fingerprint and not appending:
+            self._fingerprints[table_name] = fingerprint
+        else:
+            self._fingerprints.pop(table_name, None)
+
+        self._bump_version(table_name)
+        return row_count
+
+    def get_table_fingerprint(self, table_name: str) -> Optional[str]:
+        """
+        Get the content fingerprint of the upload a table was loaded from.
+
+        Args:
+            table_name: Name of the table
+
+        Returns:
+            Fingerprint passed to import_csv, or None if the table was not
+            loaded from a fingerprinted upload or has changed since
+        """
+        return self._fingerprints.get(table_name)
+
+    def get_facets(self, table_name: str) -> Optional[dict]:
+        """
+        Get the value counts and ranges of a table's columns.
+
+        Facets are collected in one pass when a table is imported and merged
+        with the facets of appended rows, so reading them never scans the
+        table. Values are counted for ENUM, BOOLEAN and TINYINT columns; the
+        minimum, maximum and null count are kept for numeric columns. See
+        facet_catalog for the layout.
+
+        Args:
+            table_name: Name of the table
+
+        Returns:
+            Facets dictionary, or None if the table was not imported through
+            this manager or has been modified by a query since
+        """
+        facets = self._facets.get(table_name)
+        return copy.deepcopy(facets) if facets is not None else None
+
+    def _collect_facets(self, table_name: str, appended: Optional[str] = None) -> dict:
+        """
+        Collect the facets of a table, without a transaction.
+
+        Args:
+            table_name: Name of the table
+            appended: Optional SELECT statement producing rows just appended to
+                      the table; when given, only these rows are scanned and
+                      their facets merged into the table's current ones
+        """
+        column_types = self._get_column_types(table_name)
+        current = self._facets.get(table_name)
+        if appended and current is not None:
+            merged = merge_facets(current, collect_facets(self.connection, appended, column_types))
+            if merged is not None:
+                return merged
+        return collect_facets(self.connection, table_name, column_types)
+
+    @_serialized_write
+    def register_aggregate(self, table_name: str, name: str,
+                           collect: Callable[[duckdb.DuckDBPyConnection, str, str, Dict[str, str]], Any],
+                           merge: Callable[[Any, Any], Optional[Any]]) -> None:
+        """
+        Maintain an aggregate of a table across imports, like its facets.
+
+        The aggregate is collected over the whole table when the table is
+        (re)imported or created as a view, and over only the appended rows on
+        append, merging the
+        result into the current state. Other writes to the table drop it until
+        the next import. An aggregate whose collection fails is left out
+        rather than failing the import.
+
+        Args:
+            table_name: Name of the table
+            name: Name of the aggregate
+            collect: Function of (connection, table_name, source, column_types)
+                     computing the aggregate of the rows of source, a table
+                     name or SELECT statement, whose columns belong to
+                     table_name with the given types
+            merge: Function of (current, delta) combining the aggregates of
+                   two disjoint sets of rows, or returning None when it can't,
+                   in which case the whole table is collected again
+
+        Raises:
+            RuntimeError: If the table exists and collecting the aggregate fails
+        """
+        self._aggregators.setdefault(table_name, {})[name] = (collect, merge)
+        if self.table_exists(table_name):
+            try:
+                state = collect(self.connection, table_name, table_name,
+                                self._get_column_types(table_name))
+            except Exception as e:
+                raise RuntimeError(f"Failed to collect aggregate '{name}' of table '{table_name}': {str(e)}")
+            self._aggregates.setdefault(table_name, {})[name] = state
+
+    def get_aggregate(self, table_name: str, name: str) -> Optional[Any]:
+        """
+        Get the current state of an aggregate registered with register_aggregate.
+
+        The state is shared and replaced on every import; callers must not
+        modify it.
+
+        Args:
+            table_name: Name of the table
+            name: Name of the aggregate
+
+        Returns:
+            Aggregate over the table's current contents, or None if it is not
+            maintained or the table was modified by a query since its import
+        """
+        return self._aggregates.get(table_name, {}).get(name)
+
+    @_serialized_write
+    def recompute_aggregate(self, table_name: str, name: str) -> Any:
+        """
+        Collect a registered aggregate over the whole table, without storing it.
+
+        Comparing the result with get_aggregate checks that incremental
+        maintenance kept the aggregate consistent with the table.
+
+        Args:
+            table_name: Name of the table
+            name: Name of the aggregate
+
+        Returns:
+            Aggregate over the table's current contents
+
+        Raises:
+            KeyError: If the aggregate is not registered for the table
+        """
+        collect, _ = self._aggregators[table_name][name]
+        return collect(self.connection, table_name, table_name, self._get_column_types(table_name))
+
+    def _collect_aggregates(self, table_name: str, appended: Optional[str] = None,
+                            skip: Collection[str] = ()) -> Dict[str, Any]:
+        """
+        Collect the registered aggregates of a table, without a transaction.
+
+        Args:
+            table_name: Name of the table
+            appended: Optional SELECT statement producing rows just appended to
+                      the table; when given, aggregates with a current state
+                      are collected over these rows only and merged
+            skip: Names of aggregates not to collect
+        """
+        aggregators = {
+            name: functions for name, functions in self._aggregators.get(table_name, {}).items()
+            if name not in skip
+        }
+        if not aggregators:
+            return {}
+
+        column_types = self._get_column_types(table_name)
+        current = self._aggregates.get(table_name, {})
+        aggregates = {}
+        for name, (collect, merge) in aggregators.items():
+            try:
+                state = None
+                if appended and name in current:
+                    delta = collect(self.connection, table_name, appended, column_types)
+                    state = merge(current[name], delta)
+                if state is None:
+                    state = collect(self.connection, table_name, table_name, column_types)
+            except Exception:
+                # Consumers of a missing aggregate fall back to querying the table
+                continue
+            aggregates[name] = state
+        return aggregates
+
+    def _import_csv_source(self, csv_path: Path, table_name: str, if_exists: str,
+                           deduplicate: bool, plan: Optional[dict], compact: bool) -> int:
+        """Run a CSV import in a single transaction (see import_csv)."""
+        source = _csv_source_sql(Path(csv_path), plan)
+        if deduplicate:
+            source = _deduplicated_source_sql(source)
+
+        try:
+            self.connection.execute("BEGIN TRANSACTION")
+
+            exists = self.table_exists(table_name)
+            if exists and if_exists == "fail":
+                raise ValueError(f"Table '{table_name}' already exists")
+
+            if exists and if_exists == "append":
+                self._materialize_view(table_name)
+                self._widen_compacted_columns(table_name, source)
+                before = self.connection.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+                self.connection.execute(f"INSERT INTO {table_name} BY NAME {source}")
+                after = self.connection.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+                row_count = after - before
+                facets = self._collect_facets(table_name, source)
+                aggregates = self._collect_aggregates(table_name, source)
+            else:
+                self._drop_table(table_name)
+                self.connection.execute(f"CREATE TABLE {table_name} AS {source}")
+                row_count = self.connection.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+                if compact and row_count > 0:
+                    self._compact_columns(table_name)
+                facets = self._collect_facets(table_name)
+                aggregates = self._collect_aggregates(table_name)
+
+            if row_count == 0:
+                raise ValueError("CSV file is empty")
+
+            self.connection.execute("COMMIT")
+            self._facets[table_name] = facets
+            self._aggregates[table_name] = aggregates
+            return row_count
+        except (ValueError, duckdb.ConversionException):
+            self.connection.execute("ROLLBACK")
+            raise
+        except Exception as e:
+            self.connection.execute("ROLLBACK")
+            if _is_encoding_error(e):
+                raise
+            raise RuntimeError(f"Failed to import CSV into table '{table_name}': {str(e)}")
+
+    @_serialized_write
+    def import_parquet(self, parquet_path: Path, table_name: str,
+                       fingerprint: Optional[str] = None, compact: bool = True) -> int:
+        """
+        Replace a table with the contents of a Parquet file.
+        
+        Args:
+            parquet_path: Path to the Parquet file
+            table_name: Name of the table to create
+            fingerprint: Optional content hash of the upload the file was built from
+            compact: Whether to store the table with compact column types
+        
+        Returns:
+            Number of rows imported
+        
+        Raises:
+            ValueError: If table_name is invalid
+            RuntimeError: If import operation fails
+        """
+        if not table_name or not table_name.replace("_", "").isalnum():
+            raise ValueError(f"Invalid table name: {table_name}")
+        
+        path_literal = _sql_string(str(parquet_path))
+        try:
+            self.connection.execute("BEGIN TRANSACTION")
+            self._drop_table(table_name)
+            self.connection.execute(
+                f"CREATE TABLE {table_name} AS SELECT * FROM read_parquet('{path_literal}')"
+            )
+            row_count = self.connection.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+            if compact:
+                self._compact_columns(table_name)
+            facets = self._collect_facets(table_name)
+            aggregates = self._collect_aggregates(table_name)
+            self.connection.execute("COMMIT")
+            self._facets[table_name] = facets
+            self._aggregates[table_name] = aggregates
+        except Exception as e:
+            self.connection.execute("ROLLBACK")
+            raise RuntimeError(f"Failed to import Parquet file into table '{table_name}': {str(e)}")
+        
+        if fingerprint:
+            self._fingerprints[table_name] = fingerprint
+        else:
+            self._fingerprints.pop(table_name, None)
+        
+        self._bump_version(table_name)
+        return row_count
+    
+    @_serialized_write
+    def export_parquet(self, table_name: str, parquet_path: Path) -> None:
+        """
+        Write a table to a Parquet file.
+        
+        Args:
+            table_name: Name of the table to export
+            parquet_path: Destination path
+        
+        Raises:
+            RuntimeError: If export fails
+        """
+        path_literal = _sql_string(str(parquet_path))
+        try:
+            self.connection.execute(f"COPY {table_name} TO '{path_literal}' (FORMAT PARQUET)")
+        except Exception as e:
+            raise RuntimeError(f"Failed to export table '{table_name}' to Parquet: {str(e)}")
+    
+    @_serialized_write
+    def compact_table(self, table_name: str,
+                      max_categories: int = MAX_ENUM_CATEGORIES) -> Dict[str, str]:
+        """
+        Store a table's columns with the most compact types that hold its data.
+        
+        Low-cardinality text columns become ENUM types (which DuckDB returns to
+        pandas as the category dtype), integer columns are downcast to the
+        smallest integer type covering their range, and floating-point columns
+        become FLOAT when every value survives the round trip unchanged.
+        
+        Args:
+            table_name: Name of the table to compact
+            max_categories: Maximum number of distinct values for an ENUM column
+        
+        Returns:
+            Dictionary mapping each changed column to its new type
+        
+        Raises:
+            RuntimeError: If the table cannot be compacted
+        """
+        try:
+            self.connection.execute("BEGIN TRANSACTION")
+            changes = self._compact_columns(table_name, max_categories)
+            # Columns that became ENUMs now have their values counted
+            facets = self._collect_facets(table_name) if changes else None
+            aggregates = self._collect_aggregates(table_name) if changes else None
+            self.connection.execute("COMMIT")
+        except Exception as e:
+            self.connection.execute("ROLLBACK")
+            raise RuntimeError(f"Failed to compact table '{table_name}': {str(e)}")
+        
+        if changes:
+            self._facets[table_name] = facets
+            self._aggregates[table_name] = aggregates
+            self._bump_version(table_name)
+        return changes
+    
+    def _compact_columns(self, table_name: str,
+                         max_categories: int = MAX_ENUM_CATEGORIES) -> Dict[str, str]:
+        """Plan and apply compact column types (see compact_table), without a transaction."""
+        column_types = self._get_column_types(table_name)
+        text_columns = [col for col, col_type in column_types.items() if col_type == "VARCHAR"]
+        integer_columns = [
+            col for col, col_type in column_types.items()
+            if col_type in ("BIGINT", "INTEGER", "SMALLINT", "HUGEINT")
+        ]
+        float_columns = [col for col, col_type in column_types.items() if col_type == "DOUBLE"]
+        
+        # Gather the statistics for every column in a single pass
+        aggregates = ["COUNT(*)"]
+        aggregates += [f'approx_count_distinct("{col}")' for col in text_columns]
+        aggregates += [f'MIN("{col}"), MAX("{col}")' for col in integer_columns]
+        aggregates += [
+            f'bool_and("{col}" IS NULL OR CAST(CAST("{col}" AS FLOAT) AS DOUBLE) = "{col}")'
+            for col in float_columns
+        ]
+        stats = list(self.connection.execute(
+            f"SELECT {', '.join(aggregates)} FROM {table_name}"
+        ).fetchone())
+        row_count = stats.pop(0)
+        
+        new_types = {}
+        
+        enum_candidates = []
+        for col in text_columns:
+            distinct_count = stats.pop(0)
+            if 0 < distinct_count <= max_categories and distinct_count * 2 <= row_count:
+                enum_candidates.append(col)
+        
+        for col in integer_columns:
+            min_val, max_val = stats.pop(0), stats.pop(0)
+            if min_val is None:
+                continue
+            for type_name, type_min, type_max in INTEGER_TYPE_RANGES:
+                if type_min <= min_val and max_val <= type_max:
+                    if type_name != column_types[col]:
+                        new_types[col] = type_name
+                    break
+        
+        for col in float_columns:
+            if stats.pop(0):
+                new_types[col] = "FLOAT"
+        
+        if enum_candidates:
+            value_lists = self.connection.execute("SELECT " + ", ".join(
+                f'list(DISTINCT "{col}" ORDER BY "{col}") FILTER (WHERE "{col}" IS NOT NULL)'
+                for col in enum_candidates
+            ) + f" FROM {table_name}").fetchone()
+            
+            for col, values in zip(enum_candidates, value_lists):
+                if not values or len(values) > max_categories:
+                    continue
+                enum_name = _enum_type_name(table_name, col)
+                values_sql = ", ".join(f"'{_sql_string(value)}'" for value in values)
+                self.connection.execute(f'DROP TYPE IF EXISTS "{enum_name}"')
+                self.connection.execute(f'CREATE TYPE "{enum_name}" AS ENUM ({values_sql})')
+                new_types[col] = f'"{enum_name}"'
+        
+        original_types = self._original_types.setdefault(table_name, {})
+        for col, new_type in new_types.items():
+            self.connection.execute(f'ALTER TABLE {table_name} ALTER COLUMN "{col}" TYPE {new_type}')
+            original_types.setdefault(col, column_types[col])
+        
+        return {col: new_type.strip('"') for col, new_type in new_types.items()}
+    
+    def _widen_compacted_columns(self, table_name: str, source: str) -> None:
+        """
+        Restore the original type of compacted columns that incoming rows don't fit.
+        
+        Args:
+            table_name: Name of the table about to receive rows
+            source: SELECT statement producing the incoming rows
+        """
+        original_types = self._original_types.get(table_name)
+        if not original_types:
+            return
+        
+        column_types = self._get_column_types(table_name)
+        source_columns = {
+            row[0] for row in self.connection.execute(f"DESCRIBE {source}").fetchall()
+        }
+        compacted = [
+            col for col in original_types
+            if col in source_columns and column_types.get(col) != original_types[col]
+        ]
+        if not compacted:
+            return
+        
+        # ENUM columns are reported as inline ENUM('a', 'b') types usable in casts
+        misfits = self.connection.execute("SELECT " + ", ".join(
+            f'bool_or("{col}" IS NOT NULL AND (TRY_CAST("{col}" AS {column_types[col]}) IS NULL '
+            f'OR TRY_CAST("{col}" AS {column_types[col]}) <> "{col}"))'
+            for col in compacted
+        ) + f" FROM ({source})").fetchone()
+        
+        for col, misfit in zip(compacted, misfits):
+            if misfit:
+                self.connection.execute(
+                    f'ALTER TABLE {table_name} ALTER COLUMN "{col}" TYPE {original_types[col]}'
+                )
+                del original_types[col]
+    
+    def _get_column_types(self, table_name: str) -> Dict[str, str]:
+        """Get a mapping of column names to DuckDB type names for a table."""
+        columns_info = self.connection.execute(f"PRAGMA table_info({table_name})").fetchall()
+        return {col[1]: col[2] for col in columns_info}
     
-    def execute_query(self, query: str) -> pd.DataFrame:
+    def _materialize_view(self, table_name: str) -> None:
         """
-        Execute a SQL query and return results as DataFrame.
+        Replace a view with a private table holding a copy of its rows.
+        
+        Compacted column types are kept; their widened originals are recorded
+        so that later appends can still restore them.
         
         Args:
-            query: SQL query to execute
+            table_name: Name of the table or view about to be modified
+        """
+        if self._get_relation_type(table_name) != "VIEW":
+            return
+        
+        copy_name = f"__{table_name}_copy"
+        self.connection.execute(f"CREATE TABLE {copy_name} AS SELECT * FROM {table_name}")
+        self.connection.execute(f"DROP VIEW {table_name}")
+        self.connection.execute(f"ALTER TABLE {copy_name} RENAME TO {table_name}")
+        
+        widened_types = {"TINYINT": "BIGINT", "SMALLINT": "BIGINT", "INTEGER": "BIGINT", "FLOAT": "DOUBLE"}
+        self._original_types[table_name] = {
+            col: "VARCHAR" if col_type.startswith("ENUM") else widened_types[col_type]
+            for col, col_type in self._get_column_types(table_name).items()
+            if col_type.startswith("ENUM") or col_type in widened_types
+        }
+    
+    def _get_relation_type(self, table_name: str) -> Optional[str]:
+        """Get 'BASE TABLE' or 'VIEW' for a name in the current schema, or None."""
+        result = self.connection.execute(
+            "SELECT table_type FROM information_schema.tables "
+            "WHERE table_schema = current_schema() AND table_name = ?",
+            [table_name]
+        ).fetchone()
+        return result[0] if result else None
+    
+    def _drop_table(self, table_name: str) -> None:
+        """Drop a table or view together with the ENUM types created for its columns."""
+        # Only names in the current schema; an unqualified DROP would otherwise
+        # reach a main-schema table through a session's search path
+        relation_type = self._get_relation_type(table_name)
+        if relation_type == "VIEW":
+            self.connection.execute(f"DROP VIEW {table_name}")
+        elif relation_type is not None:
+            self.connection.execute(f"DROP TABLE {table_name}")
+        self._original_types.pop(table_name, None)
+        self._facets.pop(table_name, None)
+        self._aggregates.pop(table_name, None)
+        
+        enum_types = self.connection.execute(
+            "SELECT type_name FROM duckdb_types() "
+            "WHERE logical_type = 'ENUM' AND schema_name = current_schema() "
+            "AND starts_with(type_name, ?)",
+            [_enum_type_name(table_name, "")]
+        ).fetchall()
+        for (enum_name,) in enum_types:
+            self.connection.execute(f'DROP TYPE IF EXISTS "{enum_name}"')
+    
+    def execute_query(self, query: str, result_format: str = "pandas",
+                      use_cache: bool = True, params: Optional[Sequence[Any]] = None) -> Any:
+        """
+        Execute a SQL query and return its results in columnar form.
+        
+        Results are transferred by DuckDB column by column; no Python object
+        is built per row. Results of read-only queries are cached until one of
+        the tables they read changes (see result_cache).
+        
+        Parameters are bound by DuckDB, never spliced into the SQL text.
+        
+        Args:
+            query: SQL query to execute, with ? placeholders for params
+            result_format: Format of the results:
+                           - 'pandas': pandas DataFrame (default)
+                           - 'arrow': pyarrow Table
+                           - 'numpy': dictionary of column names to NumPy arrays
+            use_cache: Whether the result may be served from or stored in the
+                       cache; disable for non-deterministic queries
+            params: Optional values bound to the placeholders of the query
         
         Returns:
-            pandas DataFrame with query results
+            Query results in the requested format
         
         Raises:
+            ValueError: If the query is empty, result_format is unknown or a
+                        parameter is not a string, number, boolean or None
             RuntimeError: If query execution fails
         """
         if not query or not query.strip():
             raise ValueError("Query cannot be empty")
         
+        if result_format not in RESULT_FORMATS:
+            raise ValueError(f"Invalid result format: {result_format}")
+        
+        params = list(params or [])
+        # Checked up front so a bad parameter is reported as such
+        for value in params:
+            _check_query_param(value)
+        normalized = normalize_sql(query)
+        is_read = normalized.upper().startswith(("SELECT", "WITH"))
+        tables = _get_referenced_tables(normalized)
+        
+        cache_key = None
+        if use_cache and is_read and tables is not None:
+            versions = tuple((table, self.get_table_version(table)) for table in tables)
+            cache_key = (normalized, tuple(params), result_format, versions)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return _copy_result(cached)
+        
         try:
-            result = self.connection.execute(query).fetchall()
-            columns = [desc[0] for desc in self.connection.description]
-            return pd.DataFrame(result, columns=columns)
+            with self.cursor() as cursor:
+                if params:
+                    result = cursor.execute(query, params)
+                else:
+                    result = cursor.execute(query)
+                fetched = _fetch_result(result, result_format)
         except Exception as e:
             raise RuntimeError(f"Query execution failed: {str(e)}")
+        
+        if not is_read:
+            # Statements that may modify tables invalidate what they touch
+            if tables is None:
+                # Any table may have changed
+                self.result_cache.clear()
+                self._facets.clear()
+                self._aggregates.clear()
+                tables = set(self._table_versions) | set(self.get_available_tables())
+            for table in tables:
+                self._facets.pop(table, None)
+                self._aggregates.pop(table, None)
+                self._bump_version(table)
+        
+        if cache_key is not None:
+            self.result_cache.put(cache_key, fetched, tables)
+            return _copy_result(fetched)
+        return fetched
     
     def get_available_tables(self) -> List[str]:
         """
@@ -98,9 +1013,10 @@ class DatabaseManager:
             List of table names
         """
         try:
-            result = self.connection.execute(
-                "SELECT table_name FROM information_schema.tables WHERE table_schema = 'main'"
-            ).fetchall()
+            with self.cursor() as cursor:
+                result = cursor.execute(
+                    "SELECT table_name FROM information_schema.tables WHERE table_schema = current_schema()"
+                ).fetchall()
             return [row[0] for row in result]
         except Exception as e:
             raise RuntimeError(f"Failed to retrieve table list: {str(e)}")
@@ -122,15 +1038,16 @@ class DatabaseManager:
             RuntimeError: If table doesn't exist or query fails
         """
         try:
-            # Get row count
-            row_count = self.connection.execute(
-                f"SELECT COUNT(*) FROM {table_name}"
-            ).fetchone()[0]
-            
-            # Get column info
-            columns_info = self.connection.execute(
-                f"PRAGMA table_info({table_name})"
-            ).fetchall()
+            with self.cursor() as cursor:
+                # Get row count
+                row_count = cursor.execute(
+                    f"SELECT COUNT(*) FROM {table_name}"
+                ).fetchone()[0]
+                
+                # Get column info
+                columns_info = cursor.execute(
+                    f"PRAGMA table_info({table_name})"
+                ).fetchall()
             
             columns = [
                 {"name": col[1], "type": col[2]} for col in columns_info
@@ -160,6 +1077,7 @@ class DatabaseManager:
         except Exception:
             return False
     
+    @_serialized_write
     def delete_table(self, table_name: str) -> None:
         """
         Delete a table from the database.
@@ -171,10 +1089,13 @@ class DatabaseManager:
             RuntimeError: If deletion fails
         """
         try:
-            self.connection.execute(f"DROP TABLE IF EXISTS {table_name}")
+            self._drop_table(table_name)
+            self._fingerprints.pop(table_name, None)
+            self._bump_version(table_name)
         except Exception as e:
             raise RuntimeError(f"Failed to delete table '{table_name}': {str(e)}")
     
+    @_serialized_write
     def merge_tables(self, table1: str, table2: str, on_column: str, output_table: str) -> None:
         """
         Merge two tables based on a common column.
@@ -195,9 +1116,152 @@ class DatabaseManager:
             FULL OUTER JOIN {table2}
             ON {table1}.{on_column} = {table2}.{on_column}
             """
+            self.connection.execute("BEGIN TRANSACTION")
             self.connection.execute(query)
+            # Facets and aggregates kept for an earlier table of that name are stale
+            facets = self._collect_facets(output_table)
+            aggregates = self._collect_aggregates(output_table)
+            self.connection.execute("COMMIT")
         except Exception as e:
+            self.connection.execute("ROLLBACK")
             raise RuntimeError(f"Failed to merge tables: {str(e)}")
+        
+        self._facets[output_table] = facets
+        self._aggregates[output_table] = aggregates
+        self._fingerprints.pop(output_table, None)
+        self._bump_version(output_table)
+
+
+def _fetch_result(result: duckdb.DuckDBPyConnection, result_format: str) -> Any:
+    """
+    Fetch the pending result of an executed query in a columnar format.
+    
+    Args:
+        result: Connection or cursor holding the result
+        result_format: One of RESULT_FORMATS
+    
+    Returns:
+        pandas DataFrame, pyarrow Table or dictionary of NumPy arrays
+    """
+    if result_format == "arrow":
+        # Newer DuckDB versions renamed fetch_arrow_table to to_arrow_table
+        fetch_arrow = getattr(result, "to_arrow_table", None) or result.fetch_arrow_table
+        return fetch_arrow()
+    if result_format == "numpy":
+        return result.fetchnumpy()
+    return result.fetchdf()
+
+
+def _get_referenced_tables(query: str) -> Optional[List[str]]:
+    """Get the sorted names of the tables a query references, or None if unknown."""
+    try:
+        return sorted(duckdb.get_table_names(query))
+    except Exception:
+        return None
+
+
+def _copy_result(result: Any) -> Any:
+    """
+    Return a cached result without letting callers modify the cached object.
+    
+    DataFrames and dictionaries are copied shallowly; their column data is shared.
+    """
+    if isinstance(result, pd.DataFrame):
+        return result.copy(deep=False)
+    if isinstance(result, dict):
+        return dict(result)
+    return result
+
+
+def _csv_source_sql(csv_path: Path, plan: Optional[dict] = None) -> str:
+    """
+    Build a SELECT over DuckDB's CSV reader for a file.
+
+    Type detection is limited to the types pandas infers by default so that
+    columns such as "Yes"/"No" stay text instead of becoming BOOLEAN.
+
+    Args:
+        csv_path: Path to the CSV file
+        plan: Optional parse plan from file_manager.sniff_csv_plan
+
+    Returns:
+        SELECT statement reading the file
+    """
+    options = [
+        f"'{_sql_string(str(csv_path))}'",
+        "header = true",
+        "auto_type_candidates = ['BIGINT', 'DOUBLE', 'VARCHAR']"
+    ]
+
+    if plan:
+        if "delimiter" in plan:
+            options.append(f"delim = '{_sql_string(plan['delimiter'])}'")
+        # DuckDB reads latin-1 natively; the other fallbacks are latin-1 compatible
+        encoding = "utf-8" if plan.get("encoding", "utf-8") == "utf-8" else "latin-1"
+        options.append(f"encoding = '{encoding}'")
+        # Integer columns are left to detection: DuckDB would silently round
+        # later decimal values cast to an integer type chosen from the sample
+        duckdb_types = {"float": "DOUBLE", "string": "VARCHAR"}
+        planned_types = {
+            column: duckdb_types[dtype]
+            for column, dtype in (plan.get("dtypes") or {}).items()
+            if dtype in duckdb_types
+        }
+        if planned_types:
+            types_sql = ", ".join(
+                f"'{_sql_string(column)}': '{duckdb_type}'"
+                for column, duckdb_type in planned_types.items()
+            )
+            options.append(f"types = {{{types_sql}}}")
+
+    return f"SELECT * FROM read_csv({', '.join(options)})"
+
+
+def _is_encoding_error(error: Exception) -> bool:
+    """Check whether DuckDB failed to read a CSV file because of its encoding."""
+    return isinstance(error, duckdb.InvalidInputException) and "Invalid unicode" in str(error)
+
+
+def _enum_type_name(table_name: str, column_name: str) -> str:
+    """Name of the ENUM type compact_table creates for a column."""
+    return f"{table_name}__{column_name}".lower()
+
+
+def _sql_string(value: str) -> str:
+    """Escape a value for use inside a single-quoted SQL string literal."""
+    return value.replace("'", "''")
+
+
+def _check_query_param(value: Any) -> None:
+    """
+    Check that a query parameter is a value DuckDB binds as a SQL scalar.
+    
+    Raises:
+        ValueError: If the value is not a string, number, boolean or None
+    """
+    if value is None or isinstance(value, (bool, np.bool_, int, np.integer, float, np.floating, str)):
+        return
+    raise ValueError(f"Unsupported query parameter type: {type(value).__name__}")
+
+
+def _deduplicated_source_sql(source: str) -> str:
+    """
+    Wrap a SELECT so exact duplicate rows are removed, keeping the first occurrence.
+
+    Args:
+        source: SELECT statement producing the rows
+
+    Returns:
+        SELECT statement producing distinct rows in first-occurrence order
+    """
+    return f"""
+    SELECT * EXCLUDE (__first_row) FROM (
+        SELECT * EXCLUDE (__row_number), MIN(__row_number) AS __first_row
+        FROM (SELECT *, row_number() OVER () AS __row_number FROM ({source}))
+        GROUP BY ALL
+    )
+    ORDER BY __first_row
+    """
 
 
 
@@ -0,0 +1,157 @@
+"""
+Dataset Cache module for reusing ingested datasets across sessions.
+
+This module stores cleaned, deduplicated tables as Parquet files keyed by the
+content fingerprint of the upload they came from, so that later loads of the
+same file skip CSV parsing and are read with DuckDB's Parquet scanner.
+
+The cache is bounded in size: storing a dataset evicts the least recently
+used files (by modification time, refreshed on every load) beyond the limit.
+"""
+
+from pathlib import Path
+import os
+import shutil
+import tempfile
+
+from database_manager import DatabaseManager
+
+
+# Bump whenever the cleaning or typing of ingested data changes, so that
+# Parquet files written by older versions are no longer used
+CACHE_SCHEMA_VERSION = 1
+
+DEFAULT_CACHE_DIR = Path(tempfile.gettempdir()) / "student_performance_cache"
+
+# Disk budget of the cached Parquet files
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+class DatasetCache:
+    """Stores ingested tables as Parquet files keyed by content fingerprint."""
+    
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Initialize the dataset cache.
+        
+        Args:
+            cache_dir: Directory holding the cached Parquet files
+            max_bytes: Total size of the cached files beyond which the least
+                       recently used are removed
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+    
+    def get_path(self, fingerprint: str) -> Path:
+        """
+        Get the cache file path for a fingerprint.
+        
+        Args:
+            fingerprint: Content hash of the upload
+        
+        Returns:
+            Path of the Parquet file for the current schema version
+        """
+        return self.cache_dir / f"{fingerprint}_v{CACHE_SCHEMA_VERSION}.parquet"
+    
+    def contains(self, fingerprint: str) -> bool:
+        """
+        Check whether a dataset is cached.
+        
+        Args:
+            fingerprint: Content hash of the upload
+        
+        Returns:
+            True if a cached Parquet file exists, False otherwise
+        """
+        return self.get_path(fingerprint).exists()
+    
+    def store(self, db_manager: DatabaseManager, table_name: str, fingerprint: str) -> Path:
+        """
+        Cache the contents of a table under a fingerprint.
+        
+        The file is written under a temporary name and moved into place, so
+        concurrent readers never see a partially written file. Least recently
+        used files are then removed until the cache fits in max_bytes; the
+        new file is kept even if it alone exceeds the limit.
+        
+        Args:
+            db_manager: DatabaseManager holding the table
+            table_name: Name of the table to cache
+            fingerprint: Content hash of the upload the table was loaded from
+        
+        Returns:
+            Path of the cached Parquet file
+        
+        Raises:
+            RuntimeError: If the table cannot be exported
+        """
+        path = self.get_path(fingerprint)
+        # Hidden, so eviction leaves files being written alone
+        fd, tmp_name = tempfile.mkstemp(prefix=".", suffix=".parquet", dir=self.cache_dir)
+        os.close(fd)
+        
+        try:
+            db_manager.export_parquet(table_name, Path(tmp_name))
+            os.replace(tmp_name, path)
+        finally:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+        
+        self._evict(keep=path)
+        return path
+    
+    def _evict(self, keep: Path) -> None:
+        """Remove the least recently used cached files until the cache fits in max_bytes."""
+        files = []
+        for cached in self.cache_dir.glob("*.parquet"):
+            if cached.name.startswith("."):
+                continue
+            try:
+                stat = cached.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, cached))
+        
+        total = sum(size for _, size, _ in files)
+        for _, size, cached in sorted(files, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            if cached == keep:
+                continue
+            try:
+                cached.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+    
+    def load(self, db_manager: DatabaseManager, table_name: str, fingerprint: str) -> int:
+        """
+        Load a cached dataset into a table.
+        
+        Args:
+            db_manager: DatabaseManager to load into
+            table_name: Name of the table to create
+            fingerprint: Content hash of the upload
+        
+        Returns:
+            Number of rows loaded
+        
+        Raises:
+            KeyError: If the dataset is not cached
+            RuntimeError: If the cached file cannot be loaded
+        """
+        path = self.get_path(fingerprint)
+        try:
+            # Marks the file as recently used for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            raise KeyError(f"Dataset {fingerprint} is not cached")
+        
+        return db_manager.import_parquet(path, table_name, fingerprint=fingerprint)
+    
+    def clear(self) -> None:
+        """Remove all cached datasets."""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,183 @@
+"""
+Facet Catalog module for describing the values of a table's columns.
+
+This module computes, in a single pass over a table, the distinct values with
+their counts for every low-cardinality column and the minimum, maximum and
+null count for every numeric column. Filter widgets are populated from these
+facets instead of scanning the table on every rerun.
+
+Facets are plain dictionaries:
+
+    {
+        "row_count": 1000,
+        "columns": {
+            "gender": {"null_count": 0, "values": {"Female": 481, "Male": 519}},
+            "age": {"null_count": 0, "min": 17, "max": 24, "values": {17: 120, ...}},
+            "exam_score": {"null_count": 2, "min": 18.4, "max": 100.0}
+        }
+    }
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import duckdb
+
+
+# Column types whose values are counted. Their cardinality is bounded by the
+# type: compact_table stores low-cardinality text as ENUM and small integer
+# ranges as TINYINT.
+VALUE_COUNT_TYPES = ("BOOLEAN", "TINYINT", "UTINYINT")
+
+# Column types whose range is recorded
+NUMERIC_TYPES = (
+    "TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT",
+    "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT", "FLOAT", "DOUBLE"
+)
+
+
+def get_facet_columns(column_types: Dict[str, str]) -> Tuple[List[str], List[str]]:
+    """
+    Split columns into those whose values are counted and those whose range is recorded.
+
+    Args:
+        column_types: Mapping of column names to DuckDB type names
+
+    Returns:
+        Tuple of (value_columns, numeric_columns); a small integer column is in both
+    """
+    value_columns = [
+        col for col, col_type in column_types.items()
+        if col_type.startswith("ENUM") or col_type in VALUE_COUNT_TYPES
+    ]
+    numeric_columns = [
+        col for col, col_type in column_types.items()
+        if col_type in NUMERIC_TYPES or col_type.startswith("DECIMAL")
+    ]
+    return value_columns, numeric_columns
+
+
+def collect_facets(connection: duckdb.DuckDBPyConnection, source: str,
+                   column_types: Dict[str, str]) -> dict:
+    """
+    Compute the facets of the rows produced by a query in a single pass.
+
+    Every value column gets its own grouping set, and the empty grouping set
+    carries the row count and numeric statistics, so one aggregation scans
+    the rows once.
+
+    Args:
+        connection: DuckDB connection or cursor
+        source: Table name or SELECT statement producing the rows
+        column_types: Types of the table the rows belong to; source columns
+                      are cast to them, and columns the source lacks count
+                      as NULL
+
+    Returns:
+        Facets dictionary (see module docstring)
+    """
+    if not source.lstrip().upper().startswith(("SELECT", "WITH")):
+        source = f"SELECT * FROM {source}"
+
+    value_columns, numeric_columns = get_facet_columns(column_types)
+    source_columns = {
+        row[0] for row in connection.execute(f"DESCRIBE {source}").fetchall()
+    }
+
+    def column_sql(col: str) -> str:
+        value = f'"{col}"' if col in source_columns else "NULL"
+        return f"CAST({value} AS {column_types[col]})"
+
+    columns = {col: {"null_count": 0} for col in value_columns + numeric_columns}
+
+    selects = [f'{column_sql(col)} AS "{col}"' for col in value_columns]
+    selects += [f'GROUPING("{col}")' for col in value_columns]
+    selects += ["COUNT(*)"]
+    for col in numeric_columns:
+        selects += [f"MIN({column_sql(col)})", f"MAX({column_sql(col)})", f"COUNT({column_sql(col)})"]
+
+    query = f"SELECT {', '.join(selects)} FROM ({source})"
+    if value_columns:
+        grouping_sets = ", ".join(f'("{col}")' for col in value_columns)
+        query += f" GROUP BY GROUPING SETS ({grouping_sets}, ())"
+
+    row_count = 0
+    for row in connection.execute(query).fetchall():
+        values = row[:len(value_columns)]
+        grouped = row[len(value_columns):2 * len(value_columns)]
+        count = row[2 * len(value_columns)]
+
+        if all(grouped):
+            # Empty grouping set: totals over all rows
+            row_count = count
+            stats = row[2 * len(value_columns) + 1:]
+            for i, col in enumerate(numeric_columns):
+                min_val, max_val, non_null = stats[3 * i:3 * i + 3]
+                columns[col].update({"min": min_val, "max": max_val})
+                columns[col]["null_count"] = count - non_null
+            continue
+
+        col_index = grouped.index(0)
+        col = value_columns[col_index]
+        value = values[col_index]
+        counts = columns[col].setdefault("values", {})
+        if value is None:
+            if col not in numeric_columns:
+                columns[col]["null_count"] = count
+        else:
+            counts[value] = count
+
+    for col in value_columns:
+        columns[col].setdefault("values", {})
+
+    return {"row_count": row_count, "columns": columns}
+
+
+def merge_facets(base: dict, delta: dict) -> Optional[dict]:
+    """
+    Combine the facets of a table and of rows appended to it.
+
+    Neither argument is modified.
+
+    Args:
+        base: Facets of the table before the append
+        delta: Facets of the appended rows, collected with the table's types
+
+    Returns:
+        Facets of the table after the append, or None if the two don't
+        describe the same columns (e.g. an append changed a column's type)
+        and the facets must be collected again
+    """
+    base_columns, delta_columns = base["columns"], delta["columns"]
+    if set(base_columns) != set(delta_columns) or any(
+        ("values" in base_columns[col]) != ("values" in delta_columns[col])
+        for col in base_columns
+    ):
+        return None
+
+    columns = {}
+    for col, base_facet in base_columns.items():
+        delta_facet = delta_columns[col]
+        facet = {"null_count": base_facet["null_count"] + delta_facet["null_count"]}
+
+        if "min" in base_facet:
+            facet["min"] = _combine(min, base_facet["min"], delta_facet["min"])
+            facet["max"] = _combine(max, base_facet["max"], delta_facet["max"])
+
+        if "values" in base_facet:
+            values = dict(base_facet["values"])
+            for value, count in delta_facet["values"].items():
+                values[value] = values.get(value, 0) + count
+            facet["values"] = values
+
+        columns[col] = facet
+
+    return {"row_count": base["row_count"] + delta["row_count"], "columns": columns}
+
+
+def _combine(function: Any, first: Any, second: Any) -> Any:
+    """Apply min or max to two statistics, either of which may be None."""
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return function(first, second)
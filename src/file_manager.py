@@ -5,18 +5,76 @@ This module provides functions to validate CSV file structure, parse CSV files,
 and retrieve file metadata.
 """
 
-from typing import Tuple, List, Optional
+from typing import Tuple, List, Optional, BinaryIO, Iterator, Dict
+from contextlib import contextmanager
+from pathlib import Path
+import csv
+import hashlib
+import os
+import shutil
+import tempfile
 import pandas as pd
 from io import StringIO
 
 
-def validate_csv_structure(file_content: str, required_columns: List[str]) -> Tuple[bool, str]:
+# Size of the chunks copied from an upload into its spool file
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Number of data rows read when validating a file from a sample
+DEFAULT_SAMPLE_ROWS = 1000
+
+# DuckDB types of columns that pass a "numeric" expected type
+NUMERIC_TABLE_TYPES = {
+    "TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT",
+    "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT", "UHUGEINT",
+    "FLOAT", "DOUBLE", "DECIMAL"
+}
+
+# Encodings tried, in order, when decoding uploaded files
+SUPPORTED_ENCODINGS = ["utf-8", "latin-1", "iso-8859-1", "cp1252"]
+
+HABITS_REQUIRED_COLUMNS = [
+    "student_id", "age", "gender", "study_hours_per_day", "social_media_hours",
+    "netflix_hours", "part_time_job", "attendance_percentage", "sleep_hours",
+    "diet_quality", "exercise_frequency", "parental_education_level",
+    "internet_quality", "mental_health_rating", "extracurricular_participation",
+    "exam_score"
+]
+
+HABITS_EXPECTED_TYPES = {
+    "age": "numeric",
+    "study_hours_per_day": "numeric",
+    "attendance_percentage": "numeric",
+    "sleep_hours": "numeric",
+    "exam_score": "numeric"
+}
+
+FACTORS_REQUIRED_COLUMNS = [
+    "Hours_Studied", "Attendance", "Parental_Involvement", "Access_to_Resources",
+    "Extracurricular_Activities", "Sleep_Hours", "Previous_Scores",
+    "Motivation_Level", "Internet_Access", "Tutoring_Sessions", "Family_Income",
+    "Teacher_Quality", "School_Type", "Peer_Influence", "Physical_Activity",
+    "Learning_Disabilities", "Parental_Education_Level", "Distance_from_Home",
+    "Gender", "Exam_Score"
+]
+
+FACTORS_EXPECTED_TYPES = {
+    "Hours_Studied": "numeric",
+    "Attendance": "numeric",
+    "Sleep_Hours": "numeric",
+    "Exam_Score": "numeric"
+}
+
+
+def validate_csv_structure(file_content: str, required_columns: List[str],
+                           sample_rows: Optional[int] = None) -> Tuple[bool, str]:
     """
     Validate that a CSV file contains all required columns.
     
     Args:
         file_content: The content of the CSV file as a string
         required_columns: List of required column names
+        sample_rows: If set, only the header and this many data rows are parsed
     
     Returns:
         Tuple of (is_valid, error_message)
@@ -27,12 +85,16 @@ def validate_csv_structure(file_content: str, required_columns: List[str]) -> Tu
         ValueError: If file cannot be parsed as CSV
     """
     try:
-        df = pd.read_csv(StringIO(file_content))
+        df = pd.read_csv(StringIO(file_content), nrows=sample_rows)
     except Exception as e:
         return False, f"Failed to parse CSV file: {str(e)}"
     
-    # Check for required columns (case-insensitive)
-    df_columns_lower = [col.lower() for col in df.columns]
+    return _check_required_columns(df.columns, required_columns)
+
+
+def _check_required_columns(columns: List[str], required_columns: List[str]) -> Tuple[bool, str]:
+    """Check (case-insensitively) that columns include all required columns."""
+    df_columns_lower = [col.lower() for col in columns]
     required_lower = [col.lower() for col in required_columns]
     
     missing_columns = [col for col in required_lower if col not in df_columns_lower]
@@ -43,12 +105,103 @@ def validate_csv_structure(file_content: str, required_columns: List[str]) -> Tu
     return True, ""
 
 
-def parse_csv_file(file_content: str) -> pd.DataFrame:
+def sniff_csv_plan(csv_path: Path, required_columns: List[str],
+                   expected_types: Optional[Dict[str, str]] = None,
+                   sample_rows: int = DEFAULT_SAMPLE_ROWS) -> Tuple[bool, str, Optional[dict]]:
+    """
+    Validate a CSV file from its header and a bounded row sample.
+    
+    Only the first sample_rows data rows are read, so bad uploads are rejected
+    without parsing the whole file. On success a parse plan is returned that
+    the full ingest (DatabaseManager.import_csv or parse_csv_file) can reuse
+    instead of detecting the format again.
+    
+    Args:
+        csv_path: Path to the CSV file
+        required_columns: List of required column names
+        expected_types: Optional mapping of column names to "numeric"
+        sample_rows: Number of data rows to sample
+    
+    Returns:
+        Tuple of (is_valid, error_message, plan)
+        - plan: None if invalid, otherwise a dictionary with:
+          - delimiter: Field delimiter
+          - encoding: Encoding the sample was decoded with
+          - columns: List of column names
+          - dtypes: Mapping of column names to "integer", "float" or "string"
+    """
+    try:
+        with open(csv_path, "rb") as csv_file:
+            sample_lines = [csv_file.readline() for _ in range(sample_rows + 1)]
+    except OSError as e:
+        return False, f"Failed to read CSV file: {str(e)}", None
+    
+    sample_bytes = b"".join(sample_lines)
+    if not sample_bytes.strip():
+        return False, "CSV file is empty", None
+    
+    try:
+        sample_text, encoding = _decode_with_fallback(sample_bytes)
+    except FileEncodingError as e:
+        return False, str(e), None
+    
+    delimiter = _sniff_delimiter(sample_text.splitlines()[0])
+    
+    try:
+        df = pd.read_csv(StringIO(sample_text), sep=delimiter)
+    except Exception as e:
+        return False, f"Failed to parse CSV file: {str(e)}", None
+    
+    is_valid, error_msg = _check_required_columns(df.columns, required_columns)
+    if not is_valid:
+        return False, error_msg, None
+    
+    if len(df) == 0:
+        return False, "CSV file is empty", None
+    
+    # Check that expected numeric columns look numeric in the sample
+    columns_by_lower = {col.lower(): col for col in df.columns}
+    for column, expected_type in (expected_types or {}).items():
+        actual = columns_by_lower.get(column.lower())
+        if actual is None or expected_type != "numeric":
+            continue
+        values = df[actual].dropna()
+        if pd.to_numeric(values, errors="coerce").isna().any():
+            return False, f"Column '{actual}' contains non-numeric values", None
+    
+    dtypes = {}
+    for column in df.columns:
+        if pd.api.types.is_integer_dtype(df[column]):
+            dtypes[column] = "integer"
+        elif pd.api.types.is_float_dtype(df[column]):
+            dtypes[column] = "float"
+        else:
+            dtypes[column] = "string"
+    
+    plan = {
+        "delimiter": delimiter,
+        "encoding": encoding,
+        "columns": list(df.columns),
+        "dtypes": dtypes
+    }
+    return True, "", plan
+
+
+def _sniff_delimiter(header_line: str) -> str:
+    """Detect the field delimiter from the header line, defaulting to a comma."""
+    try:
+        return csv.Sniffer().sniff(header_line, delimiters=",;\t|").delimiter
+    except csv.Error:
+        return ","
+
+
+def parse_csv_file(file_content: str, plan: Optional[dict] = None) -> pd.DataFrame:
     """
     Parse a CSV file into a pandas DataFrame.
     
     Args:
         file_content: The content of the CSV file as a string
+        plan: Optional parse plan returned by sniff_csv_plan
     
     Returns:
         pandas DataFrame containing the CSV data
@@ -56,13 +209,81 @@ def parse_csv_file(file_content: str) -> pd.DataFrame:
     Raises:
         ValueError: If file cannot be parsed as CSV
     """
+    read_options = {}
+    if plan:
+        # Integer columns are left to inference so missing values stay NaN
+        pandas_types = {"float": "float64", "string": "object"}
+        read_options["sep"] = plan["delimiter"]
+        read_options["dtype"] = {
+            column: pandas_types[dtype]
+            for column, dtype in plan["dtypes"].items()
+            if dtype in pandas_types
+        }
+    
     try:
-        df = pd.read_csv(StringIO(file_content))
+        df = pd.read_csv(StringIO(file_content), **read_options)
         return df
     except Exception as e:
         raise ValueError(f"Failed to parse CSV file: {str(e)}")
 
 
+@contextmanager
+def spooled_upload(file_obj: BinaryIO, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Iterator[Path]:
+    """
+    Spool an uploaded file to a temporary CSV file on disk.
+    
+    The upload is copied in fixed-size chunks so that it is never decoded or
+    duplicated in memory; the resulting path can be handed directly to
+    DuckDB's native CSV reader. The temporary file is removed on exit.
+    
+    Args:
+        file_obj: Binary file-like object (e.g. a Streamlit UploadedFile)
+        chunk_size: Number of bytes copied per chunk
+    
+    Yields:
+        Path to the temporary CSV file
+    """
+    if hasattr(file_obj, "seek"):
+        file_obj.seek(0)
+    
+    fd, tmp_name = tempfile.mkstemp(suffix=".csv")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            shutil.copyfileobj(file_obj, tmp_file, chunk_size)
+        yield Path(tmp_name)
+    finally:
+        try:
+            os.remove(tmp_name)
+        except OSError:
+            pass
+
+
+def compute_fingerprint(file_obj: BinaryIO, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """
+    Compute a content hash identifying an uploaded file.
+    
+    The file is hashed in chunks and rewound afterwards so it can still be read.
+    
+    Args:
+        file_obj: Binary file-like object (e.g. a Streamlit UploadedFile)
+        chunk_size: Number of bytes hashed per chunk
+    
+    Returns:
+        Hex-encoded SHA-256 digest of the file content
+    """
+    if hasattr(file_obj, "seek"):
+        file_obj.seek(0)
+    
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file_obj.read(chunk_size), b""):
+        digest.update(chunk)
+    
+    if hasattr(file_obj, "seek"):
+        file_obj.seek(0)
+    
+    return digest.hexdigest()
+
+
 def get_file_info(df: pd.DataFrame) -> dict:
     """
     Get metadata about a DataFrame (parsed from CSV).
@@ -99,6 +320,34 @@ def normalize_column_names(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def validate_table_columns(column_types: Dict[str, str], required_columns: List[str],
+                           expected_types: Optional[Dict[str, str]] = None) -> Tuple[bool, str]:
+    """
+    Validate the columns of an ingested table, e.g. a dataset shared between uploads.
+    
+    Args:
+        column_types: Mapping of the table's column names to DuckDB type names
+        required_columns: List of required column names
+        expected_types: Optional mapping of column names to "numeric"
+    
+    Returns:
+        Tuple of (is_valid, error_message)
+    """
+    is_valid, error_msg = _check_required_columns(list(column_types), required_columns)
+    if not is_valid:
+        return False, error_msg
+    
+    types_by_lower = {col.lower(): (col, col_type) for col, col_type in column_types.items()}
+    for column, expected_type in (expected_types or {}).items():
+        if column.lower() not in types_by_lower or expected_type != "numeric":
+            continue
+        actual, column_type = types_by_lower[column.lower()]
+        if column_type.split("(")[0].upper() not in NUMERIC_TABLE_TYPES:
+            return False, f"Column '{actual}' contains non-numeric values"
+    
+    return True, ""
+
+
 def validate_data_types(df: pd.DataFrame, expected_types: dict) -> Tuple[bool, List[str]]:
     """
     Validate that DataFrame columns have expected data types.
@@ -154,16 +403,19 @@ def handle_encoding_error(file_bytes: bytes) -> str:
     Raises:
         FileEncodingError: If file cannot be decoded with any supported encoding
     """
-    encodings = ["utf-8", "latin-1", "iso-8859-1", "cp1252"]
-    
-    for encoding in encodings:
+    return _decode_with_fallback(file_bytes)[0]
+
+
+def _decode_with_fallback(file_bytes: bytes) -> Tuple[str, str]:
+    """Decode bytes with the first supported encoding that works."""
+    for encoding in SUPPORTED_ENCODINGS:
         try:
-            return file_bytes.decode(encoding)
+            return file_bytes.decode(encoding), encoding
         except (UnicodeDecodeError, AttributeError):
             continue
     
     raise FileEncodingError(
-        f"Could not decode file with any supported encoding: {', '.join(encodings)}"
+        f"Could not decode file with any supported encoding: {', '.join(SUPPORTED_ENCODINGS)}"
     )
 
 
@@ -6,6 +6,8 @@ and retrieve available filter options.
 """
 
 from typing import Dict, List, Any, Optional, Tuple
+import numpy as np
+import pandas as pd
 from database_manager import DatabaseManager
 
 
@@ -47,7 +49,7 @@ class FilterEngine:
             
             if isinstance(value, list) and len(value) > 0:
                 # Handle list of values (IN clause)
-                values_str = ", ".join([f"'{v}'" if isinstance(v, str) else str(v) for v in value])
+                values_str = ", ".join([_quote_string(v) if isinstance(v, str) else str(v) for v in value])
                 conditions.append(f"{key} IN ({values_str})")
             
             elif isinstance(value, tuple) and len(value) == 2:
@@ -56,7 +58,7 @@ class FilterEngine:
             
             elif isinstance(value, str):
                 # Handle single string value
-                conditions.append(f"{key} = '{value}'")
+                conditions.append(f"{key} = {_quote_string(value)}")
             
             elif isinstance(value, (int, float)):
                 # Handle single numeric value
@@ -68,6 +70,53 @@ class FilterEngine:
         
         return " AND ".join(conditions) if conditions else ""
     
+    def compile_filters(self, filters: Dict[str, Any],
+                        available_columns: Optional[List[str]] = None) -> Tuple[str, List[Any]]:
+        """
+        Compile filter specifications into a parameterized WHERE clause.
+        
+        Values are never spliced into the SQL: the clause only depends on which
+        filters are set and their shape, so every state of a slider or
+        selectbox produces the same SQL text and only the parameters change.
+        
+        Args:
+            filters: Dictionary of filter specifications (see build_filter_query)
+            available_columns: Optional list of the table's columns; filters on
+                               other columns are skipped, and names are matched
+                               case-insensitively
+        
+        Returns:
+            Tuple of (where_clause, params)
+            - where_clause: Conditions with ? placeholders (without "WHERE"),
+              or an empty string if no filter applies
+            - params: Values to bind to the placeholders, in order
+        """
+        conditions = []
+        params = []
+        
+        for key, value in (filters or {}).items():
+            if value is None:
+                continue
+            
+            column = _resolve_column(key, available_columns)
+            if column is None:
+                continue
+            
+            if isinstance(value, list) and len(value) > 0:
+                placeholders = ", ".join(["?"] * len(value))
+                conditions.append(f'"{column}" IN ({placeholders})')
+                params.extend(value)
+            
+            elif isinstance(value, tuple) and len(value) == 2:
+                conditions.append(f'"{column}" BETWEEN ? AND ?')
+                params.extend(value)
+            
+            elif isinstance(value, (str, int, float, bool)):
+                conditions.append(f'"{column}" = ?')
+                params.append(value)
+        
+        return " AND ".join(conditions), params
+    
     def apply_filters(self, base_query: str, filters: Dict[str, Any]) -> str:
         """
         Apply filters to a SQL query.
@@ -94,6 +143,9 @@ class FilterEngine:
         """
         Get available values for a column to use in filters.
         
+        Values are read from the table's facets (see DatabaseManager.get_facets)
+        when they are counted there, so no query runs.
+        
         Args:
             table_name: Name of the table
             column_name: Name of the column
@@ -104,6 +156,10 @@ class FilterEngine:
         Raises:
             RuntimeError: If query fails
         """
+        facet = self._get_column_facet(table_name, column_name)
+        if facet is not None and "values" in facet:
+            return sorted(facet["values"])
+        
         try:
             query = f"SELECT DISTINCT {column_name} FROM {table_name} ORDER BY {column_name}"
             result = self.db_manager.execute_query(query)
@@ -111,10 +167,122 @@ class FilterEngine:
         except Exception as e:
             raise RuntimeError(f"Failed to get filter options for {column_name}: {str(e)}")
     
+    def get_value_counts(self, table_name: str, column_name: str) -> Dict[Any, int]:
+        """
+        Get the number of rows holding each value of a column.
+        
+        Args:
+            table_name: Name of the table
+            column_name: Name of the column
+        
+        Returns:
+            Dictionary mapping each non-null value to its row count
+        
+        Raises:
+            RuntimeError: If query fails
+        """
+        facet = self._get_column_facet(table_name, column_name)
+        if facet is not None and "values" in facet:
+            return dict(sorted(facet["values"].items()))
+        
+        try:
+            query = (
+                f"SELECT {column_name} AS value, COUNT(*) AS count FROM {table_name} "
+                f"WHERE {column_name} IS NOT NULL GROUP BY {column_name} ORDER BY {column_name}"
+            )
+            result = self.db_manager.execute_query(query)
+            return dict(zip(result["value"].tolist(), result["count"].tolist()))
+        except Exception as e:
+            raise RuntimeError(f"Failed to get value counts for {column_name}: {str(e)}")
+    
+    def get_facet_counts(self, table_name: str, dimensions: List[str],
+                         filters: Optional[Dict[str, Any]] = None,
+                         available_columns: Optional[List[str]] = None) -> Dict[str, Dict[Any, int]]:
+        """
+        Count the rows matching each option of each filter dimension.
+        
+        A dimension's counts apply every active filter except the dimension's
+        own, so they tell how many rows remain if that option is picked next.
+        All dimensions are counted in a single scan: each gets a grouping set
+        and a COUNT(*) FILTER clause holding the other dimensions' filters.
+        
+        Args:
+            table_name: Name of the table
+            dimensions: Columns whose options are counted
+            filters: Active filter specifications (see build_filter_query)
+            available_columns: Optional list of the table's columns (see compile_filters)
+        
+        Returns:
+            Dictionary mapping each dimension to a dictionary of option to
+            row count; options known from the table's facets but matching no
+            rows have a count of 0
+        
+        Raises:
+            RuntimeError: If query fails
+        """
+        if not dimensions:
+            return {}
+        
+        filters = filters or {}
+        dimension_keys = {dim.lower() for dim in dimensions}
+        
+        # Filters on other columns restrict every dimension alike
+        shared_filters = {k: v for k, v in filters.items() if k.lower() not in dimension_keys}
+        where_clause, where_params = self.compile_filters(shared_filters, available_columns)
+        
+        selects = [f'"{dim}"' for dim in dimensions]
+        selects += [f'GROUPING("{dim}")' for dim in dimensions]
+        params = []
+        for dim in dimensions:
+            other_filters = {
+                k: v for k, v in filters.items()
+                if k.lower() in dimension_keys and k.lower() != dim.lower()
+            }
+            condition, condition_params = self.compile_filters(other_filters, available_columns)
+            if condition:
+                selects.append(f"COUNT(*) FILTER (WHERE {condition})")
+                params.extend(condition_params)
+            else:
+                selects.append("COUNT(*)")
+        
+        query = f"SELECT {', '.join(selects)} FROM {table_name}"
+        if where_clause:
+            query += f" WHERE {where_clause}"
+            params.extend(where_params)
+        grouping_sets = ", ".join(f'("{dim}")' for dim in dimensions)
+        query += f" GROUP BY GROUPING SETS ({grouping_sets})"
+        
+        try:
+            result = self.db_manager.execute_query(query, result_format="numpy", params=params)
+        except Exception as e:
+            raise RuntimeError(f"Failed to get facet counts for {table_name}: {str(e)}")
+        
+        counts = {}
+        for dim in dimensions:
+            facet = self._get_column_facet(table_name, dim)
+            counts[dim] = dict.fromkeys(sorted(facet["values"]), 0) if facet and "values" in facet else {}
+        
+        columns = list(result.values())
+        dimension_values = columns[:len(dimensions)]
+        groupings = columns[len(dimensions):2 * len(dimensions)]
+        dimension_counts = columns[2 * len(dimensions):]
+        
+        for row in range(len(dimension_values[0])):
+            for i, dim in enumerate(dimensions):
+                if groupings[i][row] == 0:
+                    value = dimension_values[i][row]
+                    if not pd.isna(value):
+                        counts[dim][_to_python(value)] = int(dimension_counts[i][row])
+                    break
+        
+        return counts
+    
     def get_column_range(self, table_name: str, column_name: str) -> Tuple[float, float]:
         """
         Get min and max values for a numeric column.
         
+        The range is read from the table's facets when they hold it.
+        
         Args:
             table_name: Name of the table
             column_name: Name of the numeric column
@@ -125,6 +293,10 @@ class FilterEngine:
         Raises:
             RuntimeError: If query fails
         """
+        facet = self._get_column_facet(table_name, column_name)
+        if facet is not None and facet.get("min") is not None:
+            return (float(facet["min"]), float(facet["max"]))
+        
         try:
             query = f"SELECT MIN({column_name}) as min_val, MAX({column_name}) as max_val FROM {table_name}"
             result = self.db_manager.execute_query(query)
@@ -134,6 +306,14 @@ class FilterEngine:
         except Exception as e:
             raise RuntimeError(f"Failed to get range for {column_name}: {str(e)}")
     
+    def _get_column_facet(self, table_name: str, column_name: str) -> Optional[dict]:
+        """Get the facet of a column from the table's facets, or None if there is none."""
+        facets = self.db_manager.get_facets(table_name)
+        if facets is None:
+            return None
+        column = _resolve_column(column_name, list(facets["columns"]))
+        return facets["columns"].get(column) if column else None
+    
     def validate_filters(self, filters: Dict[str, Any]) -> Tuple[bool, List[str]]:
         """
         Validate filter specifications.
@@ -169,4 +349,26 @@ class FilterEngine:
         Returns:
             Empty filter dictionary
         """
-        return {}
\ No newline at end of file
+        return {}
+
+
+def _resolve_column(key: str, available_columns: Optional[List[str]]) -> Optional[str]:
+    """Find the actual name of a filtered column, or None if the table lacks it."""
+    if not available_columns:
+        return key
+    
+    for column in available_columns:
+        if column.lower() == key.lower():
+            return column
+    return None
+
+
+def _quote_string(value: str) -> str:
+    """Quote a string as a SQL literal, escaping embedded quotes."""
+    escaped = value.replace("'", "''")
+    return f"'{escaped}'"
+
+
+def _to_python(value: Any) -> Any:
+    """Convert a NumPy scalar to the equivalent Python value."""
+    return value.item() if isinstance(value, np.generic) else value
@@ -4,75 +4,540 @@ KPI Calculator module for computing key performance indicators.
 This module provides functions to calculate various KPIs from student performance data.
 """
 
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import math
 import pandas as pd
 import numpy as np
+from bitmap_index import BitmapIndex
 from database_manager import DatabaseManager
 from filter_engine import FilterEngine
+from kpi_planner import KPI_SOURCES, KPIPlanner
+from olap_cube import OLAPCube
+from statistics_engine import (
+    CONFIDENCE_Z, STATISTICS, GroupStatistics, compute_statistics, fit_intervals, fit_line,
+    get_statistics_sql
+)
+from subset_cache import SubsetCache
+
+
+# Quantiles of the exam score distribution KPI (5), by result column
+SCORE_QUANTILES = {"p10": 0.1, "p25": 0.25, "p50": 0.5, "p75": 0.75, "p90": 0.9}
+
+# SQL for each KPI over the filtered rows ("filtered", with the KPI_SOURCES
+# column names): the columns it reads, and a SELECT giving the common columns
+# grp, x, y and count (and sd, the standard deviation of y, for averages) so
+# that several KPIs can be combined with UNION ALL
+KPI_QUERIES = {
+    "kpi_1": (
+        ["gender", "exam_score"],
+        "SELECT gender AS grp, NULL AS x, AVG(exam_score) AS y, COUNT(*) AS count, "
+        "STDDEV_SAMP(exam_score) AS sd FROM filtered GROUP BY gender"
+    ),
+    "kpi_2": (
+        ["study_hours", "exam_score"],
+        "SELECT NULL AS grp, study_hours AS x, exam_score AS y, NULL AS count "
+        "FROM filtered WHERE study_hours IS NOT NULL AND exam_score IS NOT NULL"
+    ),
+    "kpi_3": (
+        ["attendance", "exam_score"],
+        "SELECT NULL AS grp, ROUND(attendance / 10) * 10 AS x, AVG(exam_score) AS y, COUNT(*) AS count, "
+        "STDDEV_SAMP(exam_score) AS sd FROM filtered WHERE attendance IS NOT NULL AND exam_score IS NOT NULL "
+        "GROUP BY ROUND(attendance / 10) * 10"
+    ),
+    "kpi_4": (
+        ["sleep_hours", "exam_score"],
+        "SELECT NULL AS grp, sleep_hours AS x, exam_score AS y, NULL AS count "
+        "FROM filtered WHERE sleep_hours IS NOT NULL AND exam_score IS NOT NULL"
+    ),
+    "kpi_5": (
+        ["gender", "exam_score"],
+        "SELECT gender AS grp, COUNT(*) AS count, "
+        + ", ".join(
+            f"QUANTILE_CONT(exam_score, {probability}) AS {name}"
+            for name, probability in SCORE_QUANTILES.items()
+        )
+        + ", QUANTILE_CONT(exam_score, 0.75) - QUANTILE_CONT(exam_score, 0.25) AS iqr "
+        "FROM filtered WHERE exam_score IS NOT NULL GROUP BY gender"
+    )
+}
+
+# Result columns of each KPI (renamed from the common columns), and the column
+# and direction the result is sorted by
+KPI_RESULTS = {
+    "kpi_1": ({"grp": "group", "y": "average_score", "count": "count"}, "average_score", False),
+    "kpi_2": ({"x": "study_hours", "y": "exam_score"}, "study_hours", True),
+    "kpi_3": ({"x": "attendance_range", "y": "average_score", "count": "count"}, "attendance_range", True),
+    "kpi_4": ({"x": "sleep_hours", "y": "exam_score"}, "sleep_hours", True),
+    "kpi_5": (
+        {"grp": "group", "count": "count", "p10": "p10", "p25": "p25", "p50": "median",
+         "p75": "p75", "p90": "p90", "iqr": "iqr"},
+        "median", False
+    )
+}
+
+# Scatter KPIs, whose points are binned when there are too many to draw, with
+# the columns of their points
+SCATTER_KPIS = {
+    "kpi_2": ("study_hours", "exam_score"),
+    "kpi_4": ("sleep_hours", "exam_score")
+}
+
+# Scatter KPI query limited to max_points marks: up to that many points are
+# returned as they are, more are averaged per cell of a bins x bins grid over
+# their range, with the number of points per cell in count
+BINNED_PAIRS_QUERY = """
+WITH pairs AS (
+    SELECT {x} AS x, {y} AS y FROM filtered WHERE {x} IS NOT NULL AND {y} IS NOT NULL
+),
+bounds AS (
+    SELECT
+        COUNT(*) AS n,
+        MIN(x) AS min_x, NULLIF((MAX(x) - MIN(x)) / {bins}, 0) AS width_x,
+        MIN(y) AS min_y, NULLIF((MAX(y) - MIN(y)) / {bins}, 0) AS width_y
+    FROM pairs
+)
+SELECT NULL AS grp, x, y, NULL AS count FROM pairs, bounds WHERE n <= {max_points}
+UNION ALL
+SELECT NULL, AVG(x), AVG(y), COUNT(*) FROM pairs, bounds WHERE n > {max_points}
+GROUP BY
+    COALESCE(LEAST(FLOOR((x - min_x) / width_x), {bins} - 1), 0),
+    COALESCE(LEAST(FLOOR((y - min_y) / width_y), {bins} - 1), 0)
+"""
+
+# Rows sampled from the source tables for KPI estimates (see estimate_all),
+# and the seed keeping the sample the same across reruns
+SAMPLE_ROWS = 100000
+SAMPLE_SEED = 42
 
 
 class KPICalculator:
     """Calculates key performance indicators from student data."""
     
-    def __init__(self, db_manager: DatabaseManager, filters: Optional[Dict[str, Any]] = None):
+    def __init__(self, db_manager: DatabaseManager, filters: Optional[Dict[str, Any]] = None,
+                 bitmap_index: Optional[BitmapIndex] = None,
+                 subset_cache: Optional[SubsetCache] = None,
+                 olap_cube: Optional[OLAPCube] = None,
+                 max_points: Optional[int] = None,
+                 planner: Optional[KPIPlanner] = None,
+                 union_sources: bool = False):
         """
         Initialize KPI Calculator.
         
         Args:
             db_manager: DatabaseManager instance
             filters: Optional dictionary of active filters
+            bitmap_index: Optional bitmap index over student_habits_performance;
+                          while it is current, KPIs on that table are computed
+                          from it with NumPy instead of SQL
+            subset_cache: Optional cache of filtered subsets to share with
+                          other calculators (e.g. across reruns); by default
+                          the subsets are shared by this calculator's KPIs only
+            olap_cube: Optional cube over student_habits_performance; while it
+                       is current, KPIs 1 and 3 and the regression of KPIs 2
+                       and 4 are summed from its cells, and KPI 5 is merged
+                       from its quantile sketches, ahead of the bitmap index
+                       and SQL
+            max_points: Optional limit on the marks of the scatter KPIs (2
+                        and 4); beyond it their points are binned in SQL
+                        and the results get a count column
+            planner: Optional planner routing the KPIs to their source
+                     tables, to share its catalog with other calculators
+                     (e.g. across reruns)
+            union_sources: Whether each KPI is computed over every source
+                           table that has its columns rather than the
+                           preferred one; the cube and bitmap index, which
+                           cover one table, are then not used
+        
+        Raises:
+            ValueError: If max_points is less than 1
         """
+        if max_points is not None and max_points < 1:
+            raise ValueError("max_points must be at least 1")
+        
         self.db_manager = db_manager
         self.filter_engine = FilterEngine(db_manager)
         self.filters = filters or {}
+        self.bitmap_index = bitmap_index
+        self.subset_cache = subset_cache or SubsetCache(db_manager)
+        self.olap_cube = olap_cube
+        self.max_points = max_points
+        self.planner = planner or KPIPlanner(db_manager)
+        self.union_sources = union_sources
+    
+    def _calculate_from_index(self, compute: Callable[[BitmapIndex], pd.DataFrame]) -> Optional[pd.DataFrame]:
+        """Compute a KPI from the bitmap index, or return None to compute it with SQL."""
+        index = self.bitmap_index
+        if index is None or index.table_name != "student_habits_performance":
+            return None
+        if not index.is_current(self.db_manager):
+            return None
+        
+        try:
+            result = compute(index)
+        except (KeyError, ValueError):
+            # A filter or column the index doesn't cover
+            return None
+        return result if not result.empty else None
     
-    def _apply_filters_to_query(self, base_query: str, available_columns: list = None) -> str:
-        """Apply active filters to a query, only for columns that exist."""
-        if not self.filters:
-            return base_query
+    def _calculate_from_cube(self, kpi: str) -> Optional[pd.DataFrame]:
+        """Sum a KPI from the OLAP cube's cells, or return None when the cube can't serve it."""
+        cube = self.olap_cube
+        if cube is None or cube.table_name != "student_habits_performance" \
+                or kpi not in ("kpi_1", "kpi_3", "kpi_5"):
+            return None
+        if not cube.is_current(self.db_manager):
+            return None
         
-        # Build WHERE clause manually to handle range filters correctly
-        conditions = []
+        try:
+            if kpi == "kpi_1":
+                cells = cube.aggregate(self.filters, "gender")
+                result = pd.DataFrame({
+                    "group": cells["value"],
+                    "average_score": cells["sum"] / cells["count"].where(cells["count"] > 0),
+                    "count": cells["rows"]
+                })
+            elif kpi == "kpi_5":
+                quantiles = cube.quantiles(self.filters, "gender", list(SCORE_QUANTILES.values()))
+                result = quantiles.rename(columns={"value": "group", "p50": "median"})
+                result["iqr"] = result["p75"] - result["p25"]
+            else:
+                cells = cube.aggregate(self.filters, "attendance_bucket")
+                # KPI 3 skips rows without attendance or score
+                cells = cells[cells["value"].notna() & (cells["count"] > 0)]
+                result = pd.DataFrame({
+                    "attendance_range": cells["value"].astype(float),
+                    "average_score": cells["sum"] / cells["count"],
+                    "count": cells["count"]
+                })
+        except (KeyError, ValueError):
+            # A filter or dimension the cube doesn't cover
+            return None
         
-        for key, value in self.filters.items():
-            if value is None:
+        if result.empty:
+            return None
+        _, sort_column, ascending = KPI_RESULTS[kpi]
+        return result.sort_values(sort_column, ascending=ascending, kind="stable", ignore_index=True)
+    
+    def _get_cube_statistics(self, kpi: str) -> Optional[Dict[str, float]]:
+        """Get the regression statistics of a scatter KPI from the OLAP cube, or None when it can't give them."""
+        cube = self.olap_cube
+        if cube is None or cube.table_name != "student_habits_performance":
+            return None
+        if not cube.is_current(self.db_manager):
+            return None
+        
+        column = KPI_SOURCES[cube.table_name][SCATTER_KPIS[kpi][0]]
+        try:
+            return cube.regression(self.filters, column)
+        except (KeyError, ValueError):
+            return None
+    
+    def _calculate_precomputed(self, kpi: str, tables: List[str]) -> Optional[pd.DataFrame]:
+        """Compute a KPI routed to tables from the cube or the bitmap index, or return None to compute it with SQL."""
+        # Both cover the habits table only
+        if tables != ["student_habits_performance"]:
+            return None
+        result = self._calculate_from_cube(kpi)
+        # The index returns every point, so binned scatter KPIs are left to SQL
+        compute = self._index_computations.get(kpi)
+        if result is None and compute is not None and not (kpi in SCATTER_KPIS and self.max_points is not None):
+            result = self._calculate_from_index(compute)
+        return result
+    
+    def _get_kpi_query(self, kpi: str) -> str:
+        """Get the SQL of a KPI over "filtered", binning scatter points beyond max_points."""
+        if kpi in SCATTER_KPIS and self.max_points is not None:
+            source_columns = KPI_QUERIES[kpi][0]
+            return BINNED_PAIRS_QUERY.format(
+                x=source_columns[0], y=source_columns[1], max_points=self.max_points,
+                bins=max(1, math.isqrt(self.max_points))
+            )
+        return KPI_QUERIES[kpi][1]
+    
+    def _query_kpis(self, kpis: List[str], routes: Dict[str, List[str]],
+                    sample_rows: Optional[int] = None) -> Dict[str, pd.DataFrame]:
+        """
+        Compute KPIs with SQL, reading the filtered data once per set of source tables.
+        
+        The KPI queries are combined with UNION ALL over a materialized CTE of
+        the filtered subset, so the subset is scanned once however many KPIs
+        are requested; the regression statistics of scatter KPIs are computed
+        in the same query. KPIs routed to several tables read the union of
+        their subsets.
+        
+        Args:
+            kpis: Names of KPI_QUERIES to compute
+            routes: Source tables of each KPI (see KPIPlanner.route)
+            sample_rows: Optional number of rows to sample from tables
+                         larger than that, instead of reading every
+                         filtered row; results over a sample get
+                         attrs["sample_fraction"]
+        
+        Returns:
+            Dictionary of KPI name to result DataFrame, empty for KPIs no
+            table can answer
+        """
+        groups: Dict[Tuple[str, ...], List[str]] = {}
+        for kpi in kpis:
+            groups.setdefault(tuple(routes[kpi]), []).append(kpi)
+        
+        results = {}
+        for tables, group in groups.items():
+            if not tables:
+                for kpi in group:
+                    results[kpi] = _format_kpi_result(kpi, pd.DataFrame(columns=["grp", "x", "y", "count"]))
                 continue
             
-            # Skip filters for columns that don't exist in this table
-            # Check both lowercase and mixed-case versions
-            if available_columns:
-                key_found = False
-                actual_key = key
-                for col in available_columns:
-                    if col.lower() == key.lower():
-                        key_found = True
-                        actual_key = col
-                        break
-                if not key_found:
-                    continue
+            sampled = None
+            if sample_rows is not None:
+                total_rows = self._get_row_count(tables)
+                if total_rows > sample_rows:
+                    sampled = self._query_group(group, tables, sample_rows / total_rows, total_rows)
+            # A sample too small to hold any row gives no estimate
+            results.update(sampled or self._query_group(group, tables))
+        return results
+    
+    def _query_group(self, kpis: List[str], tables: Tuple[str, ...], fraction: float = 1.0,
+                     total_rows: int = 0) -> Optional[Dict[str, pd.DataFrame]]:
+        """
+        Compute KPIs over the filtered rows of tables in one query (see _query_kpis).
+        
+        With a fraction below 1, the rows are a random sample of about that
+        fraction of the tables' total_rows rows, and None is returned if the
+        sample is empty.
+        """
+        sources, params = [], []
+        for table_name in tables:
+            if fraction < 1.0:
+                query, table_params = self._get_sample_query(table_name, fraction)
+                sources.append(query)
+                params += table_params
             else:
-                actual_key = key
-            
-            if key == "age" and isinstance(value, tuple) and len(value) == 2:
-                # Handle age range
-                conditions.append(f'"{actual_key}" BETWEEN {value[0]} AND {value[1]}')
-            elif isinstance(value, str):
-                # Handle string values
-                conditions.append(f'"{actual_key}" = \'{value}\'')
-            elif isinstance(value, (int, float)):
-                # Handle numeric values
-                conditions.append(f'"{actual_key}" = {value}')
-        
-        if not conditions:
-            return base_query
-        
-        where_clause = " AND ".join(conditions)
-        
-        # Check if query already has WHERE clause
-        if "WHERE" in base_query.upper():
-            return f"{base_query} AND {where_clause}"
+                subset = self.subset_cache.get_subset(
+                    table_name, self.planner.get_columns(table_name), self.filters
+                )
+                sources.append(f"SELECT * FROM {subset}")
+        
+        branches = [
+            f"SELECT '{kpi}' AS kpi, * FROM ({self._get_kpi_query(kpi)})" for kpi in kpis
+        ]
+        # Regression statistics of the scatter KPIs, from the cube or the same scan
+        cube_statistics = {}
+        if tables == ("student_habits_performance",) and fraction == 1.0:
+            for kpi in kpis:
+                statistics = self._get_cube_statistics(kpi) if kpi in SCATTER_KPIS else None
+                if statistics is not None:
+                    cube_statistics[kpi] = statistics
+        branches += [
+            f"SELECT '{kpi}_fit' AS kpi, {get_statistics_sql(*KPI_QUERIES[kpi][0])} FROM filtered"
+            for kpi in kpis if kpi in SCATTER_KPIS and kpi not in cube_statistics
+        ]
+        
+        if fraction < 1.0:
+            # Sampled rows are filtered afterwards, so the same query counts
+            # them and the actual sample fraction is known
+            ctes = (
+                f"WITH sampled AS MATERIALIZED ({' UNION ALL BY NAME '.join(sources)}), "
+                "filtered AS MATERIALIZED (SELECT * EXCLUDE (__match) FROM sampled WHERE __match) "
+            )
+            branches.append("SELECT '__sampled' AS kpi, COUNT(*) AS count FROM sampled")
         else:
-            return f"{base_query} WHERE {where_clause}"
+            ctes = f"WITH filtered AS MATERIALIZED ({' UNION ALL BY NAME '.join(sources)}) "
+        combined = self.db_manager.execute_query(
+            ctes + " UNION ALL BY NAME ".join(branches), params=params
+        )
+        
+        if fraction < 1.0:
+            sampled_rows = int(combined.loc[combined["kpi"] == "__sampled", "count"].iloc[0])
+            if sampled_rows == 0:
+                return None
+            fraction = min(1.0, sampled_rows / total_rows)
+        
+        results = {}
+        for kpi in kpis:
+            rows = combined[combined["kpi"] == kpi]
+            if fraction < 1.0:
+                result = _format_kpi_result(kpi, rows, fraction)
+                result.attrs["sample_fraction"] = fraction
+            else:
+                result = _format_kpi_result(kpi, rows)
+            if kpi in cube_statistics:
+                result.attrs["statistics"] = cube_statistics[kpi]
+            elif kpi in SCATTER_KPIS:
+                statistics = combined[combined["kpi"] == f"{kpi}_fit"].iloc[0]
+                result.attrs["statistics"] = {name: float(statistics[name]) for name in STATISTICS}
+            results[kpi] = result
+        return results
+    
+    def _get_row_count(self, tables: Tuple[str, ...]) -> int:
+        """Count the rows of tables together."""
+        return sum(
+            int(self.db_manager.execute_query(f"SELECT COUNT(*) AS n FROM {table_name}")["n"][0])
+            for table_name in tables
+        )
+    
+    def _get_sample_query(self, table_name: str, fraction: float) -> Tuple[str, List[Any]]:
+        """
+        Get the SQL and parameters of a random sample of about fraction of a
+        table's rows, with whether each matches the filters in __match.
+        """
+        columns = self.planner.get_columns(table_name)
+        where_clause, params = self.filter_engine.compile_filters(self.filters, list(columns.values()))
+        select_list = ", ".join(f'"{column}" AS "{alias}"' for alias, column in columns.items())
+        match = f"COALESCE(({where_clause}), FALSE)" if where_clause else "TRUE"
+        # System sampling picks whole vectors of rows, skipping the others unread
+        query = (
+            f"SELECT {select_list}, {match} AS __match FROM {table_name} "
+            f"TABLESAMPLE {fraction * 100:.6f}% (system, {SAMPLE_SEED})"
+        )
+        return query, params
+    
+    def calculate_all(self) -> Dict[str, pd.DataFrame]:
+        """
+        Calculate all five KPIs from one pass over the filtered data.
+        
+        KPIs the OLAP cube or the bitmap index can serve are computed from
+        them; the rest share a single SQL query per set of source tables
+        (see KPIPlanner).
+        
+        Returns:
+            Dictionary with keys kpi_1 to kpi_5, holding the results of the
+            calculate_kpi_* methods in order
+        
+        Raises:
+            RuntimeError: If calculation fails
+        """
+        try:
+            return self._calculate_kpis(list(KPI_QUERIES))
+        except Exception as e:
+            raise RuntimeError(f"Failed to calculate KPIs: {str(e)}")
+    
+    def estimate_all(self, sample_rows: int = SAMPLE_ROWS) -> Dict[str, pd.DataFrame]:
+        """
+        Estimate all five KPIs from a random sample of the source tables.
+        
+        Source tables with more than sample_rows rows are sampled with
+        TABLESAMPLE, so the estimate takes about as long whatever the size of
+        the tables; KPIs the cube or bitmap index serve, and KPIs over smaller
+        tables, are exact. Estimated results carry attrs["sample_fraction"]:
+        KPIs 1 and 3 get average_score_low and average_score_high columns
+        bounding the 95% confidence interval of each average and counts
+        scaled to the whole table, and the scatter KPIs get slope_low,
+        slope_high, r_low and r_high in attrs["fit"] (see
+        statistics_engine.fit_intervals) and an estimated point_count.
+        
+        Args:
+            sample_rows: Approximate number of rows to sample; system sampling
+                         takes whole vectors of rows, so the actual number
+                         varies
+        
+        Returns:
+            Dictionary with keys kpi_1 to kpi_5, like calculate_all
+        
+        Raises:
+            ValueError: If sample_rows is less than 1
+            RuntimeError: If calculation fails
+        """
+        if sample_rows < 1:
+            raise ValueError("sample_rows must be at least 1")
+        try:
+            return self._calculate_kpis(list(KPI_QUERIES), sample_rows)
+        except Exception as e:
+            raise RuntimeError(f"Failed to estimate KPIs: {str(e)}")
+    
+    def calculate_progressive(self, sample_rows: int = SAMPLE_ROWS) -> Iterator[Dict[str, pd.DataFrame]]:
+        """
+        Calculate all five KPIs progressively: first estimated, then exact.
+        
+        The estimate (see estimate_all) is yielded first. The exact results
+        are then computed in a background thread while the caller shows the
+        estimate, and yielded when ready. When nothing needed sampling, the
+        estimate is exact and is the only result.
+        
+        Args:
+            sample_rows: Approximate number of rows to sample for the estimate
+        
+        Yields:
+            Dictionaries with keys kpi_1 to kpi_5, like calculate_all
+        
+        Raises:
+            ValueError: If sample_rows is less than 1
+            RuntimeError: If calculation fails
+        """
+        estimates = self.estimate_all(sample_rows)
+        if not any("sample_fraction" in result.attrs for result in estimates.values()):
+            yield estimates
+            return
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            exact = executor.submit(self.calculate_all)
+            yield estimates
+            yield exact.result()
+    
+    @property
+    def _index_computations(self) -> Dict[str, Callable[[BitmapIndex], pd.DataFrame]]:
+        """Computations of each KPI from the bitmap index."""
+        return {
+            "kpi_1": lambda index: index.group_mean(
+                self.filters, "gender", "exam_score"
+            ).rename(columns={"mean": "average_score"}).sort_values(
+                "average_score", ascending=False, ignore_index=True
+            ),
+            "kpi_2": lambda index: index.select_pairs(
+                self.filters, "study_hours_per_day", "exam_score"
+            ).rename(columns={"x": "study_hours", "y": "exam_score"}),
+            "kpi_3": lambda index: index.bucket_mean(
+                self.filters, "attendance_percentage", "exam_score", 10
+            ).rename(columns={"bucket": "attendance_range", "mean": "average_score"}),
+            "kpi_4": lambda index: index.select_pairs(
+                self.filters, "sleep_hours", "exam_score"
+            ).rename(columns={"x": "sleep_hours", "y": "exam_score"})
+        }
+    
+    def _calculate_kpis(self, kpis: List[str], sample_rows: Optional[int] = None) -> Dict[str, pd.DataFrame]:
+        """Calculate KPIs from the cube or the bitmap index, and with SQL (on a sample of sample_rows) where they can't serve them."""
+        filter_columns = [
+            column for column, value in self.filters.items()
+            if value is not None and not (isinstance(value, list) and len(value) == 0)
+        ]
+        routes = self.planner.route(
+            {kpi: KPI_QUERIES[kpi][0] for kpi in kpis}, union=self.union_sources,
+            filter_columns=filter_columns
+        )
+        results = {}
+        for kpi in kpis:
+            result = self._calculate_precomputed(kpi, routes[kpi])
+            if result is not None:
+                results[kpi] = result
+        
+        pending = [kpi for kpi in kpis if kpi not in results]
+        if pending:
+            results.update(self._query_kpis(pending, routes, sample_rows))
+        
+        for kpi in kpis:
+            if kpi in SCATTER_KPIS:
+                result = results[kpi]
+                if "statistics" not in result.attrs:
+                    # Computed from the index, which returned every point
+                    x_column, y_column = (KPI_RESULTS[kpi][0][column] for column in ("x", "y"))
+                    result.attrs["statistics"] = (
+                        self._get_cube_statistics(kpi)
+                        or compute_statistics(result[x_column], result[y_column])
+                    )
+                result.attrs["fit"] = fit_line(result.attrs["statistics"])
+                # Exact number of points, whether or not they were binned
+                result.attrs["point_count"] = int(result.attrs["statistics"]["n"])
+                fraction = result.attrs.get("sample_fraction")
+                if fraction is not None:
+                    # Sampled points: estimate the total and bound the fit
+                    result.attrs["point_count"] = int(round(result.attrs["statistics"]["n"] / fraction))
+                    result.attrs["fit"].update(fit_intervals(result.attrs["statistics"], fraction))
+        return {kpi: results[kpi] for kpi in kpis}
+    
+    def _calculate_kpi(self, kpi: str) -> pd.DataFrame:
+        """Calculate one KPI (see _calculate_kpis)."""
+        return self._calculate_kpis([kpi])[kpi]
     
     def calculate_kpi_1_scores_by_group(self) -> pd.DataFrame:
         """
@@ -85,36 +550,7 @@ class KPICalculator:
             RuntimeError: If calculation fails
         """
         try:
-            # Try to use student_habits_performance table
-            available_cols_habits = ["age", "gender", "parental_education_level", "exam_score"]
-            query = """
-            SELECT 
-                gender as group,
-                AVG(exam_score) as average_score,
-                COUNT(*) as count
-            FROM student_habits_performance
-            """
-            
-            query = self._apply_filters_to_query(query, available_cols_habits)
-            query += " GROUP BY gender ORDER BY average_score DESC"
-            
-            result = self.db_manager.execute_query(query)
-            
-            if result.empty:
-                # Fallback to student_performance_factors (note: capital letters in column names)
-                available_cols_factors = ["Gender", "Parental_Education_Level", "Exam_Score"]
-                query = """
-                SELECT 
-                    "Gender" as group,
-                    AVG("Exam_Score") as average_score,
-                    COUNT(*) as count
-                FROM student_performance_factors
-                """
-                query = self._apply_filters_to_query(query, available_cols_factors)
-                query += ' GROUP BY "Gender" ORDER BY average_score DESC'
-                result = self.db_manager.execute_query(query)
-            
-            return result
+            return self._calculate_kpi("kpi_1")
         except Exception as e:
             raise RuntimeError(f"Failed to calculate KPI 1: {str(e)}")
     
@@ -123,43 +559,17 @@ class KPICalculator:
         Calculate correlation between study hours and exam performance.
         
         Returns:
-            DataFrame with study_hours and exam_score columns
+            DataFrame with study_hours and exam_score columns, plus count
+            when the points are binned (see max_points); attrs["point_count"]
+            holds the number of points, attrs["statistics"] their sufficient
+            statistics and attrs["fit"] the regression line and correlation
+            (see statistics_engine.fit_line), exact even when binned
         
         Raises:
             RuntimeError: If calculation fails
         """
         try:
-            # Try student_habits_performance first
-            available_cols_habits = ["age", "gender", "parental_education_level", "study_hours_per_day", "exam_score"]
-            query = """
-            SELECT 
-                study_hours_per_day as study_hours,
-                exam_score
-            FROM student_habits_performance
-            WHERE study_hours_per_day IS NOT NULL 
-                AND exam_score IS NOT NULL
-            """
-            
-            query = self._apply_filters_to_query(query, available_cols_habits)
-            query += " ORDER BY study_hours_per_day"
-            result = self.db_manager.execute_query(query)
-            
-            if result.empty:
-                # Fallback to student_performance_factors (note: capital letters in column names)
-                available_cols_factors = ["Gender", "Parental_Education_Level", "Hours_Studied", "Exam_Score"]
-                query = """
-                SELECT 
-                    "Hours_Studied" as study_hours,
-                    "Exam_Score" as exam_score
-                FROM student_performance_factors
-                WHERE "Hours_Studied" IS NOT NULL 
-                    AND "Exam_Score" IS NOT NULL
-                """
-                query = self._apply_filters_to_query(query, available_cols_factors)
-                query += " ORDER BY \"Hours_Studied\""
-                result = self.db_manager.execute_query(query)
-            
-            return result
+            return self._calculate_kpi("kpi_2")
         except Exception as e:
             raise RuntimeError(f"Failed to calculate KPI 2: {str(e)}")
     
@@ -174,39 +584,7 @@ class KPICalculator:
             RuntimeError: If calculation fails
         """
         try:
-            # Try student_habits_performance first
-            available_cols_habits = ["age", "gender", "parental_education_level", "attendance_percentage", "exam_score"]
-            query = """
-            SELECT 
-                ROUND(attendance_percentage / 10) * 10 as attendance_range,
-                AVG(exam_score) as average_score,
-                COUNT(*) as count
-            FROM student_habits_performance
-            WHERE attendance_percentage IS NOT NULL 
-                AND exam_score IS NOT NULL
-            """
-            
-            query = self._apply_filters_to_query(query, available_cols_habits)
-            query += " GROUP BY ROUND(attendance_percentage / 10) * 10 ORDER BY attendance_range"
-            result = self.db_manager.execute_query(query)
-            
-            if result.empty:
-                # Fallback to student_performance_factors (note: capital letters in column names)
-                available_cols_factors = ["Gender", "Parental_Education_Level", "Attendance", "Exam_Score"]
-                query = """
-                SELECT 
-                    ROUND("Attendance" / 10) * 10 as attendance_range,
-                    AVG("Exam_Score") as average_score,
-                    COUNT(*) as count
-                FROM student_performance_factors
-                WHERE "Attendance" IS NOT NULL 
-                    AND "Exam_Score" IS NOT NULL
-                """
-                query = self._apply_filters_to_query(query, available_cols_factors)
-                query += ' GROUP BY ROUND("Attendance" / 10) * 10 ORDER BY attendance_range'
-                result = self.db_manager.execute_query(query)
-            
-            return result
+            return self._calculate_kpi("kpi_3")
         except Exception as e:
             raise RuntimeError(f"Failed to calculate KPI 3: {str(e)}")
     
@@ -215,61 +593,84 @@ class KPICalculator:
         Calculate relationship between sleep hours and academic performance.
         
         Returns:
-            DataFrame with sleep_hours and exam_score columns
+            DataFrame with sleep_hours and exam_score columns, plus count
+            when the points are binned (see max_points); attrs["point_count"]
+            holds the number of points, attrs["statistics"] their sufficient
+            statistics and attrs["fit"] the regression line and correlation
+            (see statistics_engine.fit_line), exact even when binned
         
         Raises:
             RuntimeError: If calculation fails
         """
         try:
-            # Try student_habits_performance first
-            available_cols_habits = ["age", "gender", "parental_education_level", "sleep_hours", "exam_score"]
-            query = """
-            SELECT 
-                sleep_hours,
-                exam_score
-            FROM student_habits_performance
-            WHERE sleep_hours IS NOT NULL 
-                AND exam_score IS NOT NULL
-            """
-            
-            query = self._apply_filters_to_query(query, available_cols_habits)
-            query += " ORDER BY sleep_hours"
-            result = self.db_manager.execute_query(query)
-            
-            if result.empty:
-                # Fallback to student_performance_factors (note: capital letters in column names)
-                available_cols_factors = ["Gender", "Parental_Education_Level", "Sleep_Hours", "Exam_Score"]
-                query = """
-                SELECT 
-                    "Sleep_Hours" as sleep_hours,
-                    "Exam_Score" as exam_score
-                FROM student_performance_factors
-                WHERE "Sleep_Hours" IS NOT NULL 
-                    AND "Exam_Score" IS NOT NULL
-                """
-                query = self._apply_filters_to_query(query, available_cols_factors)
-                query += " ORDER BY \"Sleep_Hours\""
-                result = self.db_manager.execute_query(query)
-            
-            return result
+            return self._calculate_kpi("kpi_4")
         except Exception as e:
             raise RuntimeError(f"Failed to calculate KPI 4: {str(e)}")
     
+    def calculate_kpi_5_score_distribution(self) -> pd.DataFrame:
+        """
+        Calculate the distribution of exam scores by demographic group.
+        
+        Quantiles come from merging the OLAP cube's sketches when it can
+        serve the filters, and are then approximate (see quantile_sketch);
+        otherwise they are computed exactly with SQL.
+        
+        Returns:
+            DataFrame with columns: group, count, p10, p25, median, p75,
+            p90, iqr
+        
+        Raises:
+            RuntimeError: If calculation fails
+        """
+        try:
+            return self._calculate_kpi("kpi_5")
+        except Exception as e:
+            raise RuntimeError(f"Failed to calculate KPI 5: {str(e)}")
+    
     def calculate_correlation_coefficient(self, x: pd.Series, y: pd.Series) -> float:
         """
         Calculate Pearson correlation coefficient between two series.
         
+        Scatter KPI results already carry it in attrs["fit"]["r"].
+        
         Args:
             x: First data series
             y: Second data series
         
         Returns:
-            Correlation coefficient (-1 to 1)
+            Correlation coefficient (-1 to 1), or 0.0 when it is undefined
+            (fewer than two pairs or a constant series)
+        """
+        r = fit_line(compute_statistics(x, y))["r"]
+        return 0.0 if np.isnan(r) else r
+    
+    def calculate_factor_statistics(self, group_column: str,
+                                    factors: Optional[List[str]] = None) -> pd.DataFrame:
         """
-        if len(x) < 2 or len(y) < 2:
-            return 0.0
+        Relate habit factors to exam scores within every group of a dimension.
+        
+        All groups and factors are computed in one grouped query over
+        student_habits_performance (see GroupStatistics.from_table).
+        
+        Args:
+            group_column: Column to group by (e.g. gender, parental_education_level, age)
+            factors: Habits columns to relate to exam_score; defaults to
+                     statistics_engine.FACTOR_COLUMNS
+        
+        Returns:
+            DataFrame with columns group, factor, n, mean_x, var_x, mean_y,
+            var_y, slope, intercept, r
         
-        return float(np.corrcoef(x, y)[0, 1])
+        Raises:
+            RuntimeError: If calculation fails
+        """
+        try:
+            return GroupStatistics.from_table(
+                self.db_manager, "student_habits_performance", group_column, factors,
+                filters=self.filters
+            ).to_frame()
+        except Exception as e:
+            raise RuntimeError(f"Failed to calculate factor statistics: {str(e)}")
     
     def update_filters(self, filters: Dict[str, Any]) -> None:
         """
@@ -279,3 +680,24 @@ class KPICalculator:
             filters: New filter dictionary
         """
         self.filters = filters
+
+
+def _format_kpi_result(kpi: str, rows: pd.DataFrame, fraction: Optional[float] = None) -> pd.DataFrame:
+    """Turn rows of a KPI query, over a sample of fraction of the rows if given, into the KPI's result columns and order."""
+    columns, sort_column, ascending = KPI_RESULTS[kpi]
+    if kpi in SCATTER_KPIS and rows["count"].notna().any():
+        # Binned points, weighted by the number of points per cell
+        columns = {**columns, "count": "count"}
+    if fraction is not None:
+        rows = rows.astype({"count": float})
+        if kpi not in SCATTER_KPIS and "y" in columns:
+            # Confidence intervals of the sample averages
+            margin = CONFIDENCE_Z * rows["sd"].astype(float) / np.sqrt(rows["count"]) * math.sqrt(1.0 - fraction)
+            rows = rows.assign(y_low=rows["y"] - margin, y_high=rows["y"] + margin)
+            columns = {**columns, "y_low": f"{columns['y']}_low", "y_high": f"{columns['y']}_high"}
+        # Counts of the sample, scaled to the whole table
+        rows = rows.assign(count=(rows["count"] / fraction).round())
+    result = rows[list(columns)].rename(columns=columns)
+    if "count" in columns:
+        result = result.astype({"count": "int64"})
+    return result.sort_values(sort_column, ascending=ascending, kind="stable", ignore_index=True)
@@ -0,0 +1,165 @@
+"""
+KPI Planner module for routing KPIs to the tables that can answer them.
+
+The KPIs read a fixed set of logical columns (gender, study hours, exam score,
+...) that the two datasets store under different names. The planner reads the
+catalog of the source tables once per data version, and knows which tables
+exist, hold rows and have each logical column, so that a KPI is sent
+straight to the table that can answer it instead of being tried on one table
+and retried on the next.
+
+A KPI can also be routed to every table that can answer it, to compute it
+over the union of both datasets.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import threading
+
+from database_manager import DatabaseManager
+
+
+# Tables KPIs are computed from, in order of preference, with the source column
+# behind each column name the KPI queries use. Filters apply to these columns.
+KPI_SOURCES = {
+    "student_habits_performance": {
+        "gender": "gender",
+        "age": "age",
+        "parental_education_level": "parental_education_level",
+        "study_hours": "study_hours_per_day",
+        "attendance": "attendance_percentage",
+        "sleep_hours": "sleep_hours",
+        "exam_score": "exam_score"
+    },
+    # Note: capital letters in column names
+    "student_performance_factors": {
+        "gender": "Gender",
+        "parental_education_level": "Parental_Education_Level",
+        "study_hours": "Hours_Studied",
+        "attendance": "Attendance",
+        "sleep_hours": "Sleep_Hours",
+        "exam_score": "Exam_Score"
+    }
+}
+
+
+class KPIPlanner:
+    """Routes KPIs to source tables from a catalog read once per data version."""
+
+    def __init__(self, db_manager: DatabaseManager,
+                 sources: Optional[Dict[str, Dict[str, str]]] = None):
+        """
+        Initialize the KPI planner.
+
+        Args:
+            db_manager: DatabaseManager holding the source tables
+            sources: Source tables in order of preference, with the source
+                     column behind each logical column; defaults to KPI_SOURCES
+        """
+        self.db_manager = db_manager
+        self.sources = sources or KPI_SOURCES
+        # Serializes catalog reads, so concurrent callers share one read
+        self._lock = threading.Lock()
+        self._catalog: Optional[Dict[str, Dict[str, str]]] = None
+        self._catalog_versions: Optional[Tuple[int, ...]] = None
+
+    def get_catalog(self) -> Dict[str, Dict[str, str]]:
+        """
+        Get the source tables that hold rows, with the logical columns they have.
+
+        The catalog is read on first use and again whenever one of the source
+        tables changes through the manager.
+
+        Returns:
+            Dictionary of table name to mapping of logical column names to the
+            table's actual column names, in order of preference; tables that
+            don't exist or are empty are left out
+
+        Raises:
+            RuntimeError: If the catalog cannot be read
+        """
+        versions = tuple(self.db_manager.get_table_version(table) for table in self.sources)
+        with self._lock:
+            if self._catalog is None or self._catalog_versions != versions:
+                self._catalog = self._read_catalog()
+                self._catalog_versions = versions
+            return self._catalog
+
+    def _read_catalog(self) -> Dict[str, Dict[str, str]]:
+        """Read the columns of the source tables and which of them hold rows."""
+        table_list = ", ".join(f"'{table}'" for table in self.sources)
+        # Covers views as well as tables, e.g. datasets bound from a shared store.
+        # The result cache can't tell when the catalog changes; the versions can.
+        columns = self.db_manager.execute_query(
+            "SELECT table_name, column_name FROM information_schema.columns "
+            f"WHERE table_schema = current_schema() AND table_name IN ({table_list})",
+            use_cache=False
+        )
+
+        catalog = {}
+        for table_name, mapping in self.sources.items():
+            table_columns = columns.loc[columns["table_name"] == table_name, "column_name"]
+            if table_columns.empty:
+                continue
+            if self.db_manager.execute_query(f"SELECT 1 FROM {table_name} LIMIT 1").empty:
+                continue
+            actual_names = {column.lower(): column for column in table_columns}
+            catalog[table_name] = {
+                alias: actual_names[column.lower()]
+                for alias, column in mapping.items() if column.lower() in actual_names
+            }
+        return catalog
+
+    def get_tables(self, columns: List[str]) -> List[str]:
+        """
+        Get the tables that have all the given logical columns.
+
+        Args:
+            columns: Logical column names (keys of the sources' mappings)
+
+        Returns:
+            Table names in order of preference
+        """
+        return [
+            table_name for table_name, mapping in self.get_catalog().items()
+            if all(column in mapping for column in columns)
+        ]
+
+    def route(self, requirements: Dict[str, List[str]], union: bool = False,
+              filter_columns: Optional[List[str]] = None) -> Dict[str, List[str]]:
+        """
+        Choose the tables each KPI is computed from.
+
+        Args:
+            requirements: Logical columns each KPI reads, by KPI name
+            union: Whether a KPI reads every table that has its columns,
+                   rather than the preferred one only
+            filter_columns: Logical columns the active filters apply to; a
+                            union leaves out the tables lacking any of them,
+                            whose rows the filters couldn't narrow
+
+        Returns:
+            Dictionary of KPI name to table names, empty for KPIs no table
+            can answer
+        """
+        routes = {}
+        for kpi, columns in requirements.items():
+            tables = self.get_tables(columns)
+            if union:
+                # Without a table the filters fully apply to, fall back to the preferred one
+                routes[kpi] = self.get_tables(list(columns) + list(filter_columns or [])) or tables[:1]
+            else:
+                routes[kpi] = tables[:1]
+        return routes
+
+    def get_columns(self, table_name: str) -> Dict[str, str]:
+        """
+        Get the logical columns of a source table.
+
+        Args:
+            table_name: Name of a source table
+
+        Returns:
+            Mapping of logical column names to the table's actual column
+            names, empty if the table is missing or empty
+        """
+        return dict(self.get_catalog().get(table_name, {}))
@@ -0,0 +1,520 @@
+"""
+OLAP Cube module for answering grouped aggregates without scanning rows.
+
+This module pre-aggregates a measure over every combination of a few
+low-cardinality dimensions, keeping the row count, non-null count, sum and
+sum of squares of each cell in dense NumPy arrays, together with the
+regression statistics (see statistics_engine) of a few columns against the
+measure. An aggregate under any filter combination on the dimensions is then
+a sum over the selected cells, so its cost depends on the number of cells
+rather than the number of rows.
+
+Each cell also keeps a t-digest of the measure (see quantile_sketch), so
+quantiles of the measure under any filter combination come from merging the
+digests of the selected cells rather than sorting rows.
+
+Cubes of disjoint sets of rows merge by adding their cells, so a cube can be
+maintained across appends from the appended rows alone: register collect and
+merge with DatabaseManager.register_aggregate under CUBE_AGGREGATE.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from database_manager import DatabaseManager
+from quantile_sketch import QuantileSketch
+from statistics_engine import STATISTICS, get_statistics_sql
+
+
+# Dimensions of the cube over the habits table: name -> (column, bucket width).
+# Bucketed dimensions hold ROUND(column / width) * width, like KPI 3, and
+# can't be filtered on; the others hold the column's values.
+CUBE_DIMENSIONS = {
+    "gender": ("gender", None),
+    "age": ("age", None),
+    "parental_education_level": ("parental_education_level", None),
+    "attendance_bucket": ("attendance_percentage", 10)
+}
+
+# Columns whose regression against the measure is kept per cell (KPIs 2 and 4)
+CUBE_REGRESSIONS = ["study_hours_per_day", "sleep_hours"]
+
+# Name of the cube among a table's aggregates (see DatabaseManager.register_aggregate)
+CUBE_AGGREGATE = "olap_cube"
+
+# Refuse to build cubes whose dense arrays would exceed this many cells
+MAX_CUBE_CELLS = 1_000_000
+
+# Measure statistics kept per cell, besides the regression statistics
+MEASURE_STATISTICS = ("rows", "count", "sum", "sumsq")
+
+
+class OLAPCube:
+    """Dense pre-aggregated measure statistics over the dimensions of one table."""
+
+    def __init__(self, table_name: str, version: Optional[int], measure: str,
+                 labels: Dict[str, List[Any]], filter_columns: Dict[str, str],
+                 regressions: List[str], cells: Dict[str, np.ndarray], columns: List[str],
+                 sketch: Optional[QuantileSketch] = None):
+        """
+        Initialize a cube from already aggregated cells (see from_table).
+
+        Every array has one axis per dimension, in the order of labels. Index 0
+        of an axis is the NULL value and index i + 1 is labels[dimension][i].
+
+        Args:
+            table_name: Name of the aggregated table
+            version: Table version the cells were aggregated at, or None for
+                     a cube maintained by the table's DatabaseManager
+            measure: Aggregated column
+            labels: Per dimension, its distinct non-null values in sorted order
+            filter_columns: Per unbucketed dimension, the table column that
+                            filters on it are given for
+            regressions: Columns whose regression against the measure is kept
+            cells: Arrays of the cells: rows (number of rows), count (rows
+                   where the measure is non-null), sum and sumsq of the
+                   measure, and "<column>:<statistic>" for each regression
+                   column and name in statistics_engine.STATISTICS
+            columns: All columns of the table
+            sketch: Optional digests of the measure per cell, keyed by the
+                    cell's flat index in the arrays (C order)
+        """
+        self.table_name = table_name
+        self.version = version
+        self.measure = measure
+        self.dimensions = list(labels)
+        self.regressions = list(regressions)
+        self._labels = labels
+        self._filter_columns = filter_columns
+        self._filter_dimensions = {column.lower(): dim for dim, column in filter_columns.items()}
+        self._cells = cells
+        self._columns = {col.lower(): col for col in columns}
+        self.sketch = sketch
+
+    @classmethod
+    def from_table(cls, db_manager: DatabaseManager, table_name: str,
+                   measure: str = "exam_score",
+                   dimensions: Optional[Dict[str, Tuple[str, Optional[float]]]] = None,
+                   regressions: Optional[List[str]] = None) -> "OLAPCube":
+        """
+        Aggregate a table into a cube with one GROUP BY query, and sketch
+        the measure per cell from a second query reading its values.
+
+        Dimensions and regressions reading columns the table lacks are left out.
+
+        Args:
+            db_manager: DatabaseManager holding the table
+            table_name: Name of the table
+            measure: Numeric column to aggregate
+            dimensions: Mapping of dimension names to (column, bucket width);
+                        defaults to CUBE_DIMENSIONS
+            regressions: Numeric columns to regress the measure on; defaults
+                         to CUBE_REGRESSIONS
+
+        Returns:
+            OLAPCube over the table's current version
+
+        Raises:
+            ValueError: If the table lacks the measure or the cube would be too large
+            RuntimeError: If aggregating the table fails
+        """
+        version = db_manager.get_table_version(table_name)
+        columns = [column["name"] for column in db_manager.get_table_info(table_name)["columns"]]
+        layout = _get_layout(columns, measure, dimensions, regressions)
+        column_sql = {col: f'"{col}"' for col in columns}
+        cells = db_manager.execute_query(_get_cells_query(table_name, column_sql, layout), use_cache=False)
+        values = db_manager.execute_query(_get_values_query(table_name, column_sql, layout), use_cache=False)
+        return cls._from_cells(table_name, version, layout, cells, columns, values)
+
+    @classmethod
+    def collect(cls, connection: duckdb.DuckDBPyConnection, table_name: str, source: str,
+                column_types: Dict[str, str], measure: str = "exam_score",
+                dimensions: Optional[Dict[str, Tuple[str, Optional[float]]]] = None,
+                regressions: Optional[List[str]] = None) -> "OLAPCube":
+        """
+        Aggregate rows of a table into a cube maintained by its DatabaseManager.
+
+        Matches the collect function of DatabaseManager.register_aggregate.
+
+        Args:
+            connection: DuckDB connection or cursor
+            table_name: Name of the table the rows belong to
+            source: Table name or SELECT statement producing the rows
+            column_types: Types of the table's columns; source columns are
+                          cast to them, and columns the source lacks are NULL
+            measure: Numeric column to aggregate
+            dimensions: See from_table
+            regressions: See from_table
+
+        Returns:
+            OLAPCube without a version (see is_current)
+
+        Raises:
+            ValueError: If the table lacks the measure or the cube would be too large
+        """
+        if not source.lstrip().upper().startswith(("SELECT", "WITH")):
+            source = f"SELECT * FROM {source}"
+        source_columns = {row[0] for row in connection.execute(f"DESCRIBE {source}").fetchall()}
+
+        column_sql = {}
+        for col, col_type in column_types.items():
+            value = f'"{col}"' if col in source_columns else "NULL"
+            column_sql[col] = f"CAST({value} AS {col_type})"
+
+        columns = list(column_types)
+        layout = _get_layout(columns, measure, dimensions, regressions)
+        cells = connection.execute(_get_cells_query(f"({source})", column_sql, layout)).fetchdf()
+        values = connection.execute(_get_values_query(f"({source})", column_sql, layout)).fetchdf()
+        return cls._from_cells(table_name, None, layout, cells, columns, values)
+
+    @classmethod
+    def _from_cells(cls, table_name: str, version: Optional[int], layout: dict,
+                    cells: pd.DataFrame, columns: List[str], values: pd.DataFrame) -> "OLAPCube":
+        """Load the results of a cells query into dense arrays, and of a values query into a sketch."""
+        labels = {}
+        positions = []
+        for i, dim in enumerate(layout["expressions"]):
+            codes, uniques = pd.factorize(cells[f"__dim_{i}"].astype(object), sort=True)
+            labels[dim] = uniques.tolist()
+            # Shift codes so NULL (-1) lands at index 0
+            positions.append(codes + 1)
+
+        shape = tuple(len(values) + 1 for values in labels.values())
+        if int(np.prod(shape)) > MAX_CUBE_CELLS:
+            raise ValueError(f"Cube over '{table_name}' would have more than {MAX_CUBE_CELLS} cells")
+
+        arrays = {}
+        for name in _get_cell_names(layout["regressions"]):
+            dtype = np.int64 if name in ("rows", "count") else np.float64
+            array = np.zeros(shape, dtype=dtype)
+            if len(cells):
+                # GROUP BY gives each cell at most once
+                array[tuple(positions)] = cells[f"__{name}"].to_numpy(dtype=dtype)
+            arrays[name] = array
+
+        # Cell of each measured value; values missing from the labels are NULL (index 0)
+        value_positions = [
+            pd.Index(labels[dim]).get_indexer(values[f"__dim_{i}"].astype(object)) + 1
+            for i, dim in enumerate(labels)
+        ]
+        keys = (np.ravel_multi_index(value_positions, shape) if value_positions
+                else np.zeros(len(values), dtype=np.int64))
+        sketch = QuantileSketch.from_values(keys, values["__measure"].to_numpy(dtype=np.float64))
+
+        return cls(table_name, version, layout["measure"], labels, layout["filter_columns"],
+                   layout["regressions"], arrays, columns, sketch)
+
+    def is_current(self, db_manager: DatabaseManager) -> bool:
+        """
+        Check whether the aggregated table is unchanged since the cube was built.
+
+        A cube without a version is current while it is the one db_manager
+        maintains for the table.
+        """
+        if self.version is None:
+            return db_manager.get_aggregate(self.table_name, CUBE_AGGREGATE) is self
+        return db_manager.get_table_version(self.table_name) == self.version
+
+    def merge(self, other: "OLAPCube") -> Optional["OLAPCube"]:
+        """
+        Combine with the cube of a disjoint set of rows of the same table.
+
+        Matches the merge function of DatabaseManager.register_aggregate.
+
+        Args:
+            other: Cube over other rows, built with the same layout
+
+        Returns:
+            Cube over both sets of rows without a version, or None if the
+            layouts differ, values can't be ordered together, or the merged
+            cube would be too large
+        """
+        if (other.table_name, other.measure, other.dimensions, other.regressions) != \
+                (self.table_name, self.measure, self.dimensions, self.regressions):
+            return None
+
+        labels = {}
+        for dim in self.dimensions:
+            try:
+                labels[dim] = sorted(set(self._labels[dim]) | set(other._labels[dim]))
+            except TypeError:
+                return None
+        shape = tuple(len(values) + 1 for values in labels.values())
+        if int(np.prod(shape)) > MAX_CUBE_CELLS:
+            return None
+
+        cells = {name: np.zeros(shape, dtype=array.dtype) for name, array in self._cells.items()}
+        # Flat index of every merged cell, to move each part's digests to
+        flat_indexes = np.arange(int(np.prod(shape))).reshape(shape)
+        sketches = []
+        for part in (self, other):
+            # Position of each of the part's values along the merged axes
+            positions = [
+                np.array([0] + [labels[dim].index(value) + 1 for value in part._labels[dim]])
+                for dim in self.dimensions
+            ]
+            for name, array in part._cells.items():
+                cells[name][np.ix_(*positions)] += array
+            if part.sketch is not None:
+                sketches.append(part.sketch.rekey(flat_indexes[np.ix_(*positions)].ravel()))
+
+        sketch = sketches[0].merge(sketches[1]) if len(sketches) == 2 else None
+        return OLAPCube(self.table_name, None, self.measure, labels, self._filter_columns,
+                        self.regressions, cells, list(self._columns.values()), sketch)
+
+    def matches(self, other: "OLAPCube", rtol: float = 1e-9) -> bool:
+        """
+        Check whether two cubes hold the same cells, up to rounding of the sums.
+
+        Sketches depend on the order values were merged in, so only the
+        number of values each cell's digest summarizes is compared.
+
+        Args:
+            other: Cube to compare with, e.g. one recomputed over the whole table
+            rtol: Relative tolerance of the sums
+
+        Returns:
+            True if the dimensions, values and cells agree
+        """
+        if (other.dimensions, other.regressions, other._labels) != \
+                (self.dimensions, self.regressions, self._labels):
+            return False
+        if (self.sketch is None) != (other.sketch is None):
+            return False
+        if self.sketch is not None:
+            size = self._cells["count"].size
+            if not np.array_equal(self.sketch.key_weights(size), other.sketch.key_weights(size)):
+                return False
+        return all(
+            np.allclose(array, other._cells[name], rtol=rtol, atol=0)
+            for name, array in self._cells.items()
+        )
+
+    def aggregate(self, filters: Dict[str, Any], dimension: str) -> pd.DataFrame:
+        """
+        Sum the cells matching filters per value of one dimension.
+
+        Filters follow FilterEngine.build_filter_query and apply like SQL: a
+        list selects any of its values, a 2-tuple an inclusive range and a
+        scalar one value, and NULL matches none of them. Filters on columns
+        the table lacks are ignored.
+
+        Args:
+            filters: Filter specifications
+            dimension: Dimension to group by
+
+        Returns:
+            DataFrame with columns value, rows, count, sum, sumsq, one row per
+            value with matching rows; the NULL value comes first as None
+
+        Raises:
+            KeyError: If the dimension is not in the cube
+            ValueError: If a filter is on a column that exists but is no
+                        dimension, or its value can't be compared with the
+                        dimension's values
+        """
+        if dimension not in self._labels:
+            raise KeyError(f"'{dimension}' is not a cube dimension")
+        axis = self.dimensions.index(dimension)
+        selections = self._select(filters)
+
+        def reduce(array: np.ndarray) -> np.ndarray:
+            selected = array[np.ix_(*selections)]
+            other_axes = tuple(i for i in range(array.ndim) if i != axis)
+            return selected.sum(axis=other_axes)
+
+        rows = reduce(self._cells["rows"])
+        present = np.flatnonzero(rows)
+        values = [None] + self._labels[dimension]
+        result = {"value": [values[i] for i in selections[axis][present]]}
+        for name in MEASURE_STATISTICS:
+            result[name] = reduce(self._cells[name])[present]
+        return pd.DataFrame(result)
+
+    def quantiles(self, filters: Dict[str, Any], dimension: str,
+                  probabilities: Sequence[float]) -> pd.DataFrame:
+        """
+        Estimate quantiles of the measure per value of one dimension.
+
+        The digests of the cells matching filters are merged per value (see
+        QuantileSketch.quantiles).
+
+        Args:
+            filters: Filter specifications (see aggregate)
+            dimension: Dimension to group by
+            probabilities: Probabilities of the quantiles, between 0 and 1
+
+        Returns:
+            DataFrame with columns value, count (non-null measures) and
+            p<percent> per probability (e.g. p50 for 0.5), one row per value
+            with measured rows; the NULL value comes first as None
+
+        Raises:
+            KeyError: If the dimension is not in the cube or it keeps no sketch
+            ValueError: If a filter can't be answered (see aggregate)
+        """
+        if self.sketch is None:
+            raise KeyError("The cube keeps no quantile sketch")
+        if dimension not in self._labels:
+            raise KeyError(f"'{dimension}' is not a cube dimension")
+        axis = self.dimensions.index(dimension)
+        selections = self._select(filters)
+
+        # Group of every cell: the selected value's position along the axis, or -1
+        shape = self._cells["count"].shape
+        groups = np.full(shape, -1, dtype=np.int64)
+        group_shape = [1] * len(shape)
+        group_shape[axis] = len(selections[axis])
+        groups[np.ix_(*selections)] = np.arange(len(selections[axis])).reshape(group_shape)
+        estimates = self.sketch.quantiles(groups.ravel(), len(selections[axis]), probabilities)
+
+        other_axes = tuple(i for i in range(len(shape)) if i != axis)
+        counts = self._cells["count"][np.ix_(*selections)].sum(axis=other_axes)
+        present = np.flatnonzero(counts)
+        values = [None] + self._labels[dimension]
+        result = {
+            "value": [values[i] for i in selections[axis][present]],
+            "count": counts[present]
+        }
+        for i, probability in enumerate(probabilities):
+            result[f"p{probability * 100:g}"] = estimates[present, i]
+        return pd.DataFrame(result)
+
+    def regression(self, filters: Dict[str, Any], column: str) -> Dict[str, float]:
+        """
+        Sum the regression statistics of a column over the cells matching filters.
+
+        Args:
+            filters: Filter specifications (see aggregate)
+            column: Regression column
+
+        Returns:
+            Sufficient statistics of (column, measure), keyed by the names in
+            statistics_engine.STATISTICS
+
+        Raises:
+            KeyError: If the column's regression is not kept
+            ValueError: If a filter can't be answered (see aggregate)
+        """
+        if column not in self.regressions:
+            raise KeyError(f"Regression of '{column}' is not kept in the cube")
+        selections = self._select(filters)
+        return {
+            name: float(self._cells[f"{column}:{name}"][np.ix_(*selections)].sum())
+            for name in STATISTICS
+        }
+
+    def _select(self, filters: Dict[str, Any]) -> List[np.ndarray]:
+        """Resolve filters to the selected indexes along each axis."""
+        masks = {dim: np.ones(len(self._labels[dim]) + 1, dtype=bool) for dim in self.dimensions}
+
+        for key, value in (filters or {}).items():
+            if value is None or key.lower() not in self._columns:
+                continue
+            dim = self._filter_dimensions.get(key.lower())
+            if dim is None:
+                raise ValueError(f"Column '{self._columns[key.lower()]}' is not a cube dimension")
+
+            labels = self._labels[dim]
+            try:
+                if isinstance(value, list) and len(value) > 0:
+                    matched = [label in value for label in labels]
+                elif isinstance(value, tuple) and len(value) == 2:
+                    matched = [value[0] <= label <= value[1] for label in labels]
+                else:
+                    matched = [label == value for label in labels]
+            except TypeError:
+                raise ValueError(f"Filter on '{key}' can't be compared with the values of '{dim}'")
+
+            # NULL (index 0) matches no filter
+            masks[dim] &= np.array([False] + matched, dtype=bool)
+
+        return [np.flatnonzero(masks[dim]) for dim in self.dimensions]
+
+
+def _get_layout(columns: List[str], measure: str,
+                dimensions: Optional[Dict[str, Tuple[str, Optional[float]]]],
+                regressions: Optional[List[str]]) -> dict:
+    """Resolve the dimensions, regressions and measure of a cube against a table's columns."""
+    actual_names = {col.lower(): col for col in columns}
+    if measure.lower() not in actual_names:
+        raise ValueError(f"Table has no column '{measure}'")
+    if dimensions is None:
+        dimensions = CUBE_DIMENSIONS
+    if regressions is None:
+        regressions = CUBE_REGRESSIONS
+
+    # Dimension -> column, or (column, bucket width) for bucketed dimensions
+    expressions = {}
+    filter_columns = {}
+    for dim, (column, width) in dimensions.items():
+        column = actual_names.get(column.lower())
+        if column is None:
+            continue
+        if width is None:
+            expressions[dim] = column
+            filter_columns[dim] = column
+        else:
+            expressions[dim] = (column, width)
+
+    return {
+        "measure": actual_names[measure.lower()],
+        "expressions": expressions,
+        "filter_columns": filter_columns,
+        "regressions": [actual_names[col.lower()] for col in regressions if col.lower() in actual_names]
+    }
+
+
+def _get_dimension_selects(column_sql: Dict[str, str], layout: dict) -> List[str]:
+    """Get the select list items computing the dimension values of rows, named __dim_<i>."""
+    selects = []
+    for i, expression in enumerate(layout["expressions"].values()):
+        if isinstance(expression, tuple):
+            column, width = expression
+            selects.append(f'ROUND({column_sql[column]} / {width}) * {width} AS "__dim_{i}"')
+        else:
+            selects.append(f'{column_sql[expression]} AS "__dim_{i}"')
+    return selects
+
+
+def _get_cells_query(source: str, column_sql: Dict[str, str], layout: dict) -> str:
+    """
+    Get the GROUP BY query aggregating a source into cells.
+
+    Args:
+        source: Table name or parenthesized query
+        column_sql: SQL expression reading each column of the table from source
+        layout: Result of _get_layout
+    """
+    selects = _get_dimension_selects(column_sql, layout)
+    measure = f"CAST({column_sql[layout['measure']]} AS DOUBLE)"
+    selects += [
+        'COUNT(*) AS "__rows"',
+        f'COUNT({measure}) AS "__count"',
+        f'COALESCE(SUM({measure}), 0) AS "__sum"',
+        f'COALESCE(SUM({measure} * {measure}), 0) AS "__sumsq"'
+    ]
+    selects += [
+        get_statistics_sql(column_sql[column], column_sql[layout["measure"]], prefix=f"__{column}:")
+        for column in layout["regressions"]
+    ]
+
+    group_by = ", ".join(f'"__dim_{i}"' for i in range(len(layout["expressions"]))) or "()"
+    return f"SELECT {', '.join(selects)} FROM {source} GROUP BY {group_by}"
+
+
+def _get_values_query(source: str, column_sql: Dict[str, str], layout: dict) -> str:
+    """Get the query reading the non-null measures of a source with their dimension values (see _get_cells_query)."""
+    measure = f"CAST({column_sql[layout['measure']]} AS DOUBLE)"
+    selects = _get_dimension_selects(column_sql, layout) + [f'{measure} AS "__measure"']
+    return f"SELECT {', '.join(selects)} FROM {source} WHERE {measure} IS NOT NULL"
+
+
+def _get_cell_names(regressions: List[str]) -> List[str]:
+    """Get the names of the cell arrays of a cube with the given regressions."""
+    return list(MEASURE_STATISTICS) + [
+        f"{column}:{name}" for column in regressions for name in STATISTICS
+    ]
@@ -0,0 +1,181 @@
+"""
+Quantile Sketch module for mergeable approximate quantiles.
+
+This module summarizes the distribution of a measure with t-digests: sorted
+centroids (a mean and a weight each) that are small near the extremes and
+larger around the median, so tail quantiles stay accurate with a bounded
+number of centroids. Digests merge by pooling their centroids and compressing
+them again, so the digest of a union of row sets follows from the digests of
+the parts without the rows.
+
+A QuantileSketch holds one digest per integer key (e.g. the cells of an OLAP
+cube) in flat NumPy arrays, so building, merging and querying many digests
+are vectorized rather than looped per digest.
+"""
+
+from typing import Sequence, Tuple
+
+import numpy as np
+
+
+# t-digest compression: a digest keeps about COMPRESSION / 2 centroids
+COMPRESSION = 100
+
+
+class QuantileSketch:
+    """t-digests of a measure, one per integer key, in flat centroid arrays."""
+
+    def __init__(self, keys: np.ndarray, means: np.ndarray, weights: np.ndarray,
+                 compression: int = COMPRESSION):
+        """
+        Initialize a sketch from compressed centroids (see from_values).
+
+        Args:
+            keys: Key of the digest each centroid belongs to
+            means: Mean of each centroid
+            weights: Number of values each centroid stands for
+            compression: t-digest compression the centroids were built with
+        """
+        self.keys = keys
+        self.means = means
+        self.weights = weights
+        self.compression = compression
+
+    @classmethod
+    def from_values(cls, keys: np.ndarray, values: np.ndarray,
+                    compression: int = COMPRESSION) -> "QuantileSketch":
+        """
+        Build the digests of values grouped by key.
+
+        Args:
+            keys: Non-negative integer key of each value
+            values: Measured values; NaN values are skipped
+            compression: t-digest compression
+
+        Returns:
+            QuantileSketch with one digest per key present
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values)
+        return cls(*_compress(keys[valid], values[valid], np.ones(int(valid.sum())), compression),
+                   compression)
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """
+        Combine with the sketch of a disjoint set of values.
+
+        Args:
+            other: Sketch keyed the same way
+
+        Returns:
+            Sketch whose digest for each key summarizes the values of both
+        """
+        compression = min(self.compression, other.compression)
+        return QuantileSketch(*_compress(
+            np.concatenate([self.keys, other.keys]),
+            np.concatenate([self.means, other.means]),
+            np.concatenate([self.weights, other.weights]),
+            compression
+        ), compression)
+
+    def rekey(self, mapping: np.ndarray) -> "QuantileSketch":
+        """
+        Move the digests to new keys.
+
+        Args:
+            mapping: New key of each old key, indexed by old key; old keys
+                     must map to distinct new keys
+
+        Returns:
+            Sketch with the same digests under the new keys
+        """
+        keys = np.asarray(mapping, dtype=np.int64)[self.keys]
+        order = np.lexsort((self.means, keys))
+        return QuantileSketch(keys[order], self.means[order], self.weights[order], self.compression)
+
+    def key_weights(self, size: int) -> np.ndarray:
+        """Get the number of values summarized under each key below size."""
+        return np.bincount(self.keys, weights=self.weights, minlength=size)[:size]
+
+    def quantiles(self, groups: np.ndarray, group_count: int,
+                  probabilities: Sequence[float]) -> np.ndarray:
+        """
+        Estimate quantiles of the values of groups of keys, merging their digests.
+
+        Quantiles interpolate linearly between the middle ranks of the
+        centroids, which gives the exact linear quantiles (numpy's default,
+        SQL QUANTILE_CONT) while every centroid is a single value.
+
+        Args:
+            groups: Group of each key, indexed by key; -1 leaves the key out
+            group_count: Number of groups
+            probabilities: Probabilities of the quantiles, between 0 and 1
+
+        Returns:
+            Array of shape (group_count, len(probabilities)), NaN for groups
+            without values
+        """
+        groups = np.asarray(groups, dtype=np.int64)
+        result = np.full((group_count, len(probabilities)), np.nan)
+        centroid_groups = groups[self.keys]
+        selected = centroid_groups >= 0
+        if not selected.any():
+            return result
+
+        centroid_groups = centroid_groups[selected]
+        means = self.means[selected]
+        weights = self.weights[selected]
+        order = np.lexsort((means, centroid_groups))
+        centroid_groups, means, weights = centroid_groups[order], means[order], weights[order]
+
+        bounds = np.searchsorted(centroid_groups, np.arange(group_count + 1))
+        targets = np.asarray(probabilities, dtype=np.float64)
+        for group in range(group_count):
+            start, end = bounds[group], bounds[group + 1]
+            if start == end:
+                continue
+            group_weights = weights[start:end]
+            cumulative = np.cumsum(group_weights)
+            # 0-based rank of the middle value of each centroid
+            ranks = cumulative - (group_weights + 1) / 2
+            result[group] = np.interp(targets * (cumulative[-1] - 1), ranks, means[start:end])
+        return result
+
+
+def _compress(keys: np.ndarray, means: np.ndarray, weights: np.ndarray,
+              compression: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compress centroids into t-digests, one per key.
+
+    Centroids are sorted by key and mean, and those whose quantile midpoints
+    fall within the same unit of the k1 scale function
+    k(q) = compression / (2 pi) * asin(2q - 1) are merged. The scale is steep
+    near q = 0 and q = 1, so the extremes stay in small centroids.
+
+    Returns:
+        Tuple of keys, means and weights of the compressed centroids, sorted
+        by key and mean
+    """
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+
+    order = np.lexsort((means, keys))
+    keys, means, weights = keys[order], means[order], weights[order]
+
+    new_key = np.r_[True, keys[1:] != keys[:-1]]
+    starts = np.flatnonzero(new_key)
+    # Index of each centroid's digest, and the weight before it within the digest
+    digest = np.cumsum(new_key) - 1
+    cumulative = np.cumsum(weights)
+    before = cumulative - weights - (cumulative[starts] - weights[starts])[digest]
+    totals = np.add.reduceat(weights, starts)[digest]
+
+    midpoints = np.clip((before + weights / 2) / totals, 0.0, 1.0)
+    bucket = np.floor(compression / (2 * np.pi) * np.arcsin(2 * midpoints - 1)).astype(np.int64)
+
+    boundary = new_key | np.r_[True, bucket[1:] != bucket[:-1]]
+    merged = np.flatnonzero(boundary)
+    merged_weights = np.add.reduceat(weights, merged)
+    merged_means = np.add.reduceat(weights * means, merged) / merged_weights
+    return keys[merged], merged_means, merged_weights
@@ -0,0 +1,170 @@
+"""
+Query Cache module for reusing query results between reruns.
+
+This module provides a size-bounded LRU cache of query results. Entries are
+keyed on the normalized SQL text together with the versions of the tables
+the query reads, so results are never served after those tables change.
+"""
+
+from typing import Any, Dict, Hashable, Iterable, Optional
+from collections import OrderedDict
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+# Default memory budget of a result cache
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+# Matches single-quoted string literals and double-quoted identifiers
+_QUOTED_PATTERN = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Normalize a SQL query so that formatting differences don't matter.
+    
+    Runs of whitespace outside quoted literals and identifiers collapse to a
+    single space, and surrounding whitespace and trailing semicolons are removed.
+    
+    Args:
+        query: SQL query text
+    
+    Returns:
+        Normalized query text
+    """
+    parts = _QUOTED_PATTERN.split(query)
+    # Even-indexed parts lie outside quotes
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\s+", " ", parts[i])
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def estimate_result_size(result: Any) -> int:
+    """
+    Estimate the memory used by a query result.
+    
+    Args:
+        result: pandas DataFrame, pyarrow Table or dictionary of NumPy arrays
+    
+    Returns:
+        Approximate size in bytes
+    """
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(deep=True).sum())
+    if isinstance(result, dict):
+        return int(sum(np.asarray(values).nbytes for values in result.values()))
+    return int(getattr(result, "nbytes", 0))
+
+
+class QueryResultCache:
+    """Thread-safe LRU cache of query results bounded by total size in bytes."""
+    
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        """
+        Initialize the cache.
+        
+        Args:
+            max_bytes: Maximum total size of cached results; 0 disables caching
+        """
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._size_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Look up a cached result, marking it as recently used.
+        
+        Args:
+            key: Cache key
+        
+        Returns:
+            Cached result, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+    
+    def put(self, key: Hashable, result: Any, tables: Iterable[str]) -> None:
+        """
+        Store a result, evicting least recently used entries to stay within budget.
+        
+        Results larger than the whole budget are not stored.
+        
+        Args:
+            key: Cache key
+            result: Query result
+            tables: Names of the tables the result was computed from
+        """
+        size = estimate_result_size(result)
+        if size > self.max_bytes:
+            return
+        
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            
+            self._entries[key] = (result, size, frozenset(tables))
+            self._size_bytes += size
+            
+            while self._size_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+    
+    def invalidate_table(self, table_name: str) -> int:
+        """
+        Remove every cached result computed from a table.
+        
+        Args:
+            table_name: Name of the table that changed
+        
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if table_name in entry[2]]
+            for key in stale:
+                self._remove(key)
+            return len(stale)
+    
+    def clear(self) -> None:
+        """Remove all cached results."""
+        with self._lock:
+            self._entries.clear()
+            self._size_bytes = 0
+    
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Get cache statistics.
+        
+        Returns:
+            Dictionary containing:
+            - hits: Number of lookups served from the cache
+            - misses: Number of lookups not found
+            - entries: Number of cached results
+            - size_bytes: Total size of cached results
+            - max_bytes: Memory budget
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "entries": len(self._entries),
+                "size_bytes": self._size_bytes,
+                "max_bytes": self.max_bytes
+            }
+    
+    def _remove(self, key: Hashable) -> None:
+        """Remove an entry; the lock must be held."""
+        _, size, _ = self._entries.pop(key)
+        self._size_bytes -= size
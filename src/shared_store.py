@@ -0,0 +1,294 @@
+"""
+Shared Store module for serving datasets to many sessions from one database.
+
+This module keeps a single process-wide DuckDB database holding each distinct
+uploaded dataset once, keyed by content fingerprint. Every user session gets
+its own DatabaseManager (own cursor and schema) whose tables are views over
+the shared datasets, so memory grows with the number of datasets rather than
+the number of sessions.
+
+Sessions idle for longer than a time-to-live are closed, dropping their
+schema, and datasets no session binds are evicted least recently used first
+beyond a small number kept for re-uploads; evicted datasets are loaded back
+from the Parquet cache when uploaded again.
+
+Aggregates registered with the store (e.g. the OLAP cube and bitmap index of
+the habits table) are likewise collected once per dataset and table name and
+handed to every session binding it, rather than built per session.
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pathlib import Path
+import threading
+import time
+
+from database_manager import DatabaseManager
+from dataset_cache import DatasetCache
+from file_manager import validate_table_columns
+
+
+# Seconds after its last request that an idle session is closed
+SESSION_TTL_SECONDS = 30 * 60
+
+# Datasets kept in memory while no session binds them, for re-uploads
+MAX_UNBOUND_DATASETS = 4
+
+
+class SharedDataStore:
+    """Process-wide store of datasets shared by all sessions."""
+    
+    def __init__(self, db_path: str = ":memory:", dataset_cache: Optional[DatasetCache] = None,
+                 session_ttl: float = SESSION_TTL_SECONDS,
+                 max_unbound_datasets: int = MAX_UNBOUND_DATASETS):
+        """
+        Initialize the shared store.
+        
+        Args:
+            db_path: Path to DuckDB database file. Use ":memory:" for in-memory database.
+            dataset_cache: Optional Parquet cache used to load and persist datasets
+            session_ttl: Seconds after its last request that a session is closed
+                         by close_idle_sessions
+            max_unbound_datasets: Number of datasets no session binds that are
+                                  kept in memory
+        """
+        self.db_manager = DatabaseManager(db_path)
+        self.dataset_cache = dataset_cache
+        self.session_ttl = session_ttl
+        self.max_unbound_datasets = max_unbound_datasets
+        self._lock = threading.RLock()
+        # Fingerprint -> name of the shared table holding that dataset,
+        # least recently used first
+        self._datasets: "OrderedDict[str, str]" = OrderedDict()
+        # Session id -> its manager and the time of its last request
+        self._sessions: Dict[str, DatabaseManager] = {}
+        self._last_seen: Dict[str, float] = {}
+        # Session id -> fingerprint of the dataset bound under each table name
+        self._bindings: Dict[str, Dict[str, str]] = {}
+        # Collect and merge functions of the aggregates shared per table name,
+        # and their states by (fingerprint, table name, aggregate name)
+        self._aggregators: Dict[str, Dict[str, Tuple[Callable, Callable]]] = {}
+        self._aggregates: Dict[Tuple[str, str, str], Any] = {}
+    
+    def register_aggregate(self, table_name: str, name: str,
+                           collect: Callable[[Any, str, str, Dict[str, str]], Any],
+                           merge: Callable[[Any, Any], Optional[Any]]) -> None:
+        """
+        Share an aggregate of the datasets bound under a table name.
+        
+        The aggregate is collected once per dataset, on its first bind under
+        table_name, and the same state is given to every session binding it.
+        Sessions created afterwards register it too, so appends to a
+        session's copy of the data merge into that session's own state.
+        
+        Args:
+            table_name: Name under which sessions bind the datasets
+            name: Name of the aggregate
+            collect: See DatabaseManager.register_aggregate
+            merge: See DatabaseManager.register_aggregate
+        """
+        with self._lock:
+            self._aggregators.setdefault(table_name, {})[name] = (collect, merge)
+    
+    def create_session(self, session_id: str) -> DatabaseManager:
+        """
+        Create the database manager of a new session.
+        
+        Args:
+            session_id: Identifier of the session (letters, digits and underscores)
+        
+        Returns:
+            DatabaseManager querying the shared database through its own cursor
+        """
+        with self._lock:
+            session_db = self.db_manager.create_session(session_id)
+            for table_name, aggregators in self._aggregators.items():
+                for name, (collect, merge) in aggregators.items():
+                    session_db.register_aggregate(table_name, name, collect, merge)
+            self._sessions[session_id] = session_db
+            self._last_seen[session_id] = time.monotonic()
+            self._bindings[session_id] = {}
+            return session_db
+    
+    def touch(self, session_id: str) -> bool:
+        """
+        Record a request of a session, keeping it from being closed as idle.
+        
+        Args:
+            session_id: Identifier of the session
+        
+        Returns:
+            False if the session does not exist (e.g. it was closed as idle)
+        """
+        with self._lock:
+            if session_id not in self._sessions:
+                return False
+            self._last_seen[session_id] = time.monotonic()
+            return True
+    
+    def close_session(self, session_id: str) -> None:
+        """
+        Close a session, dropping its schema and releasing the datasets it binds.
+        
+        Args:
+            session_id: Identifier of the session; unknown sessions are ignored
+        """
+        with self._lock:
+            session_db = self._sessions.pop(session_id, None)
+            self._last_seen.pop(session_id, None)
+            self._bindings.pop(session_id, None)
+            if session_db is not None:
+                session_db.close()
+            self._evict_datasets()
+    
+    def close_idle_sessions(self) -> List[str]:
+        """
+        Close the sessions without a request for longer than the session TTL.
+        
+        Returns:
+            Identifiers of the closed sessions
+        """
+        with self._lock:
+            deadline = time.monotonic() - self.session_ttl
+            idle = [session_id for session_id, seen in self._last_seen.items() if seen < deadline]
+            for session_id in idle:
+                self.close_session(session_id)
+            return idle
+    
+    def get_dataset(self, fingerprint: str) -> Optional[str]:
+        """
+        Get the shared table holding a dataset, loading it from the Parquet cache if needed.
+        
+        Args:
+            fingerprint: Content hash of the upload
+        
+        Returns:
+            Name of the shared table, or None if the dataset has not been ingested
+        """
+        with self._lock:
+            if fingerprint in self._datasets:
+                self._datasets.move_to_end(fingerprint)
+                return self._datasets[fingerprint]
+            
+            if self.dataset_cache and self.dataset_cache.contains(fingerprint):
+                table_name = _dataset_table_name(fingerprint)
+                try:
+                    self.dataset_cache.load(self.db_manager, table_name, fingerprint)
+                except (KeyError, OSError, RuntimeError):
+                    # Evicted since contains() or unreadable: a miss, imported afresh
+                    return None
+                self._datasets[fingerprint] = table_name
+                return table_name
+        
+        return None
+    
+    def import_dataset(self, csv_path: Path, fingerprint: str,
+                       plan: Optional[dict] = None) -> str:
+        """
+        Ingest a CSV file as a shared dataset, unless it already is one.
+        
+        Args:
+            csv_path: Path to the CSV file
+            fingerprint: Content hash of the file
+            plan: Optional parse plan from file_manager.sniff_csv_plan
+        
+        Returns:
+            Name of the shared table holding the dataset
+        
+        Raises:
+            ValueError: If the file is empty
+            RuntimeError: If import operation fails
+        """
+        with self._lock:
+            if fingerprint in self._datasets:
+                self._datasets.move_to_end(fingerprint)
+                return self._datasets[fingerprint]
+            
+            table_name = _dataset_table_name(fingerprint)
+            self.db_manager.import_csv(csv_path, table_name, plan=plan, fingerprint=fingerprint)
+            self._datasets[fingerprint] = table_name
+            
+            if self.dataset_cache:
+                try:
+                    self.dataset_cache.store(self.db_manager, table_name, fingerprint)
+                except (OSError, RuntimeError):
+                    # Caching is an optimization; the import itself succeeded
+                    pass
+            
+            return table_name
+    
+    def bind(self, session_db: DatabaseManager, table_name: str, fingerprint: str,
+             required_columns: Optional[List[str]] = None,
+             expected_types: Optional[Dict[str, str]] = None) -> None:
+        """
+        Expose a shared dataset in a session under a table name.
+        
+        A dataset is shared by every upload of the same content, whichever
+        table it was first uploaded as, so its columns are checked against
+        those the table name requires on every bind.
+        
+        Args:
+            session_db: DatabaseManager of the session
+            table_name: Name under which the session queries the dataset
+            fingerprint: Content hash of an ingested dataset
+            required_columns: Optional columns the dataset must contain
+            expected_types: Optional mapping of column names to "numeric"
+        
+        Raises:
+            KeyError: If the dataset has not been ingested
+            ValueError: If the dataset lacks a required column or type
+        """
+        with self._lock:
+            dataset_table = self._datasets[fingerprint]
+            column_types = {
+                column["name"]: column["type"]
+                for column in self.db_manager.get_table_info(dataset_table)["columns"]
+            }
+            if required_columns is not None:
+                is_valid, error_msg = validate_table_columns(column_types, required_columns, expected_types)
+                if not is_valid:
+                    raise ValueError(error_msg)
+            
+            session_db.create_view(
+                table_name, f"main.{dataset_table}", fingerprint=fingerprint,
+                facets=self.db_manager.get_facets(dataset_table),
+                aggregates=self._get_aggregates(fingerprint, table_name, dataset_table, column_types)
+            )
+            for session_id, session in self._sessions.items():
+                if session is session_db:
+                    # Replaces the dataset bound before under the name, if any
+                    self._bindings[session_id][table_name] = fingerprint
+            self._datasets.move_to_end(fingerprint)
+            self._evict_datasets()
+    
+    def _get_aggregates(self, fingerprint: str, table_name: str, dataset_table: str,
+                        column_types: Dict[str, str]) -> Dict[str, Any]:
+        """Get the shared aggregates of a dataset bound as table_name, collecting missing ones."""
+        aggregates = {}
+        for name, (collect, _) in self._aggregators.get(table_name, {}).items():
+            key = (fingerprint, table_name, name)
+            if key not in self._aggregates:
+                try:
+                    with self.db_manager.cursor() as cursor:
+                        self._aggregates[key] = collect(cursor, table_name, dataset_table, column_types)
+                except Exception:
+                    # Consumers of a missing aggregate fall back to querying the table
+                    continue
+            aggregates[name] = self._aggregates[key]
+        return aggregates
+    
+    def _evict_datasets(self) -> None:
+        """Drop the least recently used datasets no session binds beyond max_unbound_datasets."""
+        bound = {
+            fingerprint for bindings in self._bindings.values() for fingerprint in bindings.values()
+        }
+        unbound = [fingerprint for fingerprint in self._datasets if fingerprint not in bound]
+        for fingerprint in unbound[:max(0, len(unbound) - self.max_unbound_datasets)]:
+            self.db_manager.delete_table(self._datasets.pop(fingerprint))
+            for key in [key for key in self._aggregates if key[0] == fingerprint]:
+                del self._aggregates[key]
+
+
+def _dataset_table_name(fingerprint: str) -> str:
+    """Name of the shared table holding the dataset with a given fingerprint."""
+    return f"dataset_{fingerprint[:16]}"
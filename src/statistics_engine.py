@@ -0,0 +1,341 @@
+"""
+Statistics Engine module for regression and correlation from sufficient statistics.
+
+This module describes the linear relationship between two columns by their
+sufficient statistics: the number of non-null pairs and the sums of x, y, xy,
+x² and y². These are plain sums, computed inside a SQL aggregate or over NumPy
+arrays and added up across batches, and the least-squares line and Pearson
+correlation follow from them exactly without the rows. Over a random sample
+of the rows, they also give confidence intervals for the slope and correlation.
+
+GroupStatistics holds these sums for several factors against one measure,
+for every group of a dimension, computed in a single grouped SQL aggregate.
+Statistics of disjoint partitions merge into those of their union.
+"""
+
+from typing import Any, Dict, List, Optional
+import math
+
+import numpy as np
+import pandas as pd
+
+from database_manager import DatabaseManager
+from filter_engine import FilterEngine
+
+
+# Names of the sufficient statistics, in order
+STATISTICS = ("n", "sum_x", "sum_y", "sum_xy", "sum_xx", "sum_yy")
+
+# Normal quantile of two-sided 95% confidence intervals
+CONFIDENCE_Z = 1.96
+
+# Habits columns whose relationship with exam_score is summarized by default
+FACTOR_COLUMNS = [
+    "study_hours_per_day", "sleep_hours", "attendance_percentage",
+    "social_media_hours", "netflix_hours"
+]
+
+
+def get_statistics_sql(x: str, y: str, prefix: str = "") -> str:
+    """
+    Get the SQL aggregates computing the sufficient statistics of two columns.
+
+    Only rows where both columns are non-null count. Sums over no rows are 0.
+
+    Args:
+        x: SQL expression of the first column
+        y: SQL expression of the second column
+        prefix: Prefix of the result column names
+
+    Returns:
+        Comma-separated select list with one column per name in STATISTICS,
+        each named prefix + name
+    """
+    both = f"{x} IS NOT NULL AND {y} IS NOT NULL"
+    x_value = f"CAST({x} AS DOUBLE)"
+    y_value = f"CAST({y} AS DOUBLE)"
+    sums = {
+        "sum_x": x_value,
+        "sum_y": y_value,
+        "sum_xy": f"{x_value} * {y_value}",
+        "sum_xx": f"{x_value} * {x_value}",
+        "sum_yy": f"{y_value} * {y_value}"
+    }
+    selects = [f'COUNT(*) FILTER (WHERE {both}) AS "{prefix}n"']
+    selects += [
+        f'COALESCE(SUM({expression}) FILTER (WHERE {both}), 0) AS "{prefix}{name}"'
+        for name, expression in sums.items()
+    ]
+    return ", ".join(selects)
+
+
+def compute_statistics(x: Any, y: Any, weights: Optional[Any] = None) -> Dict[str, float]:
+    """
+    Compute the sufficient statistics of two arrays.
+
+    Pairs where either value is NaN are skipped.
+
+    Args:
+        x: First values
+        y: Second values
+        weights: Optional number of times each pair counts (e.g. the number
+                 of points a binned mark stands for)
+
+    Returns:
+        Dictionary with the keys of STATISTICS
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    w = np.ones_like(x) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x, y, w = x[valid], y[valid], w[valid]
+    return {
+        "n": float(w.sum()),
+        "sum_x": float(np.dot(w, x)),
+        "sum_y": float(np.dot(w, y)),
+        "sum_xy": float(np.dot(w, x * y)),
+        "sum_xx": float(np.dot(w, x * x)),
+        "sum_yy": float(np.dot(w, y * y))
+    }
+
+
+def merge_statistics(first: Dict[str, Any], second: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Combine the sufficient statistics of two disjoint sets of rows.
+
+    Args:
+        first: Statistics of the first set
+        second: Statistics of the second set
+
+    Returns:
+        Statistics of both sets together
+    """
+    return {name: first[name] + second[name] for name in STATISTICS}
+
+
+def fit_line(statistics: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fit y = slope * x + intercept by least squares and correlate x and y.
+
+    The statistics may be scalars or NumPy arrays, in which case every
+    element is fitted separately.
+
+    Args:
+        statistics: Sufficient statistics (see STATISTICS)
+
+    Returns:
+        Dictionary with n, slope, intercept and r (Pearson correlation), as
+        floats for scalar statistics; slope and intercept are NaN with fewer
+        than two distinct x values, and r is NaN as well when y is constant
+    """
+    fit = _fit_arrays(statistics)
+    if np.ndim(fit["n"]) == 0:
+        return {key: float(value) for key, value in fit.items()}
+    return fit
+
+
+def _fit_arrays(statistics: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """Fit lines elementwise over arrays of sufficient statistics."""
+    n, sum_x, sum_y, sum_xy, sum_xx, sum_yy = (
+        np.asarray(statistics[name], dtype=np.float64) for name in STATISTICS
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Centered sums of squares and products; rounding can leave tiny negatives
+        sxx = np.maximum(sum_xx - sum_x ** 2 / n, 0.0)
+        syy = np.maximum(sum_yy - sum_y ** 2 / n, 0.0)
+        sxy = sum_xy - sum_x * sum_y / n
+
+        defined = n >= 2
+        slope = np.where(defined & (sxx > 0), sxy / sxx, np.nan)
+        intercept = np.where(defined, (sum_y - slope * sum_x) / n, np.nan)
+        r = np.where(defined & (sxx > 0) & (syy > 0), sxy / np.sqrt(sxx * syy), np.nan)
+    return {"n": n, "slope": slope, "intercept": intercept, "r": np.clip(r, -1.0, 1.0)}
+
+
+def fit_intervals(statistics: Dict[str, Any], fraction: float = 0.0,
+                  z: float = CONFIDENCE_Z) -> Dict[str, float]:
+    """
+    Get confidence intervals of the fitted line and correlation of a sample.
+
+    The slope interval uses its ordinary least-squares standard error, the
+    correlation interval the Fisher transformation. Both are narrowed by the
+    finite population correction, so a sample of every row gives the exact
+    values.
+
+    Args:
+        statistics: Sufficient statistics of the sampled pairs
+        fraction: Fraction of the population the sample holds (0 for an
+                  infinite population)
+        z: Normal quantile of the confidence level
+
+    Returns:
+        Dictionary with slope_low, slope_high, r_low and r_high, NaN where
+        the sample is too small to bound them
+    """
+    fit = fit_line(statistics)
+    n = fit["n"]
+    correction = math.sqrt(max(1.0 - fraction, 0.0))
+    sxx = statistics["sum_xx"] - statistics["sum_x"] ** 2 / n if n > 0 else math.nan
+    syy = statistics["sum_yy"] - statistics["sum_y"] ** 2 / n if n > 0 else math.nan
+
+    slope_margin = math.nan
+    if n > 2 and sxx > 0 and not math.isnan(fit["slope"]):
+        # Residual sum of squares is syy - slope * sxy = syy - slope² * sxx
+        residual = max(syy - fit["slope"] ** 2 * sxx, 0.0)
+        slope_margin = z * math.sqrt(residual / (n - 2) / sxx) * correction
+
+    r_low = r_high = math.nan
+    if n > 3 and not math.isnan(fit["r"]):
+        if abs(fit["r"]) == 1.0:
+            r_low = r_high = fit["r"]
+        else:
+            center = math.atanh(fit["r"])
+            margin = z / math.sqrt(n - 3) * correction
+            r_low, r_high = math.tanh(center - margin), math.tanh(center + margin)
+
+    return {
+        "slope_low": fit["slope"] - slope_margin,
+        "slope_high": fit["slope"] + slope_margin,
+        "r_low": r_low,
+        "r_high": r_high
+    }
+
+
+class GroupStatistics:
+    """Sufficient statistics of several factors against one measure, per group."""
+
+    def __init__(self, group_column: str, groups: List[Any], factors: List[str],
+                 y_column: str, statistics: Dict[str, np.ndarray]):
+        """
+        Initialize group statistics from already computed sums (see from_table).
+
+        Args:
+            group_column: Column the rows are grouped by
+            groups: Group values, None for the NULL group
+            factors: Columns related to y_column
+            y_column: Measure every factor is related to
+            statistics: Per name in STATISTICS, a float64 array of shape
+                        (len(groups), len(factors))
+        """
+        self.group_column = group_column
+        self.groups = list(groups)
+        self.factors = list(factors)
+        self.y_column = y_column
+        self.statistics = statistics
+
+    @classmethod
+    def from_table(cls, db_manager: DatabaseManager, table_name: str, group_column: str,
+                   factors: Optional[List[str]] = None, y_column: str = "exam_score",
+                   filters: Optional[Dict[str, Any]] = None) -> "GroupStatistics":
+        """
+        Compute the statistics of every group and factor in one grouped query.
+
+        Factors the table lacks are left out.
+
+        Args:
+            db_manager: DatabaseManager holding the table
+            table_name: Name of the table
+            group_column: Column to group by (e.g. gender, age)
+            factors: Numeric columns to relate to y_column; defaults to FACTOR_COLUMNS
+            y_column: Numeric measure
+            filters: Optional filter specifications (see FilterEngine.compile_filters)
+
+        Returns:
+            GroupStatistics with one group per value of group_column among the
+            matching rows, NULL first
+
+        Raises:
+            ValueError: If the table lacks group_column or y_column
+            RuntimeError: If the query fails
+        """
+        columns = [column["name"] for column in db_manager.get_table_info(table_name)["columns"]]
+        actual_names = {col.lower(): col for col in columns}
+        for required in (group_column, y_column):
+            if required.lower() not in actual_names:
+                raise ValueError(f"Table '{table_name}' has no column '{required}'")
+        group_column = actual_names[group_column.lower()]
+        y_column = actual_names[y_column.lower()]
+        factors = [
+            actual_names[factor.lower()] for factor in (factors or FACTOR_COLUMNS)
+            if factor.lower() in actual_names
+        ]
+
+        selects = [f'"{group_column}" AS "__group"']
+        selects += [
+            get_statistics_sql(f'"{factor}"', f'"{y_column}"', prefix=f"__{i}_")
+            for i, factor in enumerate(factors)
+        ]
+        where_clause, params = FilterEngine(db_manager).compile_filters(filters or {}, columns)
+        query = f"SELECT {', '.join(selects)} FROM {table_name}"
+        if where_clause:
+            query += f" WHERE {where_clause}"
+        query += ' GROUP BY "__group" ORDER BY "__group" NULLS FIRST'
+
+        result = db_manager.execute_query(query, params=params)
+        groups = [None if pd.isna(value) else value for value in result["__group"].tolist()]
+        statistics = {
+            name: np.column_stack([
+                result[f"__{i}_{name}"].to_numpy(dtype=np.float64) for i in range(len(factors))
+            ]) if factors else np.zeros((len(groups), 0))
+            for name in STATISTICS
+        }
+        return cls(group_column, groups, factors, y_column, statistics)
+
+    def merge(self, other: "GroupStatistics") -> "GroupStatistics":
+        """
+        Combine with the statistics of a disjoint partition of rows.
+
+        Args:
+            other: Statistics over other rows, with the same grouping, factors
+                   and measure
+
+        Returns:
+            Statistics of both partitions; groups found in only one keep its sums
+
+        Raises:
+            ValueError: If the grouping, factors or measure differ
+        """
+        if (other.group_column, other.factors, other.y_column) != (self.group_column, self.factors, self.y_column):
+            raise ValueError("Can only merge statistics of the same groups, factors and measure")
+
+        groups = self.groups + [group for group in other.groups if group not in self.groups]
+        positions = {group: i for i, group in enumerate(groups)}
+        statistics = {}
+        for name in STATISTICS:
+            merged = np.zeros((len(groups), len(self.factors)))
+            for part in (self, other):
+                rows = [positions[group] for group in part.groups]
+                merged[rows] += part.statistics[name]
+            statistics[name] = merged
+        return GroupStatistics(self.group_column, groups, self.factors, self.y_column, statistics)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Summarize every group and factor.
+
+        Returns:
+            DataFrame with columns group, factor, n, mean_x, var_x, mean_y,
+            var_y, slope, intercept, r; variances are sample variances, and
+            statistics without enough pairs are NaN
+        """
+        fit = fit_line(self.statistics)
+        n = self.statistics["n"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_x = self.statistics["sum_x"] / n
+            mean_y = self.statistics["sum_y"] / n
+            var_x = np.where(n >= 2, (self.statistics["sum_xx"] - n * mean_x ** 2) / (n - 1), np.nan)
+            var_y = np.where(n >= 2, (self.statistics["sum_yy"] - n * mean_y ** 2) / (n - 1), np.nan)
+
+        return pd.DataFrame({
+            "group": np.repeat(np.array(self.groups, dtype=object), len(self.factors)),
+            "factor": np.tile(np.array(self.factors, dtype=object), len(self.groups)),
+            "n": n.ravel().astype(np.int64),
+            "mean_x": mean_x.ravel(),
+            "var_x": np.maximum(var_x, 0.0).ravel(),
+            "mean_y": mean_y.ravel(),
+            "var_y": np.maximum(var_y, 0.0).ravel(),
+            "slope": fit["slope"].ravel(),
+            "intercept": fit["intercept"].ravel(),
+            "r": fit["r"].ravel()
+        })
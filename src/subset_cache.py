@@ -0,0 +1,217 @@
+"""
+Subset Cache module for sharing one filtered scan between queries.
+
+This module materializes the rows of a table that match a filter state, with
+only the columns the callers need, so that several queries over the same
+filter state (e.g. the four KPIs) read the small subset instead of each
+scanning and filtering the base table.
+
+A few recent subsets are kept. When a new filter state is narrower than a
+cached one (every filter of the cached state is implied by the new state), the
+new subset is filtered from the smallest such subset instead of the base
+table, so drilling down gets cheaper as the selection shrinks. Widened filters
+go back to the base table.
+
+Subsets are regular tables in the manager's schema rather than TEMP tables:
+queries run on pooled cursors, which are separate connections and would not
+see another connection's temporary tables. Their names are unique, so several
+caches can share a manager, and a subset is only reused while its table is
+still the version the cache created.
+"""
+
+from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict
+import threading
+import uuid
+
+from database_manager import DatabaseManager
+from filter_engine import FilterEngine
+
+
+# Maximum number of subsets kept for reuse and refinement
+MAX_SUBSETS = 4
+
+
+class SubsetCache:
+    """Materialized filtered subsets of tables, reused while the filters are unchanged."""
+
+    def __init__(self, db_manager: DatabaseManager, max_subsets: int = MAX_SUBSETS):
+        """
+        Initialize the subset cache.
+
+        Args:
+            db_manager: DatabaseManager holding the source tables and the subsets
+            max_subsets: Maximum number of subsets kept; the least recently
+                         used is dropped beyond it
+        """
+        self.db_manager = db_manager
+        self.filter_engine = FilterEngine(db_manager)
+        self.max_subsets = max_subsets
+        # Serializes materialization, so concurrent callers share one subset
+        self._lock = threading.Lock()
+        # Subsets by (table, version, columns, filter state), least recently used first
+        self._subsets: "OrderedDict[Tuple, dict]" = OrderedDict()
+
+    def get_subset(self, table_name: str, columns: Dict[str, str],
+                   filters: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Get a table holding the rows of a table that match filters.
+
+        The subset is materialized on first use and reused while the filters,
+        columns and source table are unchanged. A new filter state narrower
+        than a cached one is evaluated against that cached subset.
+
+        Args:
+            table_name: Name of the source table
+            columns: Mapping of subset column names to source column names,
+                     matched case-insensitively; columns the table lacks are
+                     left out, and filters apply to the others only
+            filters: Filter specifications (see FilterEngine.compile_filters)
+
+        Returns:
+            Name of the subset table
+
+        Raises:
+            RuntimeError: If the subset cannot be created
+        """
+        columns = self._get_existing_columns(table_name, columns)
+        # Filters keyed by subset column, keeping only those compile_filters applies
+        active_filters = _get_active_filters(filters or {}, columns)
+        version = self.db_manager.get_table_version(table_name)
+        key = (table_name, version, tuple(columns.items()), _freeze(active_filters))
+
+        with self._lock:
+            self._drop_stale(table_name, version)
+
+            cached = self._subsets.get(key)
+            if cached is not None:
+                self._subsets.move_to_end(key)
+                return cached["name"]
+
+            # Refine the smallest cached subset the new state is narrower than
+            source, source_columns = table_name, columns
+            candidates = [
+                entry for entry_key, entry in self._subsets.items()
+                if entry_key[:3] == key[:3] and _is_narrower(active_filters, entry["filters"])
+            ]
+            if candidates:
+                narrowest = min(candidates, key=lambda entry: entry["row_count"])
+                source = narrowest["name"]
+                source_columns = {alias: alias for alias in columns}
+
+            where_clause, params = self.filter_engine.compile_filters(
+                {source_columns[alias]: value for alias, value in active_filters.items()},
+                list(source_columns.values())
+            )
+            select_list = ", ".join(
+                f'"{source_columns[alias]}" AS "{alias}"' for alias in columns
+            )
+            query = f"SELECT {select_list} FROM {source}"
+            if where_clause:
+                query += f" WHERE {where_clause}"
+
+            subset_name = f"__subset_{uuid.uuid4().hex}"
+            row_count = self.db_manager.create_table_as(subset_name, query, params)
+            self._subsets[key] = {
+                "name": subset_name, "filters": active_filters, "row_count": row_count,
+                "version": self.db_manager.get_table_version(subset_name)
+            }
+
+            while len(self._subsets) > self.max_subsets:
+                _, evicted = self._subsets.popitem(last=False)
+                self.db_manager.delete_table(evicted["name"])
+
+            return subset_name
+
+    def _get_existing_columns(self, table_name: str, columns: Dict[str, str]) -> Dict[str, str]:
+        """Resolve the source columns of a subset against the table's actual columns."""
+        # An empty result reports the column names without scanning the table
+        table_columns = self.db_manager.execute_query(f"SELECT * FROM {table_name} LIMIT 0").columns
+        actual_names = {col.lower(): col for col in table_columns}
+        return {
+            alias: actual_names[column.lower()]
+            for alias, column in columns.items() if column.lower() in actual_names
+        }
+
+    def _drop_stale(self, table_name: str, version: int) -> None:
+        """Drop the subsets taken from an earlier version of a table, or changed since created."""
+        for entry_key, entry in list(self._subsets.items()):
+            if entry_key[0] == table_name and entry_key[1] != version:
+                self.db_manager.delete_table(self._subsets.pop(entry_key)["name"])
+            elif self.db_manager.get_table_version(entry["name"]) != entry["version"]:
+                # Replaced or dropped by someone else; the table isn't ours to drop
+                del self._subsets[entry_key]
+
+    def clear(self) -> None:
+        """Drop every materialized subset."""
+        with self._lock:
+            for entry in self._subsets.values():
+                self.db_manager.delete_table(entry["name"])
+            self._subsets.clear()
+
+
+def _get_active_filters(filters: Dict[str, Any], columns: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Get the filters that restrict a subset, keyed by subset column name.
+
+    Mirrors FilterEngine.compile_filters: filters on other columns, None
+    values, empty lists and unsupported shapes are dropped.
+    """
+    aliases = {column.lower(): alias for alias, column in columns.items()}
+    active = {}
+    for key, value in filters.items():
+        alias = aliases.get(key.lower())
+        if alias is None or value is None:
+            continue
+        if isinstance(value, list):
+            if value:
+                active[alias] = list(value)
+        elif isinstance(value, tuple):
+            if len(value) == 2:
+                active[alias] = tuple(value)
+        elif isinstance(value, (str, int, float, bool)):
+            active[alias] = value
+    return active
+
+
+def _freeze(filters: Dict[str, Any]) -> Tuple:
+    """Turn active filters into a hashable key, telling value lists from ranges."""
+    frozen = []
+    for alias, value in sorted(filters.items()):
+        if isinstance(value, list):
+            frozen.append((alias, "in", tuple(value)))
+        elif isinstance(value, tuple):
+            frozen.append((alias, "between", value))
+        else:
+            frozen.append((alias, "=", value))
+    return tuple(frozen)
+
+
+def _is_narrower(filters: Dict[str, Any], cached_filters: Dict[str, Any]) -> bool:
+    """Check whether every row matching filters also matches cached_filters."""
+    for alias, cached_value in cached_filters.items():
+        if alias not in filters:
+            return False
+        if not _value_implies(filters[alias], cached_value):
+            return False
+    return True
+
+
+def _value_implies(value: Any, cached_value: Any) -> bool:
+    """Check whether one column filter selects a subset of another's values."""
+    if isinstance(value, tuple):
+        # A range only provably fits inside a wider range
+        try:
+            return (isinstance(cached_value, tuple)
+                    and cached_value[0] <= value[0] and value[1] <= cached_value[1])
+        except TypeError:
+            return False
+
+    values = value if isinstance(value, list) else [value]
+    if isinstance(cached_value, tuple):
+        try:
+            return all(cached_value[0] <= item <= cached_value[1] for item in values)
+        except TypeError:
+            return False
+    cached_values = cached_value if isinstance(cached_value, list) else [cached_value]
+    return all(item in cached_values for item in values)
@@ -9,6 +9,8 @@ import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
 
+from statistics_engine import compute_statistics, fit_line
+
 
 class VisualizationEngine:
     """Creates interactive visualizations using Plotly."""
@@ -19,7 +21,9 @@ class VisualizationEngine:
         Create bar chart for average scores by demographic group.
         
         Args:
-            data: DataFrame with columns: group, average_score, count
+            data: DataFrame with columns: group, average_score, count, and
+                  average_score_low and average_score_high when estimated
+                  from a sample
         
         Returns:
             Plotly Figure object
@@ -43,12 +47,13 @@ class VisualizationEngine:
                 showscale=True,
                 colorbar=dict(title="Avg Score")
             ),
+            error_y=VisualizationEngine._get_error_bars(data, "average_score"),
             hovertemplate="<b>%{x}</b><br>Average Score: %{y:.2f}<br>Count: %{customdata}<extra></extra>",
             customdata=data["count"]
         ))
         
         fig.update_layout(
-            title="KPI 1: Average Exam Scores by Demographic Group",
+            title="KPI 1: Average Exam Scores by Demographic Group" + VisualizationEngine._get_estimate_note(data),
             xaxis_title="Group",
             yaxis_title="Average Exam Score",
             hovermode="x unified",
@@ -64,7 +69,8 @@ class VisualizationEngine:
         Create scatter plot for study hours correlation.
         
         Args:
-            data: DataFrame with columns: study_hours, exam_score
+            data: DataFrame with columns: study_hours, exam_score, and count
+                  when the points are binned
         
         Returns:
             Plotly Figure object
@@ -75,50 +81,11 @@ class VisualizationEngine:
                 "No data available"
             )
         
-        fig = go.Figure()
-        
-        fig.add_trace(go.Scatter(
-            x=data["study_hours"],
-            y=data["exam_score"],
-            mode="markers",
-            marker=dict(
-                size=8,
-                color=data["exam_score"],
-                colorscale="Plasma",
-                showscale=True,
-                colorbar=dict(title="Exam Score"),
-                line=dict(width=1, color="white")
-            ),
-            text=data.index,
-            hovertemplate="<b>Student %{text}</b><br>Study Hours: %{x:.2f}<br>Exam Score: %{y:.2f}<extra></extra>"
-        ))
-        
-        # Add trend line if enough data points
-        if len(data) > 2:
-            z = np.polyfit(data["study_hours"], data["exam_score"], 1)
-            p = np.poly1d(z)
-            x_trend = np.linspace(data["study_hours"].min(), data["study_hours"].max(), 100)
-            y_trend = p(x_trend)
-            
-            fig.add_trace(go.Scatter(
-                x=x_trend,
-                y=y_trend,
-                mode="lines",
-                name="Trend",
-                line=dict(color="red", dash="dash"),
-                hoverinfo="skip"
-            ))
-        
-        fig.update_layout(
+        return VisualizationEngine._create_scatter_chart(
+            data, "study_hours", "Study Hours", "Plasma",
             title="KPI 2: Correlation Between Study Hours and Exam Performance",
-            xaxis_title="Study Hours per Day",
-            yaxis_title="Exam Score",
-            hovermode="closest",
-            height=400,
-            template="plotly_white"
+            xaxis_title="Study Hours per Day"
         )
-        
-        return fig
     
     @staticmethod
     def create_kpi_3_chart(data: pd.DataFrame) -> go.Figure:
@@ -126,7 +93,9 @@ class VisualizationEngine:
         Create line chart for attendance impact.
         
         Args:
-            data: DataFrame with columns: attendance_range, average_score, count
+            data: DataFrame with columns: attendance_range, average_score,
+                  count, and average_score_low and average_score_high when
+                  estimated from a sample
         
         Returns:
             Plotly Figure object
@@ -147,12 +116,13 @@ class VisualizationEngine:
             line=dict(color="rgb(31, 119, 180)", width=3),
             marker=dict(size=10),
             fill="tozeroy",
+            error_y=VisualizationEngine._get_error_bars(data, "average_score"),
             hovertemplate="<b>Attendance: %{x:.0f}%</b><br>Average Score: %{y:.2f}<br>Count: %{customdata}<extra></extra>",
             customdata=data["count"]
         ))
         
         fig.update_layout(
-            title="KPI 3: Impact of Attendance on Exam Scores",
+            title="KPI 3: Impact of Attendance on Exam Scores" + VisualizationEngine._get_estimate_note(data),
             xaxis_title="Attendance Range (%)",
             yaxis_title="Average Exam Score",
             hovermode="x unified",
@@ -168,7 +138,8 @@ class VisualizationEngine:
         Create scatter plot for sleep performance relationship.
         
         Args:
-            data: DataFrame with columns: sleep_hours, exam_score
+            data: DataFrame with columns: sleep_hours, exam_score, and count
+                  when the points are binned
         
         Returns:
             Plotly Figure object
@@ -179,43 +150,149 @@ class VisualizationEngine:
                 "No data available"
             )
         
+        return VisualizationEngine._create_scatter_chart(
+            data, "sleep_hours", "Sleep Hours", "Turbo",
+            title="KPI 4: Relationship Between Sleep Hours and Academic Performance",
+            xaxis_title="Sleep Hours per Night"
+        )
+    
+    @staticmethod
+    def create_kpi_5_chart(data: pd.DataFrame) -> go.Figure:
+        """
+        Create box chart for the distribution of exam scores by demographic group.
+        
+        Boxes span the interquartile range around the median, and whiskers
+        reach the 10th and 90th percentiles.
+        
+        Args:
+            data: DataFrame with columns: group, count, p10, p25, median, p75, p90, iqr
+        
+        Returns:
+            Plotly Figure object
+        """
+        if data.empty:
+            return VisualizationEngine._create_empty_chart(
+                "KPI 5: Score Distribution",
+                "No data available"
+            )
+        
         fig = go.Figure()
         
-        fig.add_trace(go.Scatter(
-            x=data["sleep_hours"],
-            y=data["exam_score"],
-            mode="markers",
-            marker=dict(
-                size=8,
-                color=data["exam_score"],
-                colorscale="Turbo",
-                showscale=True,
-                colorbar=dict(title="Exam Score"),
-                line=dict(width=1, color="white")
-            ),
-            text=data.index,
-            hovertemplate="<b>Student %{text}</b><br>Sleep Hours: %{x:.2f}<br>Exam Score: %{y:.2f}<extra></extra>"
+        fig.add_trace(go.Box(
+            x=data["group"],
+            lowerfence=data["p10"],
+            q1=data["p25"],
+            median=data["median"],
+            q3=data["p75"],
+            upperfence=data["p90"],
+            name="Exam Score",
+            marker=dict(color="rgb(44, 160, 44)"),
+            hoverinfo="x+y"
         ))
         
-        # Add trend line if enough data points
-        if len(data) > 2:
-            z = np.polyfit(data["sleep_hours"], data["exam_score"], 1)
-            p = np.poly1d(z)
-            x_trend = np.linspace(data["sleep_hours"].min(), data["sleep_hours"].max(), 100)
-            y_trend = p(x_trend)
+        fig.update_layout(
+            title="KPI 5: Exam Score Distribution by Demographic Group"
+                  "<br><sup>Boxes span the 25th to 75th percentile, whiskers the 10th to 90th</sup>"
+                  + VisualizationEngine._get_estimate_note(data),
+            xaxis_title="Group",
+            yaxis_title="Exam Score",
+            height=400,
+            template="plotly_white",
+            showlegend=False
+        )
+        
+        return fig
+    
+    @staticmethod
+    def _create_scatter_chart(data: pd.DataFrame, x_column: str, x_label: str,
+                              colorscale: str, title: str, xaxis_title: str) -> go.Figure:
+        """
+        Create a scatter plot of exam scores with a trend line.
+        
+        Binned data (with a count column) is drawn as one mark per bin, sized
+        and colored by its number of students. The trend line comes from
+        data.attrs["fit"] when the KPI calculator attached it, with the
+        confidence interval of r when it was estimated from a sample.
+        
+        Args:
+            data: DataFrame with columns: x_column, exam_score, optional count
+            x_column: Column on the x axis
+            x_label: Name of the x values in hover text
+            colorscale: Plotly colorscale of the marks
+            title: Chart title
+            xaxis_title: Title of the x axis
+        
+        Returns:
+            Plotly Figure object
+        """
+        # Work on the underlying arrays rather than pandas Series
+        x = data[x_column].to_numpy(dtype=float)
+        y = data["exam_score"].to_numpy(dtype=float)
+        binned = "count" in data.columns
+        
+        fig = go.Figure()
+        
+        if binned:
+            counts = data["count"].to_numpy(dtype=float)
+            fig.add_trace(go.Scatter(
+                x=x,
+                y=y,
+                mode="markers",
+                marker=dict(
+                    size=6 + 14 * np.sqrt(counts / counts.max()),
+                    color=counts,
+                    colorscale=colorscale,
+                    showscale=True,
+                    colorbar=dict(title="Students"),
+                    line=dict(width=1, color="white")
+                ),
+                customdata=counts,
+                hovertemplate=f"<b>%{{customdata:.0f}} students</b><br>{x_label}: %{{x:.2f}}<br>Average Exam Score: %{{y:.2f}}<extra></extra>"
+            ))
+            point_count = data.attrs.get("point_count", int(counts.sum()))
+            title = f"{title}<br><sup>{point_count:,} students in {len(data):,} bins</sup>"
+        else:
+            counts = None
+            fig.add_trace(go.Scatter(
+                x=x,
+                y=y,
+                mode="markers",
+                marker=dict(
+                    size=8,
+                    color=y,
+                    colorscale=colorscale,
+                    showscale=True,
+                    colorbar=dict(title="Exam Score"),
+                    line=dict(width=1, color="white")
+                ),
+                text=data.index,
+                hovertemplate=f"<b>Student %{{text}}</b><br>{x_label}: %{{x:.2f}}<br>Exam Score: %{{y:.2f}}<extra></extra>"
+            ))
+        
+        title += VisualizationEngine._get_estimate_note(data)
+        
+        # Trend line from the regression the KPI query computed over every
+        # point, else from the marks (weighted by count when binned)
+        fit = data.attrs.get("fit") or fit_line(compute_statistics(x, y, counts))
+        if fit["n"] > 2 and not np.isnan(fit["slope"]):
+            x_trend = np.array([x.min(), x.max()])
+            y_trend = fit["slope"] * x_trend + fit["intercept"]
             
+            name = "Trend" if np.isnan(fit["r"]) else f"Trend (r = {fit['r']:.2f})"
+            if not np.isnan(fit.get("r_low", np.nan)):
+                name = f"Trend (r = {fit['r']:.2f}, 95% CI {fit['r_low']:.2f} to {fit['r_high']:.2f})"
             fig.add_trace(go.Scatter(
                 x=x_trend,
                 y=y_trend,
                 mode="lines",
-                name="Trend",
+                name=name,
                 line=dict(color="red", dash="dash"),
                 hoverinfo="skip"
             ))
         
         fig.update_layout(
-            title="KPI 4: Relationship Between Sleep Hours and Academic Performance",
-            xaxis_title="Sleep Hours per Night",
+            title=title,
+            xaxis_title=xaxis_title,
             yaxis_title="Exam Score",
             hovermode="closest",
             height=400,
@@ -224,6 +301,26 @@ class VisualizationEngine:
         
         return fig
     
+    @staticmethod
+    def _get_error_bars(data: pd.DataFrame, column: str) -> Optional[dict]:
+        """Get error bars spanning the confidence interval of an estimated column, if it has one."""
+        if f"{column}_low" not in data.columns:
+            return None
+        return dict(
+            type="data",
+            symmetric=False,
+            array=(data[f"{column}_high"] - data[column]).to_numpy(),
+            arrayminus=(data[column] - data[f"{column}_low"]).to_numpy()
+        )
+    
+    @staticmethod
+    def _get_estimate_note(data: pd.DataFrame) -> str:
+        """Get a subtitle noting that a KPI was estimated from a sample, or an empty string."""
+        fraction = data.attrs.get("sample_fraction")
+        if fraction is None:
+            return ""
+        return f"<br><sup>Estimate from a {fraction:.1%} sample, refining…</sup>"
+    
     @staticmethod
     def _create_empty_chart(title: str, message: str) -> go.Figure:
         """
@@ -0,0 +1,143 @@
+"""
+Unit tests for bitmap_index module.
+"""
+
+import pytest
+import pandas as pd
+import numpy as np
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from bitmap_index import BITMAP_AGGREGATE, BitmapIndex
+from database_manager import DatabaseManager
+from kpi_calculator import KPICalculator
+
+
+class TestBitmapIndex:
+    """Tests for BitmapIndex class."""
+
+    @pytest.fixture
+    def db_manager(self):
+        """Create a database manager with a random habits table."""
+        rng = np.random.default_rng(42)
+        n = 500
+        df = pd.DataFrame({
+            "student_id": [f"S{i}" for i in range(n)],
+            "gender": rng.choice(["Male", "Female", "Other"], n),
+            "age": rng.integers(17, 25, n),
+            "parental_education_level": rng.choice(["High School", "Bachelor", "Master"], n),
+            "study_hours_per_day": rng.uniform(0, 8, n).round(1),
+            "attendance_percentage": rng.uniform(50, 100, n).round(1),
+            "sleep_hours": rng.uniform(3, 10, n).round(1),
+            "exam_score": rng.uniform(20, 100, n).round(1)
+        })
+        df.loc[::50, "exam_score"] = None
+        db = DatabaseManager(":memory:")
+        db.import_data(df, "student_habits_performance")
+        return db
+
+    @pytest.fixture
+    def index(self, db_manager):
+        """Build a bitmap index over the habits table."""
+        return BitmapIndex.from_table(db_manager, "student_habits_performance")
+
+    def _sql_count(self, db_manager, where):
+        query = f"SELECT COUNT(*) AS n FROM student_habits_performance WHERE {where}"
+        return int(db_manager.execute_query(query)["n"][0])
+
+    def test_indexes_low_cardinality_columns(self, index):
+        """Test that facet-counted columns are indexed and integers range-encoded."""
+        assert index.range_columns == ["age"]
+        codes, labels = index.get_codes("gender")
+        assert labels == ["Female", "Male", "Other"]
+        assert len(codes) == index.row_count == 500
+
+    def test_counts_match_sql(self, db_manager, index):
+        """Test that filter combinations select the same rows as SQL."""
+        cases = [
+            ({"gender": "Male"}, "gender = 'Male'"),
+            ({"age": (19, 22)}, "age BETWEEN 19 AND 22"),
+            ({"age": 17}, "age = 17"),
+            ({"age": (16, 17)}, "age BETWEEN 16 AND 17"),
+            ({"gender": ["Male", "Other"], "age": (20, 30), "parental_education_level": "Master"},
+             "gender IN ('Male', 'Other') AND age BETWEEN 20 AND 30 AND parental_education_level = 'Master'"),
+        ]
+        for filters, where in cases:
+            assert index.count(filters) == self._sql_count(db_manager, where)
+
+    def test_unknown_values_select_nothing(self, index):
+        """Test that values absent from the table match no rows."""
+        assert index.count({"gender": "Unknown"}) == 0
+        assert index.count({"age": (30, 40)}) == 0
+
+    def test_filters_on_missing_columns_are_ignored(self, index):
+        """Test that filters on columns the table lacks don't restrict rows."""
+        assert index.count({"Hours_Studied": 5}) == index.row_count
+
+    def test_filter_on_unindexed_column_raises_error(self, index):
+        """Test that filters on columns without bitmaps raise ValueError."""
+        with pytest.raises(ValueError):
+            index.select({"exam_score": 80.0})
+
+    def test_is_current_tracks_table_changes(self, db_manager, index):
+        """Test that the index reports when its table has changed."""
+        assert index.is_current(db_manager) is True
+        db_manager.execute_query("DELETE FROM student_habits_performance WHERE age = 17")
+        assert index.is_current(db_manager) is False
+
+    def test_maintained_index_merges_appended_rows(self, db_manager):
+        """Test that an index maintained by the manager takes in appended rows, new ages included."""
+        table = "student_habits_performance"
+        db_manager.register_aggregate(table, BITMAP_AGGREGATE, BitmapIndex.collect, BitmapIndex.merge)
+        delta = db_manager.execute_query(f"SELECT * FROM {table} LIMIT 40")
+        delta["gender"] = "Other"
+        delta["age"] = 30
+        db_manager.import_data(delta, table, if_exists="append")
+
+        index = db_manager.get_aggregate(table, BITMAP_AGGREGATE)
+        assert index.is_current(db_manager) is True
+        assert index.row_count == 540
+        assert index.count({"age": 30}) == 40
+        assert index.count({"gender": ["Male", "Other"], "age": (20, 30)}) == \
+            self._sql_count(db_manager, "gender IN ('Male', 'Other') AND age BETWEEN 20 AND 30")
+
+        rebuilt = BitmapIndex.from_table(db_manager, table)
+        expected = rebuilt.group_mean({"age": (19, 30)}, "gender", "exam_score")
+        actual = index.group_mean({"age": (19, 30)}, "gender", "exam_score")
+        assert list(actual["group"]) == list(expected["group"])
+        assert list(actual["count"]) == list(expected["count"])
+        np.testing.assert_allclose(actual["mean"], expected["mean"])
+
+        db_manager.execute_query(f"DELETE FROM {table} WHERE age = 30")
+        assert index.is_current(db_manager) is False
+
+    def test_kpis_match_sql(self, db_manager, index):
+        """Test that KPIs computed from the index match those computed with SQL."""
+        filters = {"gender": "Female", "age": (18, 23)}
+        sql_calc = KPICalculator(db_manager, filters)
+        index_calc = KPICalculator(db_manager, filters, bitmap_index=index)
+
+        for kpi in ("calculate_kpi_1_scores_by_group", "calculate_kpi_3_attendance_impact"):
+            expected = getattr(sql_calc, kpi)()
+            actual = getattr(index_calc, kpi)()
+            assert list(actual.columns) == list(expected.columns)
+            assert list(actual["count"]) == list(expected["count"])
+            np.testing.assert_allclose(actual["average_score"], expected["average_score"], rtol=1e-5)
+
+        for kpi in ("calculate_kpi_2_study_correlation", "calculate_kpi_4_sleep_performance"):
+            expected = getattr(sql_calc, kpi)()
+            actual = getattr(index_calc, kpi)()
+            assert list(actual.columns) == list(expected.columns)
+            assert len(actual) == len(expected)
+            np.testing.assert_allclose(np.sort(actual["exam_score"]), np.sort(expected["exam_score"]), rtol=1e-5)
+            assert actual.attrs["fit"]["n"] == expected.attrs["fit"]["n"]
+            assert actual.attrs["fit"]["slope"] == pytest.approx(expected.attrs["fit"]["slope"], rel=1e-5)
+
+    def test_stale_index_falls_back_to_sql(self, db_manager, index):
+        """Test that KPIs ignore an index built before the table changed."""
+        db_manager.execute_query("DELETE FROM student_habits_performance WHERE gender = 'Male'")
+        result = KPICalculator(db_manager, bitmap_index=index).calculate_kpi_1_scores_by_group()
+        assert "Male" not in list(result["group"])
@@ -5,6 +5,7 @@ Unit tests for database_manager module.
 import pytest
 import pandas as pd
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Add src to path
@@ -59,6 +60,162 @@ class TestDatabaseManager:
         assert isinstance(result, pd.DataFrame)
         assert len(result) == 5
     
+    def test_execute_query_arrow_format(self, db_manager, sample_df):
+        """Test that results can be returned as an Arrow table."""
+        db_manager.import_data(sample_df, "test_table")
+        result = db_manager.execute_query("SELECT id, name FROM test_table", result_format="arrow")
+        assert result.num_rows == 5
+        assert result.column_names == ["id", "name"]
+    
+    def test_execute_query_numpy_format(self, db_manager, sample_df):
+        """Test that results can be returned as a dictionary of NumPy arrays."""
+        db_manager.import_data(sample_df, "test_table")
+        result = db_manager.execute_query("SELECT age FROM test_table ORDER BY id", result_format="numpy")
+        assert list(result["age"]) == [25, 30, 35, 28, 32]
+    
+    def test_execute_query_invalid_format_raises_error(self, db_manager):
+        """Test that an unknown result format raises ValueError."""
+        with pytest.raises(ValueError):
+            db_manager.execute_query("SELECT 1", result_format="csv")
+    
+    def test_repeated_query_served_from_cache(self, db_manager, sample_df):
+        """Test that repeating a query (modulo whitespace) hits the result cache."""
+        db_manager.import_data(sample_df, "test_table")
+        db_manager.execute_query("SELECT * FROM test_table")
+        result = db_manager.execute_query("SELECT *\n  FROM test_table")
+        assert len(result) == 5
+        assert db_manager.result_cache.get_stats()["hits"] == 1
+    
+    def test_cache_invalidated_when_table_changes(self, db_manager, sample_df):
+        """Test that cached results are not served after the table is modified."""
+        db_manager.import_data(sample_df, "test_table")
+        db_manager.execute_query("SELECT * FROM test_table")
+        db_manager.import_data(sample_df, "test_table", if_exists="append")
+        assert len(db_manager.execute_query("SELECT * FROM test_table")) == 10
+        db_manager.execute_query("DELETE FROM test_table WHERE id = 1")
+        assert len(db_manager.execute_query("SELECT * FROM test_table")) == 8
+    
+    def test_execute_query_with_params(self, db_manager, sample_df):
+        """Test that parameterized queries are run with new values."""
+        db_manager.import_data(sample_df, "test_table")
+        query = "SELECT name FROM test_table WHERE age BETWEEN ? AND ? ORDER BY id"
+        assert list(db_manager.execute_query(query, params=[25, 30])["name"]) == ["Alice", "Bob", "David"]
+        assert list(db_manager.execute_query(query, params=[31, 40])["name"]) == ["Charlie", "Eve"]
+    
+    def test_parameterized_query_sees_replaced_table(self, db_manager, sample_df):
+        """Test that a parameterized query reads a table replaced since its last run."""
+        db_manager.import_data(sample_df, "test_table")
+        query = "SELECT count(*) AS n FROM test_table WHERE name = ?"
+        assert db_manager.execute_query(query, params=["Bob"])["n"][0] == 1
+        db_manager.import_data(pd.concat([sample_df, sample_df]), "test_table")
+        assert db_manager.execute_query(query, params=["Bob"])["n"][0] == 2
+    
+    def test_query_params_are_not_spliced_into_sql(self, db_manager, sample_df):
+        """Test that quotes in parameter values are matched literally."""
+        db_manager.import_data(sample_df, "test_table")
+        query = "SELECT count(*) AS n FROM test_table WHERE name = ?"
+        assert db_manager.execute_query(query, params=["x' OR '1'='1"])["n"][0] == 0
+    
+    def test_unsupported_query_param_raises_error(self, db_manager):
+        """Test that parameters without a SQL literal form raise ValueError."""
+        with pytest.raises(ValueError):
+            db_manager.execute_query("SELECT ?", params=[object()])
+    
+    def test_import_collects_facets(self, db_manager):
+        """Test that importing a table collects the values and ranges of its columns."""
+        df = pd.DataFrame({"gender": ["Male", "Female", "Male", "Male"], "score": [80.0, 90.0, 70.0, None]})
+        db_manager.import_data(df, "students")
+        facets = db_manager.get_facets("students")
+        assert facets["row_count"] == 4
+        assert facets["columns"]["gender"]["values"] == {"Male": 3, "Female": 1}
+        assert facets["columns"]["score"] == {"null_count": 1, "min": 70.0, "max": 90.0}
+    
+    def test_facets_updated_on_append_and_upsert(self, db_manager):
+        """Test that facets follow appended and upserted rows."""
+        df = pd.DataFrame({"student_id": ["S1", "S2", "S3", "S4"], "gender": ["Male", "Female", "Male", "Male"]})
+        db_manager.import_data(df, "students")
+        
+        delta = pd.DataFrame({"student_id": ["S5"], "gender": ["Female"]})
+        db_manager.import_data(delta, "students", if_exists="append")
+        assert db_manager.get_facets("students")["columns"]["gender"]["values"] == {"Male": 3, "Female": 2}
+        
+        changed = pd.DataFrame({"student_id": ["S1"], "gender": ["Female"]})
+        db_manager.import_data(changed, "students", if_exists="upsert")
+        facets = db_manager.get_facets("students")
+        assert facets["row_count"] == 5
+        assert facets["columns"]["gender"]["values"] == {"Male": 2, "Female": 3}
+    
+    def test_facets_dropped_when_query_modifies_table(self, db_manager, sample_df):
+        """Test that a modifying query discards the facets it would make stale."""
+        db_manager.import_data(sample_df, "test_table")
+        assert db_manager.get_facets("test_table") is not None
+        db_manager.execute_query("DELETE FROM test_table WHERE id = 1")
+        assert db_manager.get_facets("test_table") is None
+    
+    def test_merge_tables_replaces_stale_facets_and_aggregates(self, db_manager, sample_df):
+        """Test that a merged table gets the facets and aggregates of its new contents."""
+        db_manager.import_data(sample_df, "merged")
+        db_manager.register_aggregate(
+            "merged", "rows",
+            lambda connection, table_name, source, column_types:
+                connection.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0],
+            lambda current, delta: current + delta
+        )
+        # Dropped behind the manager's back, leaving its facets and aggregates
+        db_manager.connection.execute("DROP TABLE merged")
+        
+        db_manager.import_data(sample_df[sample_df["age"] > 30], "older")
+        db_manager.import_data(sample_df[["id", "score"]].head(2), "first_scores")
+        db_manager.merge_tables("older", "first_scores", "id", "merged")
+        
+        facets = db_manager.get_facets("merged")
+        assert facets["row_count"] == 4
+        assert facets["columns"]["age"]["null_count"] == 2
+        assert db_manager.get_aggregate("merged", "rows") == 4
+    
+    def test_aggregate_maintained_from_appended_rows(self, db_manager):
+        """Test that a registered aggregate is merged with the appended rows only."""
+        sources = []
+        
+        def collect(connection, table_name, source, column_types):
+            sources.append(source)
+            if not source.upper().startswith("SELECT"):
+                source = f"SELECT * FROM {source}"
+            return connection.execute(f"SELECT COUNT(*) FROM ({source})").fetchone()[0]
+        
+        df = pd.DataFrame({"student_id": ["S1", "S2"], "score": [80.0, 90.0]})
+        db_manager.import_data(df, "students")
+        db_manager.register_aggregate("students", "rows", collect, lambda current, delta: current + delta)
+        assert db_manager.get_aggregate("students", "rows") == 2
+        
+        delta = pd.DataFrame({"student_id": ["S3"], "score": [70.0]})
+        db_manager.import_data(delta, "students", if_exists="append")
+        assert db_manager.get_aggregate("students", "rows") == 3
+        assert sources[-1] != "students"
+        assert db_manager.recompute_aggregate("students", "rows") == 3
+        
+        db_manager.import_data(delta, "students")
+        assert db_manager.get_aggregate("students", "rows") == 1
+        db_manager.execute_query("DELETE FROM students")
+        assert db_manager.get_aggregate("students", "rows") is None
+    
+    def test_failing_aggregate_does_not_fail_import(self, db_manager, sample_df):
+        """Test that an aggregate that can't be collected is left out of an import."""
+        def collect(connection, table_name, source, column_types):
+            raise ValueError("unsupported")
+        
+        db_manager._aggregators["test_table"] = {"broken": (collect, lambda current, delta: None)}
+        db_manager.import_data(sample_df, "test_table")
+        assert db_manager.get_aggregate("test_table", "broken") is None
+        assert db_manager.table_exists("test_table") is True
+    
+    def test_unresolved_statement_bumps_all_versions(self, db_manager, sample_df):
+        """Test that a modifying statement whose tables can't be resolved bumps every version."""
+        db_manager.import_data(sample_df, "test_table")
+        version = db_manager.get_table_version("test_table")
+        db_manager.execute_query("DELETE FROM test_table WHERE id = 1")
+        assert db_manager.get_table_version("test_table") > version
+    
     def test_execute_empty_query_raises_error(self, db_manager):
         """Test that empty query raises ValueError."""
         with pytest.raises(ValueError):
@@ -92,6 +249,166 @@ class TestDatabaseManager:
         db_manager.delete_table("test_table")
         assert db_manager.table_exists("test_table") is False
     
+    def test_import_csv_creates_table(self, db_manager, temp_dir):
+        """Test that importing a CSV file creates a table with its rows."""
+        csv_path = temp_dir / "data.csv"
+        csv_path.write_text("id,name,job\n1,Alice,Yes\n2,Bob,No\n")
+        row_count = db_manager.import_csv(csv_path, "csv_table")
+        assert row_count == 2
+        result = db_manager.execute_query("SELECT * FROM csv_table ORDER BY id")
+        assert list(result["name"]) == ["Alice", "Bob"]
+        assert list(result["job"]) == ["Yes", "No"]
+    
+    def test_import_csv_removes_duplicates_keeping_order(self, db_manager, temp_dir):
+        """Test that CSV import drops exact duplicates and keeps first-occurrence order."""
+        csv_path = temp_dir / "data.csv"
+        csv_path.write_text("id,name\n3,Charlie\n1,Alice\n3,Charlie\n2,Bob\n1,Alice\n")
+        row_count = db_manager.import_csv(csv_path, "csv_table")
+        assert row_count == 3
+        result = db_manager.execute_query("SELECT id FROM csv_table")
+        assert list(result["id"]) == [3, 1, 2]
+    
+    def test_import_csv_empty_file_raises_error(self, db_manager, sample_df, temp_dir):
+        """Test that a header-only CSV raises ValueError and keeps the existing table."""
+        db_manager.import_data(sample_df, "csv_table")
+        csv_path = temp_dir / "empty.csv"
+        csv_path.write_text("id,name,age,score\n")
+        with pytest.raises(ValueError):
+            db_manager.import_csv(csv_path, "csv_table")
+        assert db_manager.get_table_info("csv_table")["row_count"] == 5
+    
+    def test_import_csv_with_plan_falls_back_on_bad_sample_types(self, db_manager, temp_dir):
+        """Test that a plan whose sampled types don't fit the full file is re-detected."""
+        csv_path = temp_dir / "data.csv"
+        csv_path.write_text("id;score\n1;80.5\n2;absent\n")
+        plan = {
+            "delimiter": ";",
+            "encoding": "utf-8",
+            "columns": ["id", "score"],
+            "dtypes": {"id": "integer", "score": "float"}
+        }
+        assert db_manager.import_csv(csv_path, "csv_table", plan=plan) == 2
+        result = db_manager.execute_query("SELECT score FROM csv_table ORDER BY id")
+        assert list(result["score"]) == ["80.5", "absent"]
+    
+    def test_import_csv_falls_back_on_bytes_after_sample(self, db_manager, temp_dir):
+        """Test that a file that is UTF-8 only in its sample is imported as latin-1."""
+        csv_path = temp_dir / "data.csv"
+        csv_path.write_bytes(b"name;score\n" + b"Ana;80\n" * 3000 + "Zo\xe9;90\n".encode("latin-1"))
+        plan = {
+            "delimiter": ";",
+            "encoding": "utf-8",
+            "columns": ["name", "score"],
+            "dtypes": {"name": "string", "score": "integer"}
+        }
+        assert db_manager.import_csv(csv_path, "csv_table", plan=plan, deduplicate=False) == 3001
+        result = db_manager.execute_query("SELECT name FROM csv_table WHERE score = 90")
+        assert list(result["name"]) == ["Zoé"]
+        assert db_manager.import_csv(csv_path, "plain_table", deduplicate=False) == 3001
+    
+    def test_import_csv_records_fingerprint(self, db_manager, temp_dir):
+        """Test that a fingerprinted import is recorded and cleared on delete."""
+        csv_path = temp_dir / "data.csv"
+        csv_path.write_text("id,name\n1,Alice\n")
+        db_manager.import_csv(csv_path, "csv_table", fingerprint="abc123")
+        assert db_manager.get_table_fingerprint("csv_table") == "abc123"
+        db_manager.delete_table("csv_table")
+        assert db_manager.get_table_fingerprint("csv_table") is None
+    
+    def test_import_data_clears_fingerprint(self, db_manager, sample_df, temp_dir):
+        """Test that replacing a table by other means forgets its fingerprint."""
+        csv_path = temp_dir / "data.csv"
+        csv_path.write_text("id,name\n1,Alice\n")
+        db_manager.import_csv(csv_path, "csv_table", fingerprint="abc123")
+        db_manager.import_data(sample_df, "csv_table")
+        assert db_manager.get_table_fingerprint("csv_table") is None
+    
+    def test_import_compacts_column_types(self, db_manager):
+        """Test that imports store low-cardinality text as ENUM and downcast integers."""
+        df = pd.DataFrame({
+            "id": list(range(10)),
+            "gender": ["Male", "Female"] * 5,
+            "score": [85.5, 90.25] * 5
+        })
+        db_manager.import_data(df, "test_table")
+        types = {col["name"]: col["type"] for col in db_manager.get_table_info("test_table")["columns"]}
+        assert types["id"] == "TINYINT"
+        assert types["gender"].startswith("ENUM")
+        assert types["score"] == "FLOAT"
+        result = db_manager.execute_query("SELECT gender FROM test_table WHERE gender = 'Male'")
+        assert len(result) == 5
+    
+    def test_import_without_compaction_keeps_types(self, db_manager, sample_df):
+        """Test that compact=False keeps the inferred column types."""
+        db_manager.import_data(sample_df, "test_table", compact=False)
+        types = {col["name"]: col["type"] for col in db_manager.get_table_info("test_table")["columns"]}
+        assert types["id"] == "BIGINT"
+    
+    def test_append_widens_compacted_columns(self, db_manager, temp_dir):
+        """Test that appended rows outside a compacted type's domain widen the column."""
+        csv_path = temp_dir / "data.csv"
+        csv_path.write_text("id,gender\n1,Male\n2,Female\n3,Male\n4,Female\n")
+        db_manager.import_csv(csv_path, "csv_table")
+        delta_path = temp_dir / "delta.csv"
+        delta_path.write_text("id,gender\n1000,Other\n")
+        db_manager.import_csv(delta_path, "csv_table", if_exists="append")
+        result = db_manager.execute_query("SELECT id, gender FROM csv_table WHERE id = 1000")
+        assert result["gender"].iloc[0] == "Other"
+    
+    def test_import_data_append_adds_rows(self, db_manager, sample_df):
+        """Test that appending inserts rows into the existing table."""
+        db_manager.import_data(sample_df, "test_table")
+        delta = pd.DataFrame({"id": [6], "name": ["Frank"], "age": [40], "score": [70]})
+        assert db_manager.import_data(delta, "test_table", if_exists="append") == 1
+        assert db_manager.get_table_info("test_table")["row_count"] == 6
+    
+    def test_import_data_upsert_replaces_matching_keys(self, db_manager, sample_df):
+        """Test that upsert updates rows with matching keys and appends new ones."""
+        db_manager.import_data(sample_df, "test_table")
+        delta = pd.DataFrame({
+            "id": [2, 6],
+            "name": ["Bob", "Frank"],
+            "age": [31, 40],
+            "score": [95, 70]
+        })
+        db_manager.import_data(delta, "test_table", if_exists="upsert", key_column="id")
+        result = db_manager.execute_query("SELECT id, score FROM test_table ORDER BY id")
+        assert list(result["id"]) == [1, 2, 3, 4, 5, 6]
+        assert result.loc[result["id"] == 2, "score"].iloc[0] == 95
+    
+    def test_import_data_fail_on_existing_table(self, db_manager, sample_df):
+        """Test that if_exists='fail' raises when the table exists."""
+        db_manager.import_data(sample_df, "test_table")
+        with pytest.raises(ValueError):
+            db_manager.import_data(sample_df, "test_table", if_exists="fail")
+    
+    def test_table_version_increments_on_change(self, db_manager, sample_df):
+        """Test that table versions advance on import, append and delete."""
+        assert db_manager.get_table_version("test_table") == 0
+        db_manager.import_data(sample_df, "test_table")
+        first = db_manager.get_table_version("test_table")
+        db_manager.import_data(sample_df, "test_table", if_exists="append")
+        second = db_manager.get_table_version("test_table")
+        db_manager.delete_table("test_table")
+        assert 0 < first < second < db_manager.get_table_version("test_table")
+    
+    def test_cursor_reused_when_nested(self, db_manager):
+        """Test that nested cursor blocks in one thread share a cursor."""
+        with db_manager.cursor() as outer:
+            with db_manager.cursor() as inner:
+                assert inner is outer
+    
+    def test_concurrent_queries_use_bounded_pool(self, sample_df):
+        """Test that queries from many threads succeed on a small cursor pool."""
+        db = DatabaseManager(":memory:", max_cursors=2)
+        db.import_data(sample_df, "test_table")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            counts = list(executor.map(
+                lambda _: len(db.execute_query("SELECT * FROM test_table")), range(32)
+            ))
+        assert counts == [5] * 32
+        assert db._idle_cursors.qsize() <= 2
+    
     def test_close_connection(self, db_manager):
         """Test closing database connection."""
         db_manager.close()
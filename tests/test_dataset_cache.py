@@ -0,0 +1,91 @@
+"""
+Unit tests for dataset_cache module.
+"""
+
+import pytest
+import pandas as pd
+import os
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from database_manager import DatabaseManager
+from dataset_cache import DatasetCache, CACHE_SCHEMA_VERSION
+
+
+class TestDatasetCache:
+    """Tests for DatasetCache class."""
+    
+    @pytest.fixture
+    def db_manager(self):
+        """Create an in-memory database manager with a sample table."""
+        db = DatabaseManager(":memory:")
+        df = pd.DataFrame({
+            "student_id": [1, 2, 3, 4],
+            "gender": ["Male", "Female", "Male", "Female"],
+            "exam_score": [85.5, 90.0, 78.25, 92.0]
+        })
+        db.import_data(df, "students")
+        return db
+    
+    @pytest.fixture
+    def cache(self, temp_dir):
+        """Create a dataset cache in a temporary directory."""
+        return DatasetCache(temp_dir / "cache")
+    
+    def test_path_includes_schema_version(self, cache):
+        """Test that cache paths are keyed by fingerprint and schema version."""
+        path = cache.get_path("abc123")
+        assert path.name == f"abc123_v{CACHE_SCHEMA_VERSION}.parquet"
+    
+    def test_store_and_load_roundtrip(self, db_manager, cache):
+        """Test that a stored table can be loaded back with the same rows."""
+        cache.store(db_manager, "students", "abc123")
+        assert cache.contains("abc123")
+        
+        other_db = DatabaseManager(":memory:")
+        row_count = cache.load(other_db, "students", "abc123")
+        assert row_count == 4
+        result = other_db.execute_query("SELECT * FROM students ORDER BY student_id")
+        assert list(result["gender"]) == ["Male", "Female", "Male", "Female"]
+        assert other_db.get_table_fingerprint("students") == "abc123"
+    
+    def test_load_missing_fingerprint_raises_error(self, db_manager, cache):
+        """Test that loading an uncached dataset raises KeyError."""
+        assert cache.contains("missing") is False
+        with pytest.raises(KeyError):
+            cache.load(db_manager, "students", "missing")
+    
+    def test_clear_removes_cached_datasets(self, db_manager, cache):
+        """Test that clearing the cache removes stored files."""
+        cache.store(db_manager, "students", "abc123")
+        cache.clear()
+        assert cache.contains("abc123") is False
+    
+    def test_least_recently_used_files_evicted_beyond_limit(self, db_manager, temp_dir):
+        """Test that storing past the size limit removes the least recently used files."""
+        cache = DatasetCache(temp_dir / "cache")
+        size = cache.store(db_manager, "students", "first").stat().st_size
+        cache = DatasetCache(temp_dir / "cache", max_bytes=2 * size)
+        cache.store(db_manager, "students", "second")
+        
+        # Loading "first" makes "second" the least recently used
+        for fingerprint, mtime in (("first", 1000), ("second", 2000)):
+            os.utime(cache.get_path(fingerprint), (mtime, mtime))
+        cache.load(db_manager, "reloaded", "first")
+        cache.store(db_manager, "students", "third")
+        
+        assert cache.contains("first") is True
+        assert cache.contains("second") is False
+        assert cache.contains("third") is True
+    
+    def test_new_file_kept_when_larger_than_limit(self, db_manager, temp_dir):
+        """Test that a dataset larger than the whole budget is still cached."""
+        cache = DatasetCache(temp_dir / "cache", max_bytes=1)
+        cache.store(db_manager, "students", "first")
+        cache.store(db_manager, "students", "second")
+        
+        assert cache.contains("first") is False
+        assert cache.contains("second") is True
@@ -0,0 +1,89 @@
+"""
+Unit tests for facet_catalog module.
+"""
+
+import pytest
+import duckdb
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from facet_catalog import collect_facets, get_facet_columns, merge_facets
+
+
+class TestCollectFacets:
+    """Tests for collect_facets function."""
+
+    @pytest.fixture
+    def connection(self):
+        """Create a connection with a small compacted table."""
+        conn = duckdb.connect(":memory:")
+        conn.execute("CREATE TYPE students__gender AS ENUM ('Female', 'Male')")
+        conn.execute(
+            "CREATE TABLE students (gender students__gender, age TINYINT, score DOUBLE, name VARCHAR)"
+        )
+        conn.execute(
+            "INSERT INTO students VALUES ('Male', 20, 80.0, 'a'), ('Female', 21, 90.5, 'b'), "
+            "('Male', 20, NULL, 'c'), (NULL, NULL, 70.0, 'd')"
+        )
+        return conn
+
+    def _column_types(self, conn):
+        return {row[1]: row[2] for row in conn.execute("PRAGMA table_info(students)").fetchall()}
+
+    def test_get_facet_columns(self):
+        """Test that value counts are kept for bounded types and ranges for numeric ones."""
+        value_columns, numeric_columns = get_facet_columns(
+            {"gender": "ENUM('Female', 'Male')", "age": "TINYINT", "score": "DOUBLE", "name": "VARCHAR"}
+        )
+        assert value_columns == ["gender", "age"]
+        assert numeric_columns == ["age", "score"]
+
+    def test_collects_counts_and_ranges(self, connection):
+        """Test that value counts, ranges and null counts match the table."""
+        facets = collect_facets(connection, "students", self._column_types(connection))
+        columns = facets["columns"]
+
+        assert facets["row_count"] == 4
+        assert columns["gender"] == {"null_count": 1, "values": {"Male": 2, "Female": 1}}
+        assert columns["age"] == {"null_count": 1, "min": 20, "max": 21, "values": {20: 2, 21: 1}}
+        assert columns["score"] == {"null_count": 1, "min": 70.0, "max": 90.5}
+        assert "name" not in columns
+
+    def test_missing_source_columns_count_as_null(self, connection):
+        """Test that columns absent from the source are counted as NULL."""
+        facets = collect_facets(
+            connection, "SELECT 'Female' AS gender, 22 AS age", self._column_types(connection)
+        )
+        assert facets["row_count"] == 1
+        assert facets["columns"]["age"]["values"] == {22: 1}
+        assert facets["columns"]["score"] == {"null_count": 1, "min": None, "max": None}
+
+
+class TestMergeFacets:
+    """Tests for merge_facets function."""
+
+    def test_merges_counts_and_ranges(self):
+        """Test that counts add up and ranges widen."""
+        base = {"row_count": 3, "columns": {
+            "gender": {"null_count": 0, "values": {"Male": 2, "Female": 1}},
+            "score": {"null_count": 1, "min": 70.0, "max": 90.0}
+        }}
+        delta = {"row_count": 2, "columns": {
+            "gender": {"null_count": 1, "values": {"Other": 1}},
+            "score": {"null_count": 0, "min": 95.0, "max": 99.0}
+        }}
+        merged = merge_facets(base, delta)
+
+        assert merged["row_count"] == 5
+        assert merged["columns"]["gender"] == {"null_count": 1, "values": {"Male": 2, "Female": 1, "Other": 1}}
+        assert merged["columns"]["score"] == {"null_count": 1, "min": 70.0, "max": 99.0}
+        assert base["columns"]["gender"]["values"] == {"Male": 2, "Female": 1}
+
+    def test_mismatched_columns_return_none(self):
+        """Test that facets over different columns are not merged."""
+        base = {"row_count": 1, "columns": {"gender": {"null_count": 0, "values": {"Male": 1}}}}
+        delta = {"row_count": 1, "columns": {}}
+        assert merge_facets(base, delta) is None
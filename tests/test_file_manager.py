@@ -14,8 +14,10 @@ sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 from file_manager import (
     validate_csv_structure, parse_csv_file, get_file_info,
     validate_csv_not_empty, validate_file_size, normalize_column_names,
-    validate_data_types, FileValidationError, FileEncodingError
+    validate_data_types, FileValidationError, FileEncodingError,
+    spooled_upload, sniff_csv_plan, compute_fingerprint
 )
+from io import BytesIO
 
 
 class TestValidateCSVStructure:
@@ -48,6 +50,53 @@ class TestValidateCSVStructure:
         assert is_valid is False
 
 
+    def test_sampled_validation_ignores_rows_after_sample(self):
+        """Test that sampled validation only parses the header and sample rows."""
+        csv_content = "name,age\nJohn,25\nJane,30\n\"unterminated"
+        is_valid, error_msg = validate_csv_structure(csv_content, ["name", "age"], sample_rows=2)
+        assert is_valid is True
+
+
+class TestSniffCSVPlan:
+    """Tests for sniff_csv_plan function."""
+    
+    def test_plan_for_valid_file(self, temp_dir):
+        """Test that a valid file yields a plan with delimiter, encoding and dtypes."""
+        csv_path = temp_dir / "data.csv"
+        csv_path.write_text("Name;Age;Score\nJohn;25;85.5\nJane;30;90.0\n")
+        is_valid, error_msg, plan = sniff_csv_plan(csv_path, ["name", "age"], {"age": "numeric"})
+        assert is_valid is True
+        assert error_msg == ""
+        assert plan["delimiter"] == ";"
+        assert plan["encoding"] == "utf-8"
+        assert plan["dtypes"] == {"Name": "string", "Age": "integer", "Score": "float"}
+    
+    def test_missing_columns_rejected(self, temp_dir):
+        """Test that missing required columns are reported without a plan."""
+        csv_path = temp_dir / "data.csv"
+        csv_path.write_text("name,age\nJohn,25\n")
+        is_valid, error_msg, plan = sniff_csv_plan(csv_path, ["name", "score"])
+        assert is_valid is False
+        assert "score" in error_msg
+        assert plan is None
+    
+    def test_non_numeric_sample_rejected(self, temp_dir):
+        """Test that non-numeric values in an expected numeric column are rejected."""
+        csv_path = temp_dir / "data.csv"
+        csv_path.write_text("name,age\nJohn,25\nJane,unknown\n")
+        is_valid, error_msg, plan = sniff_csv_plan(csv_path, ["name", "age"], {"age": "numeric"})
+        assert is_valid is False
+        assert "age" in error_msg
+    
+    def test_only_sample_rows_are_read(self, temp_dir):
+        """Test that rows beyond the sample are not validated."""
+        csv_path = temp_dir / "data.csv"
+        csv_path.write_text("name,age\nJohn,25\nJane,30\nBob,unknown\n")
+        is_valid, _, plan = sniff_csv_plan(csv_path, ["age"], {"age": "numeric"}, sample_rows=2)
+        assert is_valid is True
+        assert plan["dtypes"]["age"] == "integer"
+
+
 class TestParseCSVFile:
     """Tests for parse_csv_file function."""
     
@@ -67,6 +116,18 @@ class TestParseCSVFile:
         assert pd.isna(df.iloc[0]["score"])
         assert pd.isna(df.iloc[1]["age"])
     
+    def test_parse_with_plan_uses_delimiter(self):
+        """Test parsing with a parse plan reuses its delimiter and types."""
+        plan = {
+            "delimiter": ";",
+            "encoding": "utf-8",
+            "columns": ["name", "score"],
+            "dtypes": {"name": "string", "score": "float"}
+        }
+        df = parse_csv_file("name;score\nJohn;85\n", plan=plan)
+        assert list(df.columns) == ["name", "score"]
+        assert df["score"].dtype == "float64"
+    
     def test_parse_invalid_csv_raises_error(self):
         """Test that parsing invalid CSV raises ValueError."""
         csv_content = ""  # Empty content should raise error
@@ -96,3 +157,32 @@ class TestGetFileInfo:
         info = get_file_info(df)
         assert info["row_count"] == 0
         assert info["column_count"] == 0
+
+
+class TestSpooledUpload:
+    """Tests for spooled_upload function."""
+    
+    def test_spooled_upload_writes_bytes_to_disk(self):
+        """Test that the upload bytes are copied unchanged to a temporary file."""
+        content = b"name,age\nJohn,25\nJane,30\n"
+        with spooled_upload(BytesIO(content), chunk_size=4) as csv_path:
+            assert csv_path.read_bytes() == content
+        assert not csv_path.exists()
+
+
+class TestComputeFingerprint:
+    """Tests for compute_fingerprint function."""
+    
+    def test_fingerprint_depends_only_on_content(self):
+        """Test that identical bytes share a fingerprint and different bytes don't."""
+        first = compute_fingerprint(BytesIO(b"name,age\nJohn,25\n"), chunk_size=3)
+        same = compute_fingerprint(BytesIO(b"name,age\nJohn,25\n"))
+        other = compute_fingerprint(BytesIO(b"name,age\nJohn,26\n"))
+        assert first == same
+        assert first != other
+    
+    def test_fingerprint_rewinds_file(self):
+        """Test that the file can still be read after fingerprinting."""
+        upload = BytesIO(b"name,age\nJohn,25\n")
+        compute_fingerprint(upload)
+        assert upload.read() == b"name,age\nJohn,25\n"
@@ -69,6 +69,37 @@ class TestFilterEngine:
         where_clause = filter_engine.build_filter_query(filters)
         assert where_clause == ""
     
+    def test_build_filter_query_escapes_quotes(self, filter_engine):
+        """Test that quotes in string values are escaped."""
+        where_clause = filter_engine.build_filter_query({"name": "O'Brien"})
+        assert where_clause == "name = 'O''Brien'"
+    
+    def test_compile_filters_uses_placeholders(self, filter_engine):
+        """Test that compiled filters bind values as parameters."""
+        filters = {"gender": ["Male", "Female"], "age": (25, 30), "id": 3}
+        where_clause, params = filter_engine.compile_filters(filters)
+        assert where_clause == '"gender" IN (?, ?) AND "age" BETWEEN ? AND ? AND "id" = ?'
+        assert params == ["Male", "Female", 25, 30, 3]
+    
+    def test_compile_filters_same_sql_for_different_values(self, filter_engine):
+        """Test that filter values don't change the compiled SQL."""
+        first, _ = filter_engine.compile_filters({"gender": "Male", "age": (17, 20)})
+        second, _ = filter_engine.compile_filters({"gender": "Female", "age": (21, 24)})
+        assert first == second
+    
+    def test_compile_filters_resolves_available_columns(self, filter_engine):
+        """Test that filters are matched case-insensitively and missing columns skipped."""
+        filters = {"gender": "Male", "age": (17, 24)}
+        where_clause, params = filter_engine.compile_filters(filters, ["Gender", "Exam_Score"])
+        assert where_clause == '"Gender" = ?'
+        assert params == ["Male"]
+    
+    def test_compiled_filters_execute(self, db_manager, filter_engine):
+        """Test running a query with compiled filters."""
+        where_clause, params = filter_engine.compile_filters({"gender": "Male", "age": (30, 35)})
+        result = db_manager.execute_query(f"SELECT id FROM students WHERE {where_clause}", params=params)
+        assert sorted(result["id"]) == [3, 5]
+    
     def test_apply_filters_to_query(self, filter_engine):
         """Test applying filters to a query."""
         base_query = "SELECT * FROM students"
@@ -97,6 +128,44 @@ class TestFilterEngine:
         assert min_val == 25
         assert max_val == 35
     
+    def test_filter_options_served_from_facets(self, db_manager, filter_engine):
+        """Test that filter options and ranges are read without querying the table."""
+        queries = []
+        original_execute = db_manager.execute_query
+        db_manager.execute_query = lambda *args, **kwargs: queries.append(args) or original_execute(*args, **kwargs)
+        
+        assert filter_engine.get_filter_options("students", "gender") == ["Female", "Male"]
+        assert filter_engine.get_value_counts("students", "gender") == {"Female": 2, "Male": 3}
+        assert filter_engine.get_column_range("students", "age") == (25.0, 35.0)
+        assert queries == []
+    
+    def test_filter_options_without_facets(self, db_manager, filter_engine):
+        """Test that filter options fall back to a query for tables without facets."""
+        db_manager.execute_query("CREATE TABLE other AS SELECT * FROM students")
+        assert filter_engine.get_filter_options("other", "gender") == ["Female", "Male"]
+        assert filter_engine.get_value_counts("other", "gender") == {"Female": 2, "Male": 3}
+    
+    def test_facet_counts_exclude_own_filter(self, filter_engine):
+        """Test that each dimension's counts apply only the other dimensions' filters."""
+        counts = filter_engine.get_facet_counts(
+            "students", ["gender", "age"], {"gender": "Male", "age": (30, 35)}
+        )
+        assert counts["gender"] == {"Female": 1, "Male": 2}
+        assert counts["age"] == {25: 1, 28: 0, 30: 0, 32: 1, 35: 1}
+    
+    def test_facet_counts_apply_other_filters(self, filter_engine):
+        """Test that filters on columns that aren't dimensions restrict all counts."""
+        counts = filter_engine.get_facet_counts("students", ["gender"], {"score": 90})
+        assert counts["gender"] == {"Female": 1, "Male": 0}
+    
+    def test_facet_counts_single_query(self, db_manager, filter_engine):
+        """Test that all dimensions are counted with one query."""
+        queries = []
+        original_execute = db_manager.execute_query
+        db_manager.execute_query = lambda *args, **kwargs: queries.append(args) or original_execute(*args, **kwargs)
+        filter_engine.get_facet_counts("students", ["gender", "age", "score"], {"gender": "Female"})
+        assert len(queries) == 1
+    
     def test_validate_filters_valid(self, filter_engine):
         """Test validating valid filters."""
         filters = {"gender": ["Male"], "age": (25, 35)}
@@ -100,3 +100,147 @@ class TestKPICalculator:
         filters = {"gender": "Male"}
         kpi_calc = KPICalculator(db_manager, filters)
         assert kpi_calc.filters == filters
+    
+    def test_kpi_filters_are_applied(self, db_manager):
+        """Test that active filters restrict the rows a KPI aggregates."""
+        kpi_calc = KPICalculator(db_manager, {"gender": "Male", "age": (30, 40)})
+        result = kpi_calc.calculate_kpi_1_scores_by_group()
+        assert list(result["group"]) == ["Male"]
+        assert list(result["count"]) == [2]
+        assert result["average_score"][0] == pytest.approx(83.0)
+    
+    def test_calculate_all_matches_individual_kpis(self, db_manager):
+        """Test that calculate_all gives the results of the individual KPI methods."""
+        kpi_calc = KPICalculator(db_manager, {"age": (20, 40)})
+        results = kpi_calc.calculate_all()
+        
+        assert list(results) == ["kpi_1", "kpi_2", "kpi_3", "kpi_4", "kpi_5"]
+        expected = [
+            kpi_calc.calculate_kpi_1_scores_by_group(),
+            kpi_calc.calculate_kpi_2_study_correlation(),
+            kpi_calc.calculate_kpi_3_attendance_impact(),
+            kpi_calc.calculate_kpi_4_sleep_performance(),
+            kpi_calc.calculate_kpi_5_score_distribution()
+        ]
+        for result, individual in zip(results.values(), expected):
+            pd.testing.assert_frame_equal(result, individual, check_dtype=False)
+    
+    def test_calculate_all_runs_one_query(self, db_manager):
+        """Test that calculate_all reads the filtered data with a single KPI query."""
+        kpi_calc = KPICalculator(db_manager, {"gender": "Male"})
+        queries = []
+        original_execute = db_manager.execute_query
+        db_manager.execute_query = lambda query, *args, **kwargs: queries.append(query) or original_execute(query, *args, **kwargs)
+        
+        kpi_calc.calculate_all()
+        assert len([query for query in queries if "UNION ALL" in query]) == 1
+        assert len([query for query in queries if "GROUP BY" in query]) == 1
+    
+    def test_scatter_kpis_binned_beyond_max_points(self, db_manager):
+        """Test that scatter KPIs are binned to at most max_points marks."""
+        kpi_calc = KPICalculator(db_manager, max_points=4)
+        result = kpi_calc.calculate_kpi_2_study_correlation()
+        assert list(result.columns) == ["study_hours", "exam_score", "count"]
+        assert len(result) <= 4
+        assert result.attrs["point_count"] == 5
+        assert result["count"].sum() == 5
+        assert (result["exam_score"] * result["count"]).sum() == pytest.approx(433.0)
+    
+    def test_scatter_kpis_unbinned_within_max_points(self, db_manager):
+        """Test that scatter KPIs keep every point up to max_points."""
+        result = KPICalculator(db_manager, max_points=5).calculate_all()["kpi_4"]
+        assert list(result.columns) == ["sleep_hours", "exam_score"]
+        assert list(result["sleep_hours"]) == [6.0, 7.0, 7.5, 8.0, 8.5]
+        assert result.attrs["point_count"] == 5
+    
+    def test_scatter_kpis_carry_exact_fit(self, db_manager):
+        """Test that scatter KPIs carry the regression over every point, even when binned."""
+        sleep = np.array([7.0, 8.0, 6.0, 8.5, 7.5])
+        scores = np.array([85.0, 90.0, 78.0, 92.0, 88.0])
+        slope, intercept = np.polyfit(sleep, scores, 1)
+        for max_points in (None, 2):
+            fit = KPICalculator(db_manager, max_points=max_points).calculate_kpi_4_sleep_performance().attrs["fit"]
+            assert fit["n"] == 5
+            assert fit["slope"] == pytest.approx(slope)
+            assert fit["intercept"] == pytest.approx(intercept)
+            assert fit["r"] == pytest.approx(np.corrcoef(sleep, scores)[0, 1])
+    
+    def test_calculate_factor_statistics(self, db_manager):
+        """Test that factor statistics are computed per group under the active filters."""
+        result = KPICalculator(db_manager, {"gender": "Male"}).calculate_factor_statistics("gender")
+        assert list(result["group"].unique()) == ["Male"]
+        assert set(result["factor"]) == {"study_hours_per_day", "sleep_hours", "attendance_percentage"}
+        sleep = result[result["factor"] == "sleep_hours"].iloc[0]
+        assert sleep["n"] == 3
+        assert sleep["r"] == pytest.approx(np.corrcoef([7.0, 6.0, 7.5], [85.0, 78.0, 88.0])[0, 1])
+    
+    @pytest.fixture
+    def large_db_manager(self):
+        """Create an in-memory database manager with a table large enough to sample."""
+        rng = np.random.default_rng(0)
+        n = 100000
+        study_hours = rng.uniform(0, 8, n)
+        df = pd.DataFrame({
+            "gender": rng.choice(["Male", "Female", "Other"], n, p=[0.45, 0.45, 0.1]),
+            "age": rng.integers(17, 25, n),
+            "study_hours_per_day": study_hours,
+            "attendance_percentage": rng.uniform(50, 100, n),
+            "sleep_hours": rng.uniform(4, 10, n),
+            "exam_score": 40 + 6 * study_hours + rng.normal(0, 8, n)
+        })
+        db = DatabaseManager(":memory:")
+        db.import_data(df, "student_habits_performance")
+        return db
+    
+    def test_estimates_bound_exact_results(self, large_db_manager):
+        """Test that KPIs estimated from a sample come with intervals around the exact values."""
+        kpi_calc = KPICalculator(large_db_manager, {"age": (18, 23)}, max_points=500)
+        estimates = kpi_calc.estimate_all(sample_rows=10000)
+        exact = kpi_calc.calculate_all()
+        
+        estimate = estimates["kpi_1"].set_index("group")
+        expected = exact["kpi_1"].set_index("group").loc[estimate.index]
+        assert 0 < estimates["kpi_1"].attrs["sample_fraction"] < 1
+        assert (estimate["average_score_low"] <= estimate["average_score"]).all()
+        assert (estimate["average_score"] <= estimate["average_score_high"]).all()
+        # Within twice the interval's half-width, so the test doesn't hinge on one sample
+        half_width = (estimate["average_score_high"] - estimate["average_score_low"]) / 2
+        assert ((estimate["average_score"] - expected["average_score"]).abs() <= 2 * half_width).all()
+        assert estimate["count"].sum() == pytest.approx(expected["count"].sum(), rel=0.1)
+        
+        fit = estimates["kpi_2"].attrs["fit"]
+        exact_fit = exact["kpi_2"].attrs["fit"]
+        assert fit["r_low"] <= fit["r"] <= fit["r_high"]
+        assert abs(fit["slope"] - exact_fit["slope"]) <= fit["slope_high"] - fit["slope_low"]
+        assert estimates["kpi_2"].attrs["point_count"] == pytest.approx(exact["kpi_2"].attrs["point_count"], rel=0.1)
+        assert "sample_fraction" not in exact["kpi_2"].attrs
+    
+    def test_progressive_results_end_exact(self, large_db_manager):
+        """Test that progressive KPIs yield the estimate first and the exact results last."""
+        kpi_calc = KPICalculator(large_db_manager, max_points=500)
+        estimates, exact = list(kpi_calc.calculate_progressive(sample_rows=10000))
+        assert all("sample_fraction" in result.attrs for result in estimates.values())
+        for result, expected in zip(exact.values(), kpi_calc.calculate_all().values()):
+            pd.testing.assert_frame_equal(result, expected)
+    
+    def test_small_tables_not_sampled(self, kpi_calculator):
+        """Test that tables within sample_rows give the exact results only."""
+        results = list(kpi_calculator.calculate_progressive(sample_rows=10))
+        assert len(results) == 1
+        assert "sample_fraction" not in results[0]["kpi_1"].attrs
+        assert "average_score_low" not in results[0]["kpi_1"].columns
+    
+    def test_sample_rows_must_be_positive(self, kpi_calculator):
+        """Test that estimating from an empty sample is rejected."""
+        with pytest.raises(ValueError):
+            kpi_calculator.estimate_all(sample_rows=0)
+    
+    def test_calculate_kpi_5_score_distribution(self, db_manager):
+        """Test that the score distribution KPI gives quantiles per group."""
+        result = KPICalculator(db_manager).calculate_kpi_5_score_distribution()
+        assert list(result.columns) == ["group", "count", "p10", "p25", "median", "p75", "p90", "iqr"]
+        male = result[result["group"] == "Male"].iloc[0]
+        assert male["count"] == 3
+        assert male["median"] == pytest.approx(85.0)
+        assert male["p10"] == pytest.approx(np.quantile([85.0, 78.0, 88.0], 0.1))
+        assert male["iqr"] == pytest.approx(male["p75"] - male["p25"])
@@ -0,0 +1,140 @@
+"""
+Unit tests for kpi_planner module.
+"""
+
+import pytest
+import pandas as pd
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from database_manager import DatabaseManager
+from kpi_calculator import KPICalculator
+from kpi_planner import KPIPlanner
+
+
+class TestKPIPlanner:
+    """Tests for KPIPlanner class."""
+
+    @pytest.fixture
+    def db_manager(self):
+        """Create an in-memory database manager with the factors dataset only."""
+        db = DatabaseManager(":memory:")
+        db.import_data(pd.DataFrame({
+            "Gender": ["Male", "Female", "Male"],
+            "Hours_Studied": [20, 25, 15],
+            "Attendance": [80, 95, 70],
+            "Sleep_Hours": [7, 8, 6],
+            "Exam_Score": [67, 75, 61]
+        }), "student_performance_factors")
+        return db
+
+    @pytest.fixture
+    def habits_df(self):
+        """Create a habits dataset."""
+        return pd.DataFrame({
+            "gender": ["Female", "Male"],
+            "age": [20, 22],
+            "study_hours_per_day": [4.0, 2.0],
+            "attendance_percentage": [90.0, 60.0],
+            "sleep_hours": [7.5, 6.0],
+            "exam_score": [88.0, 54.0]
+        })
+
+    def test_catalog_maps_logical_columns(self, db_manager):
+        """Test that the catalog lists the existing tables with their actual column names."""
+        catalog = KPIPlanner(db_manager).get_catalog()
+        assert list(catalog) == ["student_performance_factors"]
+        assert catalog["student_performance_factors"]["study_hours"] == "Hours_Studied"
+        assert "age" not in catalog["student_performance_factors"]
+
+    def test_catalog_read_once_per_version(self, db_manager, habits_df):
+        """Test that the catalog is read again only after a source table changes."""
+        planner = KPIPlanner(db_manager)
+        queries = []
+        original_execute = db_manager.execute_query
+        db_manager.execute_query = lambda query, *args, **kwargs: queries.append(query) or original_execute(query, *args, **kwargs)
+
+        planner.get_catalog()
+        planner.route({"kpi_1": ["gender", "exam_score"]})
+        assert len([query for query in queries if "information_schema" in query]) == 1
+
+        db_manager.import_data(habits_df, "student_habits_performance")
+        assert planner.route({"kpi_1": ["gender", "exam_score"]}) == {"kpi_1": ["student_habits_performance"]}
+        assert len([query for query in queries if "information_schema" in query]) == 2
+
+    def test_route_prefers_first_source_or_unions(self, db_manager, habits_df):
+        """Test that KPIs go to the preferred table with their columns, or to all of them."""
+        db_manager.import_data(habits_df, "student_habits_performance")
+        planner = KPIPlanner(db_manager)
+        requirements = {"kpi_1": ["gender", "exam_score"], "by_age": ["age", "exam_score"]}
+
+        assert planner.route(requirements) == {
+            "kpi_1": ["student_habits_performance"], "by_age": ["student_habits_performance"]
+        }
+        assert planner.route(requirements, union=True) == {
+            "kpi_1": ["student_habits_performance", "student_performance_factors"],
+            "by_age": ["student_habits_performance"]
+        }
+        assert planner.route({"other": ["missing"]}) == {"other": []}
+
+    def test_union_leaves_out_tables_lacking_filter_columns(self, db_manager, habits_df):
+        """Test that a union only reads the tables every active filter applies to."""
+        db_manager.import_data(habits_df, "student_habits_performance")
+        planner = KPIPlanner(db_manager)
+        requirements = {"kpi_1": ["gender", "exam_score"]}
+
+        assert planner.route(requirements, union=True, filter_columns=["age"]) == {
+            "kpi_1": ["student_habits_performance"]
+        }
+        db_manager.execute_query("DELETE FROM student_habits_performance")
+        assert planner.route(requirements, union=True, filter_columns=["age"]) == {
+            "kpi_1": ["student_performance_factors"]
+        }
+
+    def test_empty_table_not_routed_to(self, db_manager, habits_df):
+        """Test that a source table without rows is left out of the catalog."""
+        db_manager.import_data(habits_df, "student_habits_performance")
+        db_manager.execute_query("DELETE FROM student_habits_performance")
+        planner = KPIPlanner(db_manager)
+        assert planner.route({"kpi_1": ["gender", "exam_score"]}) == {"kpi_1": ["student_performance_factors"]}
+
+    def test_kpis_without_habits_table_use_factors(self, db_manager):
+        """Test that KPIs are computed from the factors table when the habits table is missing."""
+        results = KPICalculator(db_manager).calculate_all()
+        assert list(results["kpi_1"]["group"]) == ["Female", "Male"]
+        assert list(results["kpi_2"]["study_hours"]) == [15, 20, 25]
+
+    def test_filtered_out_kpis_not_retried(self, db_manager, habits_df):
+        """Test that a filter matching no habits rows gives empty KPIs from one query."""
+        db_manager.import_data(habits_df, "student_habits_performance")
+        kpi_calc = KPICalculator(db_manager, {"gender": "Other"})
+        queries = []
+        original_execute = db_manager.execute_query
+        db_manager.execute_query = lambda query, *args, **kwargs: queries.append(query) or original_execute(query, *args, **kwargs)
+
+        results = kpi_calc.calculate_all()
+        assert all(result.empty for result in results.values())
+        assert len([query for query in queries if "UNION ALL" in query]) == 1
+
+    def test_union_sources_reads_both_tables(self, db_manager, habits_df):
+        """Test that union_sources computes the KPIs over both datasets in one query."""
+        db_manager.import_data(habits_df, "student_habits_performance")
+        kpi_calc = KPICalculator(db_manager, {"gender": "Male"}, union_sources=True)
+        results = kpi_calc.calculate_all()
+
+        assert list(results["kpi_1"]["count"]) == [3]
+        assert results["kpi_1"]["average_score"][0] == pytest.approx((67 + 61 + 54) / 3)
+        assert results["kpi_4"].attrs["point_count"] == 3
+
+    def test_union_sources_with_age_filter(self, db_manager, habits_df):
+        """Test that an age filter keeps the factors table, which has no age, out of the union."""
+        db_manager.import_data(habits_df, "student_habits_performance")
+        kpi_calc = KPICalculator(db_manager, {"age": (20, 20)}, union_sources=True)
+        results = kpi_calc.calculate_all()
+
+        assert list(results["kpi_1"]["group"]) == ["Female"]
+        assert list(results["kpi_1"]["count"]) == [1]
+        assert results["kpi_4"].attrs["point_count"] == 1
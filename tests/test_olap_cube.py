@@ -0,0 +1,215 @@
+"""
+Unit tests for olap_cube module.
+"""
+
+import pytest
+import pandas as pd
+import numpy as np
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from database_manager import DatabaseManager
+from kpi_calculator import KPICalculator
+from olap_cube import CUBE_AGGREGATE, OLAPCube
+from statistics_engine import fit_line
+
+
+class TestOLAPCube:
+    """Tests for OLAPCube class."""
+
+    @pytest.fixture
+    def db_manager(self):
+        """Create a database manager with a random habits table."""
+        rng = np.random.default_rng(7)
+        n = 500
+        df = pd.DataFrame({
+            "student_id": [f"S{i}" for i in range(n)],
+            "gender": rng.choice(["Male", "Female", "Other"], n),
+            "age": rng.integers(17, 25, n),
+            "parental_education_level": rng.choice(["High School", "Bachelor", "Master", None], n),
+            "study_hours_per_day": rng.uniform(0, 8, n).round(1),
+            "attendance_percentage": rng.uniform(50, 100, n).round(1),
+            "sleep_hours": rng.uniform(3, 10, n).round(1),
+            "exam_score": rng.uniform(20, 100, n).round(1)
+        })
+        df.loc[::50, "exam_score"] = None
+        df.loc[::40, "attendance_percentage"] = None
+        db = DatabaseManager(":memory:")
+        db.import_data(df, "student_habits_performance")
+        return db
+
+    @pytest.fixture
+    def cube(self, db_manager):
+        """Build a cube over the habits table."""
+        return OLAPCube.from_table(db_manager, "student_habits_performance")
+
+    def test_cells_cover_every_row(self, cube):
+        """Test that the cells hold every row, measure statistics included."""
+        result = cube.aggregate({}, "gender")
+        assert list(result["value"]) == ["Female", "Male", "Other"]
+        assert result["rows"].sum() == 500
+        assert result["count"].sum() == 490
+
+    def test_aggregates_match_sql(self, db_manager, cube):
+        """Test that filtered aggregates match SQL, NULL groups included."""
+        result = cube.aggregate(
+            {"gender": ["Male", "Other"], "age": (19, 22)}, "parental_education_level"
+        )
+        expected = db_manager.execute_query("""
+            SELECT parental_education_level AS value, COUNT(*) AS rows,
+                   COUNT(exam_score) AS count, SUM(exam_score) AS sum,
+                   SUM(exam_score * exam_score) AS sumsq
+            FROM student_habits_performance
+            WHERE gender IN ('Male', 'Other') AND age BETWEEN 19 AND 22
+            GROUP BY parental_education_level
+            ORDER BY parental_education_level NULLS FIRST
+        """)
+        assert list(result["value"])[1:] == list(expected["value"])[1:]
+        assert result["value"][0] is None
+        assert list(result["rows"]) == list(expected["rows"])
+        assert list(result["count"]) == list(expected["count"])
+        np.testing.assert_allclose(result["sum"], expected["sum"])
+        np.testing.assert_allclose(result["sumsq"], expected["sumsq"])
+
+    def test_unknown_values_select_nothing(self, cube):
+        """Test that values absent from the table match no cells."""
+        assert cube.aggregate({"gender": "Unknown"}, "gender").empty
+        assert cube.aggregate({"age": (30, 40)}, "age").empty
+
+    def test_filters_on_missing_columns_are_ignored(self, cube):
+        """Test that filters on columns the table lacks don't restrict cells."""
+        assert cube.aggregate({"Hours_Studied": 5}, "gender")["rows"].sum() == 500
+
+    def test_filter_on_non_dimension_raises_error(self, cube):
+        """Test that filters the cells can't answer raise ValueError."""
+        with pytest.raises(ValueError):
+            cube.aggregate({"exam_score": 80.0}, "gender")
+        with pytest.raises(ValueError):
+            cube.aggregate({"attendance_percentage": (60, 80)}, "gender")
+        with pytest.raises(ValueError):
+            cube.aggregate({"gender": (1, 2)}, "gender")
+
+    def test_is_current_tracks_table_changes(self, db_manager, cube):
+        """Test that the cube reports when its table has changed."""
+        assert cube.is_current(db_manager) is True
+        db_manager.execute_query("DELETE FROM student_habits_performance WHERE age = 17")
+        assert cube.is_current(db_manager) is False
+
+    def test_kpis_match_sql(self, db_manager, cube):
+        """Test that KPIs summed from the cube match those computed with SQL."""
+        filters = {"gender": ["Female", "Male"], "age": (18, 23), "parental_education_level": "Master"}
+        sql_calc = KPICalculator(db_manager, filters)
+        cube_calc = KPICalculator(db_manager, filters, olap_cube=cube)
+
+        for kpi in ("calculate_kpi_1_scores_by_group", "calculate_kpi_3_attendance_impact"):
+            expected = getattr(sql_calc, kpi)()
+            actual = getattr(cube_calc, kpi)()
+            assert list(actual.columns) == list(expected.columns)
+            assert list(actual.iloc[:, 0]) == list(expected.iloc[:, 0])
+            assert list(actual["count"]) == list(expected["count"])
+            np.testing.assert_allclose(actual["average_score"], expected["average_score"], rtol=1e-5)
+
+    def test_kpis_served_without_queries(self, db_manager, cube):
+        """Test that the cube answers KPIs 1 and 3 without querying the table."""
+        queries = []
+        original_execute = db_manager.execute_query
+        db_manager.execute_query = lambda query, *args, **kwargs: queries.append(query) or original_execute(query, *args, **kwargs)
+
+        results = KPICalculator(db_manager, {"gender": "Male"}, olap_cube=cube).calculate_all()
+        assert not results["kpi_1"].empty and not results["kpi_3"].empty
+        assert not any("ROUND(attendance" in query for query in queries)
+        assert not any("GROUP BY gender" in query for query in queries)
+
+    def test_regression_matches_sql(self, db_manager, cube):
+        """Test that regression statistics summed from the cells match SQL."""
+        statistics = cube.regression({"gender": "Male"}, "sleep_hours")
+        expected = db_manager.execute_query("""
+            SELECT COUNT(*) AS n, REGR_SLOPE(exam_score, sleep_hours) AS slope,
+                   CORR(exam_score, sleep_hours) AS r
+            FROM student_habits_performance
+            WHERE gender = 'Male' AND sleep_hours IS NOT NULL AND exam_score IS NOT NULL
+        """)
+        fit = fit_line(statistics)
+        assert fit["n"] == expected["n"][0]
+        assert fit["slope"] == pytest.approx(expected["slope"][0])
+        assert fit["r"] == pytest.approx(expected["r"][0])
+
+    def test_merge_adds_cells_and_values(self, db_manager):
+        """Test that merging cubes of two partitions gives the cube of the whole table."""
+        table = "student_habits_performance"
+        db_manager.execute_query(f"CREATE TABLE younger AS SELECT * FROM {table} WHERE age < 20")
+        db_manager.execute_query(f"CREATE TABLE older AS SELECT * FROM {table} WHERE age >= 20")
+        younger = OLAPCube.from_table(db_manager, "younger")
+        older = OLAPCube.from_table(db_manager, "older")
+        younger.table_name = older.table_name = table
+
+        merged = younger.merge(older)
+        assert merged.matches(OLAPCube.from_table(db_manager, table))
+        assert merged.version is None
+
+    def test_maintained_cube_consistent_after_appends(self, db_manager):
+        """Test that a cube maintained across appends equals a full recompute."""
+        table = "student_habits_performance"
+        db_manager.register_aggregate(table, CUBE_AGGREGATE, OLAPCube.collect, OLAPCube.merge)
+        cube = db_manager.get_aggregate(table, CUBE_AGGREGATE)
+        assert cube.is_current(db_manager)
+
+        delta = pd.DataFrame({
+            "student_id": ["N1", "N2"],
+            "gender": ["Male", "Non-binary"],
+            "age": [30, 18],
+            "parental_education_level": ["PhD", None],
+            "study_hours_per_day": [3.5, None],
+            "attendance_percentage": [91.0, 42.0],
+            "sleep_hours": [7.0, 6.5],
+            "exam_score": [77.5, 64.0]
+        })
+        db_manager.import_data(delta, table, if_exists="append")
+
+        updated = db_manager.get_aggregate(table, CUBE_AGGREGATE)
+        assert updated is not cube
+        assert cube.is_current(db_manager) is False
+        assert updated.matches(db_manager.recompute_aggregate(table, CUBE_AGGREGATE))
+        assert updated.aggregate({}, "gender")["rows"].sum() == 502
+
+        sql_calc = KPICalculator(db_manager, {"age": (18, 30)})
+        cube_calc = KPICalculator(db_manager, {"age": (18, 30)}, olap_cube=updated)
+        expected = sql_calc.calculate_kpi_1_scores_by_group()
+        actual = cube_calc.calculate_kpi_1_scores_by_group()
+        assert list(actual["group"]) == list(expected["group"])
+        np.testing.assert_allclose(actual["average_score"], expected["average_score"], rtol=1e-5)
+        assert cube_calc.calculate_kpi_2_study_correlation().attrs["fit"]["slope"] == pytest.approx(
+            sql_calc.calculate_kpi_2_study_correlation().attrs["fit"]["slope"]
+        )
+
+    def test_quantiles_match_sql(self, db_manager, cube):
+        """Test that quantiles merged from the cell sketches match SQL while the cells are small."""
+        result = cube.quantiles({"age": (18, 22)}, "gender", [0.1, 0.5, 0.9])
+        expected = db_manager.execute_query("""
+            SELECT gender, COUNT(*) AS count,
+                   QUANTILE_CONT(exam_score, 0.1) AS p10, QUANTILE_CONT(exam_score, 0.5) AS p50,
+                   QUANTILE_CONT(exam_score, 0.9) AS p90
+            FROM student_habits_performance
+            WHERE age BETWEEN 18 AND 22 AND exam_score IS NOT NULL
+            GROUP BY gender ORDER BY gender
+        """)
+        assert list(result.columns) == ["value", "count", "p10", "p50", "p90"]
+        assert list(result["value"]) == list(expected["gender"])
+        assert list(result["count"]) == list(expected["count"])
+        np.testing.assert_allclose(result[["p10", "p50", "p90"]], expected[["p10", "p50", "p90"]])
+
+    def test_maintained_sketch_counts_appended_values(self, db_manager):
+        """Test that cell sketches of a maintained cube take in appended values."""
+        table = "student_habits_performance"
+        db_manager.register_aggregate(table, CUBE_AGGREGATE, OLAPCube.collect, OLAPCube.merge)
+        delta = db_manager.execute_query(f"SELECT * FROM {table} WHERE gender = 'Female' LIMIT 50")
+        db_manager.import_data(delta, table, if_exists="append")
+
+        cube = db_manager.get_aggregate(table, CUBE_AGGREGATE)
+        assert cube.matches(db_manager.recompute_aggregate(table, CUBE_AGGREGATE))
+        female = cube.quantiles({}, "gender", [0.5])
+        assert female.loc[female["value"] == "Female", "count"].iloc[0] == \
+            cube.aggregate({}, "gender").set_index("value").loc["Female", "count"]
@@ -0,0 +1,73 @@
+"""
+Unit tests for quantile_sketch module.
+"""
+
+import pytest
+import numpy as np
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from quantile_sketch import QuantileSketch
+
+
+class TestQuantileSketch:
+    """Tests for QuantileSketch class."""
+
+    @pytest.fixture
+    def values(self):
+        """Skewed values spread over 20 keys."""
+        rng = np.random.default_rng(5)
+        return rng.integers(0, 20, 50000), rng.gamma(2.0, 10.0, 50000)
+
+    def test_small_digests_give_exact_quantiles(self):
+        """Test that digests of few values give the exact linear quantiles."""
+        values = np.array([3.0, 1.0, 2.0, 5.0, np.nan, 8.0])
+        sketch = QuantileSketch.from_values(np.zeros(6), values)
+        result = sketch.quantiles(np.array([0]), 1, [0.1, 0.5, 0.9])
+        np.testing.assert_allclose(result[0], np.nanquantile(values, [0.1, 0.5, 0.9]))
+        assert sketch.key_weights(1)[0] == 5
+
+    def test_large_digests_stay_small_and_accurate(self, values):
+        """Test that large digests keep few centroids and accurate quantiles."""
+        keys, measures = values
+        sketch = QuantileSketch.from_values(keys, measures)
+        assert len(sketch.means) <= 20 * 60
+
+        probabilities = [0.01, 0.1, 0.5, 0.9, 0.99]
+        estimate = sketch.quantiles(np.zeros(20, dtype=np.int64), 1, probabilities)[0]
+        np.testing.assert_allclose(estimate, np.quantile(measures, probabilities), rtol=0.02)
+
+    def test_merged_sketches_match_whole(self, values):
+        """Test that sketches of two halves merge into one as accurate as the whole."""
+        keys, measures = values
+        first = QuantileSketch.from_values(keys[:25000], measures[:25000])
+        second = QuantileSketch.from_values(keys[25000:], measures[25000:])
+        merged = first.merge(second)
+
+        np.testing.assert_array_equal(merged.key_weights(20), np.bincount(keys, minlength=20))
+        groups = np.where(np.arange(20) < 10, 0, 1)
+        estimate = merged.quantiles(groups, 2, [0.25, 0.5, 0.75])
+        for group in (0, 1):
+            expected = np.quantile(measures[groups[keys] == group], [0.25, 0.5, 0.75])
+            np.testing.assert_allclose(estimate[group], expected, rtol=0.02)
+
+    def test_excluded_and_empty_groups(self, values):
+        """Test that keys outside every group are skipped and empty groups are NaN."""
+        keys, measures = values
+        sketch = QuantileSketch.from_values(keys, measures)
+        groups = np.full(20, -1)
+        groups[3] = 0
+        estimate = sketch.quantiles(groups, 2, [0.5])
+        assert estimate[0, 0] == pytest.approx(np.median(measures[keys == 3]), rel=0.02)
+        assert np.isnan(estimate[1, 0])
+
+    def test_rekey_moves_digests(self, values):
+        """Test that rekeyed digests answer for their new keys."""
+        keys, measures = values
+        sketch = QuantileSketch.from_values(keys, measures).rekey(np.arange(20) + 5)
+        weights = sketch.key_weights(25)
+        assert weights[:5].sum() == 0
+        np.testing.assert_array_equal(weights[5:], np.bincount(keys, minlength=20))
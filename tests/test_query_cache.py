@@ -0,0 +1,72 @@
+"""
+Unit tests for query_cache module.
+"""
+
+import pytest
+import pandas as pd
+import numpy as np
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from query_cache import QueryResultCache, normalize_sql, estimate_result_size
+
+
+class TestNormalizeSQL:
+    """Tests for normalize_sql function."""
+    
+    def test_collapses_whitespace(self):
+        """Test that formatting differences normalize to the same text."""
+        first = normalize_sql("SELECT  a,\n    b\nFROM t;")
+        second = normalize_sql("SELECT a, b FROM t")
+        assert first == second
+    
+    def test_preserves_whitespace_in_literals(self):
+        """Test that whitespace inside string literals is kept."""
+        normalized = normalize_sql("SELECT * FROM t WHERE x = 'High  School'")
+        assert "'High  School'" in normalized
+
+
+class TestQueryResultCache:
+    """Tests for QueryResultCache class."""
+    
+    def test_hit_and_miss_counters(self):
+        """Test that lookups are counted as hits or misses."""
+        cache = QueryResultCache(max_bytes=1024 * 1024)
+        assert cache.get("q") is None
+        cache.put("q", pd.DataFrame({"a": [1, 2]}), ["t"])
+        assert cache.get("q") is not None
+        stats = cache.get_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["entries"] == 1
+    
+    def test_evicts_least_recently_used_by_bytes(self):
+        """Test that the least recently used entry is evicted when over budget."""
+        result = {"a": np.zeros(100, dtype=np.int64)}
+        size = estimate_result_size(result)
+        cache = QueryResultCache(max_bytes=2 * size)
+        cache.put("q1", result, ["t"])
+        cache.put("q2", result, ["t"])
+        cache.get("q1")
+        cache.put("q3", result, ["t"])
+        assert cache.get("q2") is None
+        assert cache.get("q1") is not None
+        assert cache.get_stats()["size_bytes"] <= 2 * size
+    
+    def test_oversized_result_not_cached(self):
+        """Test that results larger than the budget are not stored."""
+        cache = QueryResultCache(max_bytes=10)
+        cache.put("q", {"a": np.zeros(100)}, ["t"])
+        assert cache.get_stats()["entries"] == 0
+    
+    def test_invalidate_table_removes_dependent_entries(self):
+        """Test that invalidating a table removes only results that read it."""
+        cache = QueryResultCache(max_bytes=1024 * 1024)
+        cache.put("q1", pd.DataFrame({"a": [1]}), ["t1"])
+        cache.put("q2", pd.DataFrame({"a": [1]}), ["t1", "t2"])
+        cache.put("q3", pd.DataFrame({"a": [1]}), ["t3"])
+        assert cache.invalidate_table("t1") == 2
+        assert cache.get("q3") is not None
@@ -0,0 +1,193 @@
+"""
+Unit tests for shared_store module.
+"""
+
+import pytest
+import pandas as pd
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from dataset_cache import DatasetCache
+from shared_store import SharedDataStore
+
+
+class TestSharedDataStore:
+    """Tests for SharedDataStore class."""
+    
+    @pytest.fixture
+    def csv_path(self, temp_dir):
+        """Create a small habits-like CSV file."""
+        path = temp_dir / "habits.csv"
+        path.write_text(
+            "student_id,gender,exam_score\n"
+            "S1,Male,80.5\nS2,Female,90.0\nS3,Male,70.0\nS4,Female,60.0\n"
+        )
+        return path
+    
+    @pytest.fixture
+    def store(self):
+        """Create an in-memory shared store without a Parquet cache."""
+        return SharedDataStore(":memory:")
+    
+    def test_sessions_share_one_copy_of_a_dataset(self, store, csv_path):
+        """Test that two sessions binding the same dataset query one shared table."""
+        store.import_dataset(csv_path, "abc123")
+        session_a = store.create_session("a")
+        session_b = store.create_session("b")
+        store.bind(session_a, "students", "abc123")
+        store.bind(session_b, "students", "abc123")
+        
+        assert session_a.get_table_info("students")["row_count"] == 4
+        assert session_b.get_table_info("students")["row_count"] == 4
+        assert session_a.get_table_fingerprint("students") == "abc123"
+        assert session_a.get_facets("students")["row_count"] == 4
+        assert len(store.db_manager.get_available_tables()) == 1
+    
+    def test_bind_checks_columns_of_shared_dataset(self, store, csv_path):
+        """Test that a dataset ingested for one table is checked again when bound as another."""
+        store.import_dataset(csv_path, "abc123")
+        session = store.create_session("a")
+        store.bind(session, "students", "abc123", ["Gender", "exam_score"], {"exam_score": "numeric"})
+        
+        with pytest.raises(ValueError, match="Missing required columns: hours_studied"):
+            store.bind(session, "factors", "abc123", ["Gender", "Hours_Studied"])
+        with pytest.raises(ValueError, match="non-numeric"):
+            store.bind(session, "factors", "abc123", ["gender"], {"gender": "numeric"})
+        assert not session.table_exists("factors")
+    
+    def test_import_same_fingerprint_is_skipped(self, store, csv_path):
+        """Test that ingesting an already shared dataset returns the existing table."""
+        first = store.import_dataset(csv_path, "abc123")
+        second = store.import_dataset(csv_path, "abc123")
+        assert first == second
+        assert store.get_dataset("abc123") == first
+        assert store.get_dataset("unknown") is None
+    
+    def test_session_append_copies_on_write(self, store, csv_path):
+        """Test that appending in one session doesn't change other sessions' data."""
+        store.import_dataset(csv_path, "abc123")
+        session_a = store.create_session("a")
+        session_b = store.create_session("b")
+        store.bind(session_a, "students", "abc123")
+        store.bind(session_b, "students", "abc123")
+        
+        delta = pd.DataFrame({"student_id": ["S5"], "gender": ["Other"], "exam_score": [50.0]})
+        session_a.import_data(delta, "students", if_exists="append")
+        
+        assert session_a.get_table_info("students")["row_count"] == 5
+        assert session_b.get_table_info("students")["row_count"] == 4
+    
+    def test_private_tables_are_not_visible_to_other_sessions(self, store):
+        """Test that tables created by a session stay in its own schema."""
+        session_a = store.create_session("a")
+        session_b = store.create_session("b")
+        session_a.import_data(pd.DataFrame({"id": [1, 2]}), "private_table")
+        assert session_a.table_exists("private_table") is True
+        assert session_b.table_exists("private_table") is False
+    
+    def test_session_table_does_not_replace_shared_table(self, store, csv_path):
+        """Test that a session table named like a shared table leaves the shared one intact."""
+        dataset = store.import_dataset(csv_path, "abc123")
+        session = store.create_session("a")
+        session.import_data(pd.DataFrame({"id": [1]}), dataset)
+        session.create_view(dataset, f"main.{dataset}")
+        
+        assert session.get_table_info(dataset)["row_count"] == 4
+        assert store.db_manager.get_table_info(dataset)["row_count"] == 4
+    
+    def test_dataset_loaded_from_parquet_cache(self, csv_path, temp_dir):
+        """Test that a new store loads datasets ingested by an earlier one from the cache."""
+        cache = DatasetCache(temp_dir / "cache")
+        SharedDataStore(":memory:", dataset_cache=cache).import_dataset(csv_path, "abc123")
+        
+        store = SharedDataStore(":memory:", dataset_cache=cache)
+        assert store.get_dataset("abc123") is not None
+        session = store.create_session("a")
+        store.bind(session, "students", "abc123")
+        assert session.get_table_info("students")["row_count"] == 4
+    
+    def test_dataset_evicted_from_cache_after_check_is_a_miss(self, csv_path, temp_dir):
+        """Test that a cache file removed between contains() and load() falls back to an import."""
+        cache = DatasetCache(temp_dir / "cache")
+        SharedDataStore(":memory:", dataset_cache=cache).import_dataset(csv_path, "abc123")
+        
+        original_contains = cache.contains
+        def contains_then_evict(fingerprint):
+            found = original_contains(fingerprint)
+            cache.get_path(fingerprint).unlink()
+            return found
+        cache.contains = contains_then_evict
+        
+        store = SharedDataStore(":memory:", dataset_cache=cache)
+        assert store.get_dataset("abc123") is None
+        assert store.import_dataset(csv_path, "abc123") is not None
+    
+    def test_idle_sessions_are_closed(self, csv_path):
+        """Test that sessions idle past the TTL are closed and their schema dropped."""
+        store = SharedDataStore(":memory:", session_ttl=0.0)
+        store.import_dataset(csv_path, "abc123")
+        session = store.create_session("a")
+        store.bind(session, "students", "abc123")
+        session.import_data(pd.DataFrame({"id": [1]}), "private_table")
+        
+        assert store.close_idle_sessions() == ["a"]
+        assert store.touch("a") is False
+        schemas = store.db_manager.execute_query(
+            "SELECT schema_name FROM information_schema.schemata", use_cache=False
+        )
+        assert "session_a" not in set(schemas["schema_name"])
+    
+    def test_touched_sessions_stay_open(self, store):
+        """Test that sessions with recent requests are kept."""
+        store.create_session("a")
+        assert store.touch("a") is True
+        assert store.close_idle_sessions() == []
+    
+    def test_unbound_datasets_evicted_least_recently_used(self, temp_dir):
+        """Test that datasets no session binds are dropped beyond the limit, oldest first."""
+        store = SharedDataStore(":memory:", max_unbound_datasets=1)
+        session = store.create_session("a")
+        for i in range(3):
+            path = temp_dir / f"data_{i}.csv"
+            path.write_text(f"id,score\n{i},1.0\n")
+            store.import_dataset(path, f"fp{i}")
+        
+        store.bind(session, "students", "fp0")
+        # fp0 is bound, fp2 the most recently used of the others
+        assert store.get_dataset("fp1") is None
+        assert store.get_dataset("fp2") is not None
+        
+        store.close_session("a")
+        assert store.get_dataset("fp0") is None
+        assert len(store.db_manager.get_available_tables()) == 1
+    
+    def test_shared_aggregate_collected_once_per_dataset(self, store, csv_path):
+        """Test that sessions binding a dataset share one aggregate state, and appends merge privately."""
+        sources = []
+        
+        def collect(connection, table_name, source, column_types):
+            sources.append(source)
+            if not source.upper().startswith("SELECT"):
+                source = f"SELECT * FROM {source}"
+            return [connection.execute(f"SELECT COUNT(*) FROM ({source})").fetchone()[0]]
+        
+        store.register_aggregate("students", "rows", collect, lambda current, delta: [current[0] + delta[0]])
+        store.import_dataset(csv_path, "abc123")
+        session_a = store.create_session("a")
+        session_b = store.create_session("b")
+        store.bind(session_a, "students", "abc123")
+        store.bind(session_b, "students", "abc123")
+        
+        assert len(sources) == 1
+        assert session_a.get_aggregate("students", "rows") == [4]
+        assert session_a.get_aggregate("students", "rows") is session_b.get_aggregate("students", "rows")
+        
+        delta = pd.DataFrame({"student_id": ["S5"], "gender": ["Other"], "exam_score": [50.0]})
+        session_a.import_data(delta, "students", if_exists="append")
+        assert session_a.get_aggregate("students", "rows") == [5]
+        assert sources[-1] != "students"
+        assert session_b.get_aggregate("students", "rows") == [4]
+        assert session_a.recompute_aggregate("students", "rows") == [5]
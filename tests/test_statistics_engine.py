@@ -0,0 +1,168 @@
+"""
+Unit tests for statistics_engine module.
+"""
+
+import pytest
+import pandas as pd
+import numpy as np
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from database_manager import DatabaseManager
+from statistics_engine import (
+    GroupStatistics, compute_statistics, fit_intervals, fit_line, get_statistics_sql,
+    merge_statistics
+)
+
+
+class TestStatisticsEngine:
+    """Tests for the sufficient statistics functions."""
+
+    @pytest.fixture
+    def pairs(self):
+        """Random correlated pairs with some NULLs."""
+        rng = np.random.default_rng(3)
+        x = rng.uniform(0, 10, 200)
+        y = 3.0 * x + 20 + rng.normal(0, 4, 200)
+        x[::25] = np.nan
+        return x, y
+
+    def test_fit_matches_numpy(self, pairs):
+        """Test that the fit equals polyfit and corrcoef over the rows."""
+        x, y = pairs
+        fit = fit_line(compute_statistics(x, y))
+        valid = ~np.isnan(x)
+        slope, intercept = np.polyfit(x[valid], y[valid], 1)
+        assert fit["n"] == valid.sum()
+        assert fit["slope"] == pytest.approx(slope)
+        assert fit["intercept"] == pytest.approx(intercept)
+        assert fit["r"] == pytest.approx(np.corrcoef(x[valid], y[valid])[0, 1])
+
+    def test_merged_statistics_equal_whole(self, pairs):
+        """Test that statistics of two halves merge into those of all rows."""
+        x, y = pairs
+        merged = merge_statistics(compute_statistics(x[:80], y[:80]), compute_statistics(x[80:], y[80:]))
+        whole = compute_statistics(x, y)
+        for name, value in whole.items():
+            assert merged[name] == pytest.approx(value)
+
+    def test_sql_statistics_match_numpy(self, pairs):
+        """Test that the SQL aggregates compute the same statistics."""
+        x, y = pairs
+        db = DatabaseManager(":memory:")
+        db.import_data(pd.DataFrame({"x": x, "y": y}), "pairs")
+        result = db.execute_query(f"SELECT {get_statistics_sql('x', 'y')} FROM pairs")
+        for name, value in compute_statistics(x, y).items():
+            assert result[name][0] == pytest.approx(value)
+
+    def test_fit_undefined_without_spread(self):
+        """Test that slope and r are NaN for too few or constant values."""
+        assert np.isnan(fit_line(compute_statistics([1.0], [2.0]))["slope"])
+        fit = fit_line(compute_statistics([1.0, 2.0, 3.0], [5.0, 5.0, 5.0]))
+        assert fit["slope"] == pytest.approx(0.0)
+        assert np.isnan(fit["r"])
+
+
+    def test_intervals_cover_fit_and_narrow_with_fraction(self, pairs):
+        """Test that the confidence intervals surround the fit and vanish for a full sample."""
+        x, y = pairs
+        statistics = compute_statistics(x, y)
+        fit = fit_line(statistics)
+        intervals = fit_intervals(statistics)
+        assert intervals["slope_low"] < fit["slope"] < intervals["slope_high"]
+        assert intervals["r_low"] < fit["r"] < intervals["r_high"]
+
+        half = fit_intervals(statistics, fraction=0.5)
+        assert half["slope_high"] - half["slope_low"] < intervals["slope_high"] - intervals["slope_low"]
+        full = fit_intervals(statistics, fraction=1.0)
+        assert full["slope_low"] == pytest.approx(fit["slope"])
+        assert full["r_high"] == pytest.approx(fit["r"])
+
+    def test_intervals_undefined_for_tiny_samples(self):
+        """Test that three pairs are too few to bound the correlation."""
+        intervals = fit_intervals(compute_statistics([1.0, 2.0, 3.0], [2.0, 3.0, 5.0]))
+        assert not np.isnan(intervals["slope_low"])
+        assert np.isnan(intervals["r_low"])
+
+
+class TestGroupStatistics:
+    """Tests for GroupStatistics class."""
+
+    @pytest.fixture
+    def db_manager(self):
+        """Create a database manager with a random habits table."""
+        rng = np.random.default_rng(11)
+        n = 400
+        df = pd.DataFrame({
+            "gender": rng.choice(["Male", "Female", None], n),
+            "age": rng.integers(17, 25, n),
+            "study_hours_per_day": rng.uniform(0, 8, n),
+            "sleep_hours": rng.uniform(3, 10, n),
+            "attendance_percentage": rng.uniform(50, 100, n),
+            "social_media_hours": rng.uniform(0, 6, n),
+            "netflix_hours": rng.uniform(0, 5, n),
+            "exam_score": rng.uniform(20, 100, n)
+        })
+        df.loc[::30, "sleep_hours"] = None
+        df.loc[::45, "exam_score"] = None
+        db = DatabaseManager(":memory:")
+        db.import_data(df, "student_habits_performance")
+        return db
+
+    def test_statistics_match_per_group_numpy(self, db_manager):
+        """Test that every group and factor matches a fit over its own rows."""
+        df = db_manager.execute_query("SELECT * FROM student_habits_performance")
+        result = GroupStatistics.from_table(db_manager, "student_habits_performance", "gender").to_frame()
+
+        assert list(result["group"].unique()) == [None, "Female", "Male"]
+        assert len(result) == 3 * 5
+        for _, row in result.iterrows():
+            rows = df[df["gender"].isna()] if row["group"] is None else df[df["gender"] == row["group"]]
+            pairs = rows[[row["factor"], "exam_score"]].dropna()
+            x, y = pairs[row["factor"]].to_numpy(), pairs["exam_score"].to_numpy()
+            assert row["n"] == len(pairs)
+            assert row["mean_x"] == pytest.approx(x.mean())
+            assert row["var_x"] == pytest.approx(x.var(ddof=1))
+            assert row["var_y"] == pytest.approx(y.var(ddof=1))
+            assert row["slope"] == pytest.approx(np.polyfit(x, y, 1)[0])
+            assert row["r"] == pytest.approx(np.corrcoef(x, y)[0, 1])
+
+    def test_one_query_for_all_groups(self, db_manager):
+        """Test that every group and factor comes from a single query."""
+        queries = []
+        original_execute = db_manager.execute_query
+        db_manager.execute_query = lambda query, *args, **kwargs: queries.append(query) or original_execute(query, *args, **kwargs)
+
+        GroupStatistics.from_table(db_manager, "student_habits_performance", "age")
+        assert len([query for query in queries if "GROUP BY" in query]) == 1
+
+    def test_partitions_merge_into_whole(self, db_manager):
+        """Test that statistics of disjoint partitions merge into those of all rows."""
+        table = "student_habits_performance"
+        younger = GroupStatistics.from_table(db_manager, table, "gender", filters={"age": (17, 20)})
+        older = GroupStatistics.from_table(db_manager, table, "gender", filters={"age": (21, 24)})
+        whole = GroupStatistics.from_table(db_manager, table, "gender").to_frame()
+
+        merged = younger.merge(older).to_frame()
+        merged = merged.set_index(["group", "factor"]).loc[list(zip(whole["group"], whole["factor"]))]
+        assert list(merged["n"]) == list(whole["n"])
+        np.testing.assert_allclose(merged["slope"], whole["slope"])
+        np.testing.assert_allclose(merged["r"], whole["r"])
+
+    def test_merge_rejects_different_factors(self, db_manager):
+        """Test that statistics of different factors can't be merged."""
+        table = "student_habits_performance"
+        first = GroupStatistics.from_table(db_manager, table, "gender", ["sleep_hours"])
+        second = GroupStatistics.from_table(db_manager, table, "gender", ["netflix_hours"])
+        with pytest.raises(ValueError):
+            first.merge(second)
+
+    def test_missing_factors_are_left_out(self, db_manager):
+        """Test that factors the table lacks are skipped."""
+        result = GroupStatistics.from_table(
+            db_manager, "student_habits_performance", "gender", ["sleep_hours", "Hours_Studied"]
+        )
+        assert result.factors == ["sleep_hours"]
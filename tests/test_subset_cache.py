@@ -0,0 +1,166 @@
+"""
+Unit tests for subset_cache module.
+"""
+
+import pytest
+import pandas as pd
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from database_manager import DatabaseManager
+from kpi_calculator import KPICalculator
+from subset_cache import SubsetCache
+
+
+class TestSubsetCache:
+    """Tests for SubsetCache class."""
+
+    @pytest.fixture
+    def db_manager(self):
+        """Create an in-memory database manager with sample data."""
+        db = DatabaseManager(":memory:")
+        df = pd.DataFrame({
+            "id": [1, 2, 3, 4, 5],
+            "gender": ["Male", "Female", "Male", "Female", "Male"],
+            "age": [20, 21, 22, 23, 24],
+            "score": [85.0, 90.0, 78.0, 92.0, 88.0]
+        })
+        db.import_data(df, "students")
+        return db
+
+    @pytest.fixture
+    def subset_cache(self, db_manager):
+        """Create a SubsetCache instance."""
+        return SubsetCache(db_manager)
+
+    def test_subset_holds_matching_rows_and_columns(self, db_manager, subset_cache):
+        """Test that a subset holds the filtered rows under the requested names."""
+        subset = subset_cache.get_subset(
+            "students", {"sex": "GENDER", "score": "score", "missing": "missing"}, {"gender": "Male"}
+        )
+        result = db_manager.execute_query(f"SELECT * FROM {subset} ORDER BY score")
+        assert list(result.columns) == ["sex", "score"]
+        assert list(result["score"]) == [78.0, 85.0, 88.0]
+
+    def test_subset_reused_while_filters_unchanged(self, db_manager, subset_cache):
+        """Test that the same filter state doesn't materialize the subset again."""
+        columns = {"gender": "gender", "score": "score"}
+        subset = subset_cache.get_subset("students", columns, {"gender": "Male"})
+        version = db_manager.get_table_version(subset)
+
+        assert subset_cache.get_subset("students", columns, {"gender": "Male"}) == subset
+        assert db_manager.get_table_version(subset) == version
+
+        other = subset_cache.get_subset("students", columns, {"gender": "Female"})
+        assert other != subset
+        assert db_manager.get_table_info(other)["row_count"] == 2
+
+    def test_subset_rebuilt_when_source_changes(self, db_manager, subset_cache):
+        """Test that a modified source table invalidates its subsets."""
+        columns = {"gender": "gender", "score": "score"}
+        subset = subset_cache.get_subset("students", columns, {"gender": "Male"})
+        db_manager.import_data(
+            pd.DataFrame({"id": [6], "gender": ["Male"], "age": [20], "score": [50.0]}),
+            "students", if_exists="append"
+        )
+        rebuilt = subset_cache.get_subset("students", columns, {"gender": "Male"})
+        assert db_manager.get_table_info(rebuilt)["row_count"] == 4
+        assert db_manager.table_exists(subset) is False
+
+    def test_narrower_filters_refine_cached_subset(self, db_manager, subset_cache):
+        """Test that drilling down reads the smallest cached subset it fits in."""
+        columns = {"gender": "gender", "age": "age", "score": "score"}
+        wide = subset_cache.get_subset("students", columns, {"age": (20, 23)})
+        narrow = subset_cache.get_subset("students", columns, {"age": (20, 23), "gender": "Male"})
+
+        queries = []
+        original_create = db_manager.create_table_as
+        db_manager.create_table_as = lambda *args, **kwargs: queries.append(args[1]) or original_create(*args, **kwargs)
+
+        narrowest = subset_cache.get_subset("students", columns, {"age": (21, 22), "gender": ["Male"]})
+        assert f"FROM {narrow}" in queries[-1]
+        assert list(db_manager.execute_query(f"SELECT age FROM {narrowest}")["age"]) == [22]
+
+        subset_cache.get_subset("students", columns, {"age": (20, 23), "gender": "Female"})
+        assert f"FROM {wide}" in queries[-1]
+
+    def test_widened_filters_scan_base_table(self, db_manager, subset_cache):
+        """Test that filters wider than every cached state read the base table."""
+        columns = {"gender": "gender", "age": "age", "score": "score"}
+        subset_cache.get_subset("students", columns, {"gender": "Male"})
+
+        queries = []
+        original_create = db_manager.create_table_as
+        db_manager.create_table_as = lambda *args, **kwargs: queries.append(args[1]) or original_create(*args, **kwargs)
+
+        widened = subset_cache.get_subset("students", columns, {"gender": ["Male", "Female"]})
+        assert "FROM students" in queries[-1]
+        assert db_manager.get_table_info(widened)["row_count"] == 5
+
+    def test_value_list_and_range_are_different_states(self, db_manager, subset_cache):
+        """Test that a two-value list and a range over the same values aren't confused."""
+        columns = {"age": "age"}
+        listed = subset_cache.get_subset("students", columns, {"age": [20, 22]})
+        ranged = subset_cache.get_subset("students", columns, {"age": (20, 22)})
+        assert db_manager.get_table_info(listed)["row_count"] == 2
+        assert db_manager.get_table_info(ranged)["row_count"] == 3
+
+    def test_least_recently_used_subset_dropped(self, db_manager):
+        """Test that subsets beyond the limit are dropped."""
+        subset_cache = SubsetCache(db_manager, max_subsets=2)
+        first = subset_cache.get_subset("students", {"age": "age"}, {"age": 20})
+        subset_cache.get_subset("students", {"age": "age"}, {"age": 21})
+        subset_cache.get_subset("students", {"age": "age"}, {"age": 22})
+        assert db_manager.table_exists(first) is False
+
+    def test_clear_drops_subsets(self, db_manager, subset_cache):
+        """Test that clearing the cache drops the subset tables."""
+        subset = subset_cache.get_subset("students", {"score": "score"})
+        subset_cache.clear()
+        assert db_manager.table_exists(subset) is False
+
+    def test_caches_on_one_manager_keep_their_subsets(self, db_manager, subset_cache):
+        """Test that two caches on a manager don't replace each other's subsets."""
+        columns = {"gender": "gender", "score": "score"}
+        everyone = subset_cache.get_subset("students", columns)
+        male = SubsetCache(db_manager).get_subset("students", columns, {"gender": "Male"})
+        assert male != everyone
+
+        assert subset_cache.get_subset("students", columns) == everyone
+        assert db_manager.get_table_info(everyone)["row_count"] == 5
+
+    def test_subset_changed_elsewhere_is_rebuilt(self, db_manager, subset_cache):
+        """Test that a subset table written by someone else is not reused."""
+        columns = {"gender": "gender", "score": "score"}
+        subset = subset_cache.get_subset("students", columns)
+        db_manager.create_table_as(subset, "SELECT 'Other' AS gender, 1.0 AS score")
+
+        rebuilt = subset_cache.get_subset("students", columns)
+        assert rebuilt != subset
+        assert db_manager.get_table_info(rebuilt)["row_count"] == 5
+
+    def test_kpis_share_one_subset(self, db_manager):
+        """Test that all KPIs of a calculator read one materialized subset."""
+        db_manager.import_data(pd.DataFrame({
+            "gender": ["Male", "Female", "Male"],
+            "study_hours_per_day": [5.0, 6.0, 4.0],
+            "attendance_percentage": [85.0, 90.0, 75.0],
+            "sleep_hours": [7.0, 8.0, 6.0],
+            "exam_score": [85.0, 90.0, 78.0]
+        }), "student_habits_performance")
+
+        created = []
+        original_create = db_manager.create_table_as
+        db_manager.create_table_as = lambda *args, **kwargs: created.append(args[0]) or original_create(*args, **kwargs)
+
+        kpi_calc = KPICalculator(db_manager, {"gender": "Male"})
+        kpi_calc.calculate_kpi_1_scores_by_group()
+        kpi_calc.calculate_kpi_2_study_correlation()
+        kpi_calc.calculate_kpi_3_attendance_impact()
+        result = kpi_calc.calculate_kpi_4_sleep_performance()
+
+        assert len(created) == 1
+        assert list(result["sleep_hours"]) == [6.0, 7.0]
@@ -79,6 +79,48 @@ class TestVisualizationEngine:
         assert isinstance(fig, go.Figure)
         assert len(fig.layout.annotations) > 0
     
+    def test_create_kpi_2_chart_binned_data(self):
+        """Test that binned points are drawn one mark per bin, sized by count."""
+        data = pd.DataFrame({
+            "study_hours": [1.0, 3.0, 5.0, 7.0],
+            "exam_score": [60.0, 70.0, 80.0, 90.0],
+            "count": [10, 400, 90, 1]
+        })
+        data.attrs["point_count"] = 501
+        fig = VisualizationEngine.create_kpi_2_chart(data)
+        assert len(fig.data[0].x) == 4
+        assert list(fig.data[0].marker.color) == [10, 400, 90, 1]
+        assert "501 students in 4 bins" in fig.layout.title.text
+    
+    def test_create_kpi_1_chart_estimated_data(self, sample_kpi1_data):
+        """Test that estimated averages are drawn with their confidence intervals."""
+        data = sample_kpi1_data.assign(
+            average_score_low=sample_kpi1_data["average_score"] - 1.0,
+            average_score_high=sample_kpi1_data["average_score"] + 2.0
+        )
+        data.attrs["sample_fraction"] = 0.05
+        fig = VisualizationEngine.create_kpi_1_chart(data)
+        assert list(fig.data[0].error_y.arrayminus) == [1.0] * len(data)
+        assert list(fig.data[0].error_y.array) == [2.0] * len(data)
+        assert "5.0% sample" in fig.layout.title.text
+    
+    def test_create_kpi_5_chart(self):
+        """Test creating the score distribution box chart."""
+        data = pd.DataFrame({
+            "group": ["Female", "Male"],
+            "count": [10, 12],
+            "p10": [50.0, 48.0],
+            "p25": [60.0, 58.0],
+            "median": [70.0, 67.0],
+            "p75": [80.0, 77.0],
+            "p90": [90.0, 88.0],
+            "iqr": [20.0, 19.0]
+        })
+        fig = VisualizationEngine.create_kpi_5_chart(data)
+        assert isinstance(fig, go.Figure)
+        assert list(fig.data[0].median) == [70.0, 67.0]
+        assert list(fig.data[0].lowerfence) == [50.0, 48.0]
+    
     def test_create_kpi_3_chart(self, sample_kpi3_data):
         """Test creating KPI 3 chart."""
         fig = VisualizationEngine.create_kpi_3_chart(sample_kpi3_data)